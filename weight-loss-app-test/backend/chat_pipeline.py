@@ -0,0 +1,271 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+from anthropic import AsyncAnthropic
+from data_extraction import ConversationDataExtractor
+from llm_client import MODEL
+from llm_scheduler import LLMScheduler, INTERACTIVE, BACKGROUND
+from conversation_memory import ConversationMemory, SUMMARY_MAX_TOKENS, build_summary_prompt, format_context
+
+logger = logging.getLogger("chat-pipeline")
+
+# How the reply relates to the extraction running alongside it:
+# - "pre_update": reply from the recommendations as they were before extraction
+# - "speculative": start the same reply, but restart it if extraction changes the prompt
+#   (a recommended factor's current value, or the recommendations themselves)
+CHAT_MODES = ("pre_update", "speculative")
+
+def build_chat_prompt(recommendations: List[Dict[str, Any]], message: str, context: str = "") -> str:
+    """Create the coaching prompt for Claude from the current recommendations and, if any, the conversation so far"""
+    # Format recommendations for Claude, with where the user stands on each factor
+    recommendations_text = "\n".join([
+        f"- {rec['factor']}: {rec['direction']} (current: {rec['current_value']:.2f}, impact: {rec['potential']:.2f})"
+        for rec in recommendations
+    ])
+    if context:
+        recommendations_text += f"\n\nConversation so far:\n{context}"
+    
+    return f"""You are a weight management coach. Use the following recommendations from our network model to inform your response, but maintain a natural, conversational tone:
+
+{recommendations_text}
+
+User message: {message}
+
+Respond in a helpful, empathetic way while incorporating relevant recommendations when appropriate."""
+
+class ChatPipeline:
+    """
+    Runs data extraction and reply generation for a chat turn concurrently
+    
+    Each turn costs about one model round trip instead of two. In speculative
+    mode a reply is thrown away only when extraction would change its prompt,
+    i.e. it moved the current value of a recommended factor or reordered the
+    recommendations.
+    """
+    
+    def __init__(self, client: AsyncAnthropic, extractor: Optional[ConversationDataExtractor],
+                 mode: str = "speculative", n: int = 3, scheduler: Optional[LLMScheduler] = None,
+                 memory: Optional[ConversationMemory] = None):
+        """
+        Initialize the pipeline
+        
+        Args:
+            client: Shared async client used for replies
+            extractor: Data extractor, or None to skip extraction
+            mode: Default mode, one of CHAT_MODES
+            n: Number of recommendations given to the model
+            scheduler: Shared limiter that runs replies ahead of queued extraction
+            memory: Server-side history for conversations whose client sends
+                only a conversation id
+        """
+        self.client = client
+        self.extractor = extractor
+        self.mode = self._check_mode(mode)
+        self.n = n
+        self.scheduler = scheduler
+        self.memory = memory
+        # Summaries being written after replies; kept so the tasks are not garbage collected
+        self._background = set()
+        self.speculative_kept = 0
+        self.speculative_restarted = 0
+    
+    @staticmethod
+    def _check_mode(mode: str) -> str:
+        if mode not in CHAT_MODES:
+            raise ValueError(f"Invalid chat mode: {mode} (expected one of {', '.join(CHAT_MODES)})")
+        return mode
+    
+    async def generate_reply(self, prompt: str) -> str:
+        """
+        Get the coach's reply for a prompt
+        
+        Args:
+            prompt: Prompt built by build_chat_prompt
+            
+        Returns:
+            The reply text
+        """
+        def call():
+            return self.client.messages.create(
+                model=MODEL,
+                max_tokens=1000,
+                messages=[{"role": "user", "content": prompt}]
+            )
+        
+        if self.scheduler is not None:
+            completion = await self.scheduler.run(call, INTERACTIVE)
+        else:
+            completion = await call()
+        return completion.content[0].text
+    
+    async def summarize(self, summary: str, messages: List[Dict[str, str]]) -> str:
+        """
+        Fold messages into a conversation's running summary
+        
+        Args:
+            summary: The current summary, or "" if there is none yet
+            messages: Messages to add to it as role/content dicts
+            
+        Returns:
+            The new summary
+        """
+        def call():
+            return self.client.messages.create(
+                model=MODEL,
+                max_tokens=SUMMARY_MAX_TOKENS,
+                messages=[{"role": "user", "content": build_summary_prompt(summary, messages)}]
+            )
+        
+        if self.scheduler is not None:
+            completion = await self.scheduler.run(call, BACKGROUND)
+        else:
+            completion = await call()
+        return completion.content[0].text.strip()
+    
+    async def _update_summary(self, conversation_id: str, pending: Dict[str, Any]):
+        """Write a pending summary, releasing it if the model call fails"""
+        summary = None
+        try:
+            summary = await self.summarize(pending["summary"], pending["messages"])
+        except Exception as e:
+            logger.error(f"Error summarizing conversation: {e}")
+        finally:
+            await asyncio.to_thread(self.memory.set_summary, conversation_id, summary, pending["through"])
+    
+    async def load_context(self, history: Optional[List[Dict[str, str]]],
+                     conversation_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        Get a turn's context from server-side memory
+        
+        Args:
+            history: Earlier messages sent by the client, if any
+            conversation_id: Identifies the conversation
+            
+        Returns:
+            The context from ConversationMemory.context, or None if the client
+            manages the history (it sent one, or there is no id or no memory)
+        """
+        if history is not None or conversation_id is None or self.memory is None:
+            return None
+        # The memory may read a SQLite file, so keep it off the event loop
+        return await asyncio.to_thread(self.memory.context, conversation_id)
+    
+    async def remember(self, conversation_id: str, message: str, reply: str):
+        """
+        Log a finished turn, and start summarizing older messages in the
+        background once they outgrow the token budget
+        
+        Args:
+            conversation_id: Identifies the conversation
+            message: The user's message
+            reply: The coach's reply
+        """
+        await asyncio.to_thread(self.memory.append, conversation_id, [
+            {"role": "user", "content": message},
+            {"role": "assistant", "content": reply}
+        ])
+        pending = await asyncio.to_thread(self.memory.pending_summary, conversation_id)
+        if pending is not None:
+            task = asyncio.ensure_future(self._update_summary(conversation_id, pending))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+    
+    async def extract_and_update(self, history: List[Dict[str, str]], message: str, network,
+                                 conversation_id: Optional[str] = None, offset: int = 0) -> Dict[str, Any]:
+        """
+        Extract data from the conversation and apply it to the user's network
+        
+        Args:
+            history: Earlier messages as role/content dicts
+            message: The new user message
+            network: The user's network
+            conversation_id: Identifies the conversation so only new messages are
+                extracted; without it the whole history is
+            offset: Position of history's first message in the conversation
+            
+        Returns:
+            The extracted data
+        """
+        if conversation_id is not None:
+            extracted_data = await self.extractor.extract_new_data_async(conversation_id, history, message, offset)
+        else:
+            extracted_data = await self.extractor.extract_messages_async(history, message)
+        # Network reads and writes may touch disk (spilled or shared state), so run them off the event loop
+        await asyncio.to_thread(self.extractor.update_network, extracted_data, network)
+        return extracted_data
+    
+    async def run(self, message: str, history: Optional[List[Dict[str, str]]], network,
+                  mode: Optional[str] = None, conversation_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Process one chat turn
+        
+        Args:
+            message: The new user message
+            history: Earlier messages; extraction only runs when there is history.
+                If None and the conversation has an id, it comes from memory
+            network: The user's network
+            mode: One of CHAT_MODES (defaults to the pipeline's mode)
+            conversation_id: Identifies the conversation for incremental
+                extraction and server-side memory
+                
+        Returns:
+            Dict with the reply, the updated recommendations and the extracted data
+            
+        Raises:
+            ValueError: If the mode is not valid
+        """
+        mode = self._check_mode(mode or self.mode)
+        context = await self.load_context(history, conversation_id)
+        offset = 0
+        context_text = ""
+        if context is not None:
+            history, offset = context["messages"], context["offset"]
+            context_text = format_context(context)
+        
+        recommendations = await asyncio.to_thread(network.get_top_recommendations, self.n)
+        prompt = build_chat_prompt(recommendations, message, context_text)
+        
+        if not (self.extractor and history):
+            response_text = await self.generate_reply(prompt)
+            if context is not None:
+                await self.remember(conversation_id, message, response_text)
+            return {
+                "response": response_text,
+                "recommendations": recommendations,
+                "extracted_data": None
+            }
+        
+        reply = asyncio.ensure_future(self.generate_reply(prompt))
+        try:
+            extracted_data = await self.extract_and_update(history, message, network, conversation_id, offset)
+            updated = await asyncio.to_thread(network.get_top_recommendations, self.n)
+            
+            if mode == "speculative":
+                updated_prompt = build_chat_prompt(updated, message, context_text)
+                if updated_prompt != prompt:
+                    # The reply was based on stale values or recommendations; start over from the new ones
+                    reply.cancel()
+                    self.speculative_restarted += 1
+                    logger.info("Recommended factors changed during extraction; restarting the reply")
+                    reply = asyncio.ensure_future(self.generate_reply(updated_prompt))
+                else:
+                    self.speculative_kept += 1
+            
+            response_text = await reply
+        finally:
+            reply.cancel()
+        
+        if context is not None:
+            await self.remember(conversation_id, message, response_text)
+        return {
+            "response": response_text,
+            "recommendations": updated,
+            "extracted_data": extracted_data
+        }
+    
+    def stats(self) -> Dict[str, int]:
+        """Get speculative reply counters for monitoring"""
+        return {
+            "speculative_kept": self.speculative_kept,
+            "speculative_restarted": self.speculative_restarted
+        }
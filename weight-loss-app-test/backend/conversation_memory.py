@@ -0,0 +1,255 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# Tokens of summary plus recent messages given to the model each turn
+DEFAULT_TOKEN_BUDGET = 2000
+
+# Most conversations kept in memory when there is no database; older ones are forgotten
+DEFAULT_CAPACITY = 10000
+
+# Length cap given to the model when it rewrites a summary
+SUMMARY_MAX_TOKENS = 300
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of a text (about four characters per token)"""
+    return len(text) // 4 + 1
+
+def build_summary_prompt(summary: str, messages: List[Dict[str, str]]) -> str:
+    """Create the prompt asking the model to fold messages into a running summary"""
+    conversation = "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+    return f"""You keep a running summary of a conversation between a user and their weight management coach.
+
+Current summary:
+{summary or "(none yet)"}
+
+New messages:
+{conversation}
+
+Rewrite the summary to include the new messages. Keep what matters for coaching: the user's habits, circumstances, goals, struggles and the advice they have been given. Write at most {SUMMARY_MAX_TOKENS * 3 // 4} words of plain prose and reply with the summary only."""
+
+def format_context(context: Dict[str, Any]) -> str:
+    """Render a context from ConversationMemory.context for a prompt"""
+    lines = [f"(Summary of earlier messages: {context['summary']})"] if context["summary"] else []
+    lines += [f"{msg['role']}: {msg['content']}" for msg in context["messages"]]
+    return "\n".join(lines)
+
+class Conversation:
+    """Summary of a conversation and the messages logged after it"""
+    
+    __slots__ = ("summary", "summarized", "messages")
+    
+    def __init__(self, summary: str = "", summarized: int = 0):
+        self.summary = summary
+        # Number of messages folded into the summary; later ones are kept verbatim
+        self.summarized = summarized
+        # (role, content, tokens) of messages summarized onwards
+        self.messages: List[Tuple[str, str, int]] = []
+
+class ConversationMemory:
+    """
+    Server-side conversation history with a rolling summary
+    
+    Messages are appended to a log, and once those not yet summarized outgrow
+    the token budget the oldest of them are folded into a summary by the
+    model. Each turn's prompt context is the summary plus as many of the most
+    recent messages as fit the budget, so its size stays bounded however long
+    the conversation runs. Without a path, conversations are kept in memory.
+    With one, the log and summaries live in a SQLite file shared by all
+    workers, and each call loads only the unsummarized tail of a conversation.
+    """
+    
+    def __init__(self, token_budget: int = DEFAULT_TOKEN_BUDGET, capacity: int = DEFAULT_CAPACITY,
+                 path: Optional[str] = None, timeout: float = 10.0):
+        """
+        Initialize the memory
+        
+        Args:
+            token_budget: Tokens of summary plus recent messages in each turn's context
+            capacity: Conversations kept in memory, in least recently used order,
+                when there is no path
+            path: Optional SQLite file holding the log and summaries
+            timeout: Seconds to wait for another worker's write lock on the file
+        """
+        self.token_budget = token_budget
+        self.capacity = capacity
+        self.path = path
+        self.timeout = timeout
+        self._conversations = OrderedDict()
+        # Conversations with a summary being written by this worker
+        self._summarizing = set()
+        self._local = threading.local()
+        
+        self.appended = 0
+        self.summaries = 0
+        self.loads = 0
+        
+        if path:
+            connection = self._connection()
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS conversation_messages ("
+                "conversation TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, "
+                "content TEXT NOT NULL, tokens INTEGER NOT NULL, PRIMARY KEY (conversation, seq))"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS conversation_summaries ("
+                "conversation TEXT PRIMARY KEY, summary TEXT NOT NULL, summarized INTEGER NOT NULL)"
+            )
+    
+    def _connection(self) -> sqlite3.Connection:
+        """Get this thread's connection to the log, opening it on first use"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+    
+    def _get(self, conversation_id: str) -> Conversation:
+        """Get a conversation's summary and unsummarized messages"""
+        if self.path:
+            connection = self._connection()
+            row = connection.execute(
+                "SELECT summary, summarized FROM conversation_summaries WHERE conversation = ?",
+                (conversation_id,)
+            ).fetchone()
+            conversation = Conversation(*row) if row is not None else Conversation()
+            conversation.messages = [tuple(message) for message in connection.execute(
+                "SELECT role, content, tokens FROM conversation_messages "
+                "WHERE conversation = ? AND seq >= ? ORDER BY seq",
+                (conversation_id, conversation.summarized)
+            )]
+            self.loads += 1
+            return conversation
+        
+        conversation = self._conversations.pop(conversation_id, None)
+        if conversation is None:
+            conversation = Conversation()
+        self._conversations[conversation_id] = conversation
+        while len(self._conversations) > self.capacity:
+            self._conversations.popitem(last=False)
+        return conversation
+    
+    def append(self, conversation_id: str, messages: List[Dict[str, str]]) -> None:
+        """
+        Log messages at the end of a conversation
+        
+        Args:
+            conversation_id: Identifies the conversation
+            messages: Role/content dicts, oldest first
+        """
+        rows = [(msg["role"], msg["content"], estimate_tokens(msg["content"])) for msg in messages]
+        self.appended += len(rows)
+        if not self.path:
+            self._get(conversation_id).messages.extend(rows)
+            return
+        
+        # Number the messages inside a write transaction, so workers appending at once do not collide
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            seq = connection.execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM conversation_messages WHERE conversation = ?",
+                (conversation_id,)
+            ).fetchone()[0]
+            connection.executemany(
+                "INSERT INTO conversation_messages (conversation, seq, role, content, tokens) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(conversation_id, seq + i, *row) for i, row in enumerate(rows)]
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+    
+    def context(self, conversation_id: str) -> Dict[str, Any]:
+        """
+        Assemble a conversation's context within the token budget
+        
+        Args:
+            conversation_id: Identifies the conversation
+            
+        Returns:
+            Dict with the "summary", the most recent "messages" that fit the
+            budget left by it, and the "offset" of the first of those in the
+            whole conversation
+        """
+        conversation = self._get(conversation_id)
+        budget = self.token_budget - (estimate_tokens(conversation.summary) if conversation.summary else 0)
+        start = len(conversation.messages)
+        while start > 0 and conversation.messages[start - 1][2] <= budget:
+            start -= 1
+            budget -= conversation.messages[start][2]
+        return {
+            "summary": conversation.summary,
+            "messages": [{"role": role, "content": content} for role, content, _ in conversation.messages[start:]],
+            "offset": conversation.summarized + start
+        }
+    
+    def pending_summary(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Claim the messages due to be folded into the summary, if any
+        
+        Summarizing starts once the unsummarized messages outgrow the budget,
+        and folds the oldest of them until the rest fit in half of it. Only one
+        summary per conversation is pending at a time; finish it with
+        set_summary, or release it with set_summary(..., None) on failure.
+        
+        Args:
+            conversation_id: Identifies the conversation
+            
+        Returns:
+            Dict with the current "summary", the "messages" to fold into it and
+            "through", the number of messages summarized afterwards; or None
+        """
+        conversation = self._get(conversation_id)
+        tokens = sum(message[2] for message in conversation.messages)
+        if conversation_id in self._summarizing or tokens <= self.token_budget:
+            return None
+        
+        count = 0
+        while tokens > self.token_budget // 2 and count < len(conversation.messages):
+            tokens -= conversation.messages[count][2]
+            count += 1
+        self._summarizing.add(conversation_id)
+        return {
+            "summary": conversation.summary,
+            "messages": [{"role": role, "content": content} for role, content, _ in conversation.messages[:count]],
+            "through": conversation.summarized + count
+        }
+    
+    def set_summary(self, conversation_id: str, summary: Optional[str], through: int) -> None:
+        """
+        Replace a conversation's summary
+        
+        Args:
+            conversation_id: Identifies the conversation
+            summary: The new summary, or None to give up the pending one
+            through: Number of messages the summary covers
+        """
+        self._summarizing.discard(conversation_id)
+        if summary is None:
+            return
+        conversation = self._get(conversation_id)
+        if through <= conversation.summarized:
+            return
+        del conversation.messages[:through - conversation.summarized]
+        conversation.summary = summary
+        conversation.summarized = through
+        if self.path:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO conversation_summaries (conversation, summary, summarized) VALUES (?, ?, ?)",
+                (conversation_id, summary, through)
+            )
+        self.summaries += 1
+    
+    def stats(self) -> Dict[str, int]:
+        """Get memory counters for monitoring"""
+        return {
+            "conversations": len(self._conversations),
+            "messages_appended": self.appended,
+            "summaries": self.summaries,
+            "loads": self.loads
+        }
@@ -1,8 +1,15 @@
-import json
+import os
+import copy
 import logging
+from collections import OrderedDict
 from typing import Dict, List, Any, Optional
-from anthropic import Anthropic
+from anthropic import Anthropic, AsyncAnthropic
 from simplified_obesity_network import SimpleObesityNetwork
+from llm_client import MODEL, create_client, create_async_client
+from extraction_cache import ExtractionCache, cache_key
+from singleflight import SingleFlight
+from factor_classifier import FactorClassifier, RULE_CONFIDENCE
+from llm_scheduler import LLMScheduler, BACKGROUND
 
 # Configure logging
 logging.basicConfig(
@@ -12,26 +19,83 @@ logging.basicConfig(
 
 logger = logging.getLogger("data-extraction")
 
+# Conversations whose extraction state is kept; the least recently used are dropped
+EXTRACTION_STATE_CAPACITY = int(os.environ.get("EXTRACTION_STATE_CAPACITY", 10000))
+
+def format_conversation(history: List[Dict[str, str]], message: Optional[str] = None) -> str:
+    """Combine conversation messages, and optionally a new user message, into a single string"""
+    conversation = "\n".join([
+        f"{msg.get('role', 'user')}: {msg.get('content', '')}"
+        for msg in history
+    ])
+    if message is not None:
+        conversation += f"\nuser: {message}"
+    return conversation
+
+class ExtractionState:
+    """
+    What has already been extracted from one conversation
+    
+    Attributes:
+        factors: Latest extracted value of every factor seen so far
+        processed: Number of history messages already sent for extraction
+    """
+    
+    __slots__ = ("factors", "processed")
+    
+    def __init__(self):
+        self.factors = {}
+        self.processed = 0
+    
+    def summary(self) -> str:
+        """Compact one-line summary of prior findings for the prompt"""
+        return ", ".join(f"{factor}={value:.2f}" for factor, value in self.factors.items())
+
 class ConversationDataExtractor:
     """
     Extract structured data from conversations using Claude's function calling
     """
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, client: Optional[AsyncAnthropic] = None,
+                 cache: Optional[ExtractionCache] = None, classifier: Optional[FactorClassifier] = None,
+                 scheduler: Optional[LLMScheduler] = None):
         """
         Initialize the data extractor
         
         Args:
             api_key: Anthropic API key
+            client: Shared async client (a new pooled client is created if omitted)
+            cache: Cache of extraction results, so repeated text skips the model
+            classifier: Local pre-classifier that skips the model for small talk
+                and messages made only of explicit statements
+            scheduler: Shared limiter that queues extraction calls behind chat replies
         """
-        self.anthropic = Anthropic(api_key=api_key)
+        self.api_key = api_key
+        self._anthropic = None
+        self.async_client = client if client is not None else create_async_client(api_key)
+        self.cache = cache
+        self.classifier = classifier
+        self.scheduler = scheduler
+        # Concurrent extractions of the same text share one model call
+        self.flight = SingleFlight()
         self.network = SimpleObesityNetwork()
+        # Factors the model says improve by going down, so their values are read as levels
+        lower_is_better = [
+            factor for factor, attrs in self.network.factors.items()
+            if attrs["direction"] == "decrease" and factor != self.network.model.target
+        ]
+        self.scale_note = f"For {', '.join(lower_is_better)}, remember that lower values are better." if lower_is_better else ""
+        
+        # Per-conversation extraction state, in least recently used order
+        self.states = OrderedDict()
+        self.messages_extracted = 0
+        self.messages_skipped = 0
         
-        # Define the function schema for Claude
-        self.function_schema = {
+        # Define the tool schema for Claude
+        self.tool_schema = {
             "name": "extract_factors",
             "description": "Extract factors and their values from a conversation",
-            "parameters": {
+            "input_schema": {
                 "type": "object",
                 "properties": {
                     "factors": {
@@ -54,83 +118,295 @@ class ConversationDataExtractor:
             }
         }
     
-    def extract_data(self, conversation: str) -> Dict[str, Any]:
+    @property
+    def anthropic(self) -> Anthropic:
+        """Blocking client for extract_data, created on first use"""
+        if self._anthropic is None:
+            self._anthropic = create_client(self.api_key)
+        return self._anthropic
+    
+    def _request(self, conversation: str, summary: str = "") -> Dict[str, Any]:
         """
-        Extract structured data from a conversation
+        Build the extraction request for a conversation
         
         Args:
             conversation: The conversation text
+            summary: Factors already extracted from earlier messages, if any
             
         Returns:
-            Dict containing extracted factors and confidence
+            Keyword arguments for messages.create
         """
-        try:
-            # Create the prompt for Claude
-            prompt = f"""
-            Extract any mentioned factors and their values from this conversation. 
-            For each factor, estimate its value on a scale of 0-1, where:
-            - 0 represents the worst possible state
-            - 1 represents the best possible state
-            
-            For stress_level, remember that lower values are better.
-            
-            Conversation:
-            {conversation}
+        # Create the prompt for Claude
+        prompt = f"""
+        Extract any mentioned factors and their values from this conversation. 
+        For each factor, estimate its value on a scale of 0-1, where:
+        - 0 represents the worst possible state
+        - 1 represents the best possible state
+        
+        {self.scale_note}
+        
+        Conversation:
+        {conversation}
+        
+        Return the data in the format specified by the tool schema.
+        """
+        if summary:
+            prompt += f"""
+            The messages above continue an earlier conversation, from which these values were already extracted:
+            {summary}
             
-            Return the data in the format specified by the function schema.
+            Only return factors that the messages above mention, including earlier factors they change.
             """
+        
+        return {
+            "model": MODEL,
+            "max_tokens": 1000,
+            "messages": [{"role": "user", "content": prompt}],
+            "tools": [self.tool_schema],
+            "tool_choice": {"type": "tool", "name": "extract_factors"}
+        }
+    
+    def _parse_response(self, response) -> Optional[Dict[str, Any]]:
+        """
+        Read the extracted data from Claude's tool call
+        
+        Args:
+            response: Message returned by messages.create
             
-            # Call Claude with function calling
-            response = self.anthropic.messages.create(
-                model="claude-3-sonnet-20240229",
-                max_tokens=1000,
-                messages=[{"role": "user", "content": prompt}],
-                tools=[{"type": "function", "function": self.function_schema}]
-            )
+        Returns:
+            Dict containing extracted factors and confidence, or None if the
+            response has no extract_factors call
+        """
+        # Find the tool call in the response
+        tool_calls = [block for block in response.content if block.type == "tool_use"]
+        if not tool_calls:
+            logger.warning("No tool calls returned from Claude")
+            return None
+        
+        tool_call = tool_calls[0]
+        if tool_call.name != "extract_factors":
+            logger.warning(f"Unexpected tool name: {tool_call.name}")
+            return None
+        
+        # The arguments arrive already parsed
+        args = tool_call.input
+        logger.info(f"Extracted data: {args}")
+        
+        return args
+    
+    def _cache_key(self, conversation: str, summary: str = "") -> str:
+        """Content address of an extraction request"""
+        return cache_key(conversation, MODEL, self.tool_schema, f"{self.scale_note}\n{summary}")
+    
+    def extract_data(self, conversation: str) -> Dict[str, Any]:
+        """
+        Extract structured data from a conversation
+        
+        Args:
+            conversation: The conversation text
             
-            # Extract the function call result
-            tool_calls = response.content[0].tool_calls
-            if not tool_calls:
-                logger.warning("No function calls returned from Claude")
-                return {"factors": {}, "confidence": 0.5}
+        Returns:
+            Dict containing extracted factors and confidence
+        """
+        key = self._cache_key(conversation)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        
+        try:
+            response = self.anthropic.messages.create(**self._request(conversation))
+            extracted_data = self._parse_response(response)
+            if extracted_data is None:
+                raise ValueError("No extraction in the model's response")
+        except Exception as e:
+            # Failures are not cached, so the next request tries the model again
+            logger.error(f"Error extracting data: {e}")
+            return {"factors": {}, "confidence": 0.5}
+        
+        if self.cache is not None:
+            self.cache.put(key, extracted_data)
+        return extracted_data
+    
+    async def _extract_async(self, conversation: str, summary: str = "") -> Dict[str, Any]:
+        """
+        Extract data through the cache and the async client, joining any
+        identical extraction already in flight
+        
+        Args:
+            conversation: The conversation text
+            summary: Factors already extracted from earlier messages, if any
             
-            # Parse the function call arguments
-            function_call = tool_calls[0]
-            if function_call.function.name != "extract_factors":
-                logger.warning(f"Unexpected function name: {function_call.function.name}")
-                return {"factors": {}, "confidence": 0.5}
+        Returns:
+            Dict containing extracted factors and confidence
             
-            # Parse the arguments
-            args = json.loads(function_call.function.arguments)
-            logger.info(f"Extracted data: {args}")
+        Raises:
+            Exception: Any error from the model call, or ValueError if its
+                response has no extraction
+        """
+        key = self._cache_key(conversation, summary)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        
+        async def call():
+            request = self._request(conversation, summary)
+            if self.scheduler is not None:
+                response = await self.scheduler.run(
+                    lambda: self.async_client.messages.create(**request), BACKGROUND
+                )
+            else:
+                response = await self.async_client.messages.create(**request)
+            extracted_data = self._parse_response(response)
+            # A response without an extraction fails like an error, so it is not cached
+            if extracted_data is None:
+                raise ValueError("No extraction in the model's response")
+            if self.cache is not None:
+                self.cache.put(key, extracted_data)
+            return extracted_data
+        
+        # Callers sharing a call each get their own copy of the result
+        return copy.deepcopy(await self.flight.do(key, call))
+    
+    async def extract_data_async(self, conversation: str) -> Dict[str, Any]:
+        """
+        Extract structured data from a conversation without blocking the event loop
+        
+        Args:
+            conversation: The conversation text
             
-            return args
+        Returns:
+            Dict containing extracted factors and confidence
+        """
+        try:
+            return await self._extract_async(conversation)
         except Exception as e:
             logger.error(f"Error extracting data: {e}")
             return {"factors": {}, "confidence": 0.5}
     
-    def update_network(self, extracted_data: Dict[str, Any]) -> bool:
+    def _fast_path(self, messages: List[Dict[str, str]], message: str) -> Optional[Dict[str, Any]]:
+        """
+        Extract data from the user's messages locally, if they need no model call
+        
+        Args:
+            messages: Messages to be extracted as role/content dicts
+            message: The new user message
+            
+        Returns:
+            Dict containing extracted factors and confidence, or None if the
+            model is needed
+        """
+        if self.classifier is None:
+            return None
+        user_text = "\n".join(
+            [msg.get("content", "") for msg in messages if msg.get("role", "user") == "user"] + [message]
+        )
+        result = self.classifier.classify(user_text)
+        if result["needs_extraction"]:
+            return None
+        return {"factors": result["factors"], "confidence": RULE_CONFIDENCE}
+    
+    async def extract_messages_async(self, history: List[Dict[str, str]], message: str) -> Dict[str, Any]:
+        """
+        Extract data from a whole conversation, skipping the model when the
+        user's messages are small talk or explicit statements
+        
+        Args:
+            history: Earlier messages as role/content dicts
+            message: The new user message
+            
+        Returns:
+            Dict containing extracted factors and confidence
+        """
+        extracted_data = self._fast_path(history, message)
+        if extracted_data is not None:
+            return extracted_data
+        return await self.extract_data_async(format_conversation(history, message))
+    
+    async def extract_new_data_async(self, conversation_id: str, history: List[Dict[str, str]],
+                                     message: str, offset: int = 0) -> Dict[str, Any]:
+        """
+        Extract data from only the messages of a conversation not yet processed
+        
+        The model is sent the new messages plus a one-line summary of earlier
+        findings, so the cost of a turn stays flat as the conversation grows.
+        If the history is shorter than what was already processed (e.g. the
+        conversation was restarted), the conversation is extracted afresh.
+        
+        Args:
+            conversation_id: Identifies the conversation across turns
+            history: Earlier messages as role/content dicts
+            message: The new user message
+            offset: Position of history's first message in the conversation, when
+                history is only its most recent part (e.g. from ConversationMemory)
+                
+        Returns:
+            Dict containing the factors extracted from the new messages and confidence
+        """
+        state = self.states.pop(conversation_id, None)
+        if state is None or state.processed > offset + len(history):
+            state = ExtractionState()
+        self.states[conversation_id] = state
+        while len(self.states) > EXTRACTION_STATE_CAPACITY:
+            self.states.popitem(last=False)
+        
+        new_messages = history[max(state.processed - offset, 0):]
+        self.messages_skipped += state.processed
+        self.messages_extracted += len(new_messages) + 1
+        
+        extracted_data = self._fast_path(new_messages, message)
+        if extracted_data is None:
+            try:
+                extracted_data = await self._extract_async(
+                    format_conversation(new_messages, message), state.summary()
+                )
+            except Exception as e:
+                logger.error(f"Error extracting data: {e}")
+                return {"factors": {}, "confidence": 0.5}
+        
+        # The new message will be part of the next turn's history
+        state.factors.update(extracted_data.get("factors", {}))
+        state.processed = offset + len(history) + 1
+        return extracted_data
+    
+    def stats(self) -> Dict[str, int]:
+        """Get incremental extraction counters for monitoring"""
+        return {
+            "conversations": len(self.states),
+            "messages_extracted": self.messages_extracted,
+            "messages_skipped": self.messages_skipped
+        }
+    
+    def update_network(self, extracted_data: Dict[str, Any], network=None) -> bool:
         """
         Update the network model with extracted data
         
         Args:
             extracted_data: Dict containing extracted factors and confidence
+            network: Network to update (defaults to the extractor's own network)
             
         Returns:
             bool: True if update was successful
         """
         try:
+            network = network if network is not None else self.network
             factors = extracted_data.get("factors", {})
             confidence = extracted_data.get("confidence", 0.7)
+            known_factors = network.factors
             
-            # Update each factor
+            updates = []
             for factor, value in factors.items():
-                if factor in self.network.factors:
-                    self.network.update_factor(factor, value, confidence)
-                    logger.info(f"Updated factor {factor} with value {value} and confidence {confidence}")
+                if factor in known_factors:
+                    updates.append({"factor": factor, "value": value, "confidence": confidence})
                 else:
                     logger.warning(f"Unknown factor: {factor}")
             
+            # One batch, so a stored user's state is loaded and written once
+            if updates:
+                network.apply_updates({"factors": updates})
+                logger.info(f"Updated factors {', '.join(u['factor'] for u in updates)} with confidence {confidence}")
+            
             return True
         except Exception as e:
             logger.error(f"Error updating network: {e}")
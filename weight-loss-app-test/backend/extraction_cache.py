@@ -0,0 +1,178 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+# Default memory budget and entry lifetime
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL = 24 * 3600
+
+# Approximate bookkeeping cost of one in-memory entry, on top of its key and value
+ENTRY_OVERHEAD = 200
+
+def normalize_text(text: str) -> str:
+    """Normalize text so formatting-only differences hit the same cache entry"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+def cache_key(conversation: str, model: str, schema: Dict[str, Any], context: str = "") -> str:
+    """
+    Content address of an extraction request
+    
+    Args:
+        conversation: The conversation text
+        model: Model name
+        schema: Tool schema the model is asked to fill
+        context: Any other prompt input, such as a summary of earlier findings
+        
+    Returns:
+        Hex SHA-256 digest
+    """
+    digest = hashlib.sha256()
+    for part in (normalize_text(conversation), model, json.dumps(schema, sort_keys=True), normalize_text(context)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class ExtractionCache:
+    """
+    Extraction results keyed by cache_key, with a TTL
+    
+    Results are kept in memory in least recently used order, up to a byte
+    budget. With a path, they are also written to a SQLite file, which is
+    consulted on memory misses and survives restarts.
+    """
+    
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, ttl: float = DEFAULT_TTL,
+                 path: Optional[str] = None, clock: Callable[[], float] = time.time):
+        """
+        Initialize the cache
+        
+        Args:
+            max_bytes: Memory budget for cached entries
+            ttl: Seconds an entry stays valid
+            path: Optional SQLite file for the on-disk tier
+            clock: Source of the current time in seconds since the epoch
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.path = path
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        
+        if path:
+            connection = self._connection()
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS extraction_cache ("
+                "key TEXT PRIMARY KEY, expires REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS extraction_cache_expires ON extraction_cache (expires)"
+            )
+    
+    def _connection(self) -> sqlite3.Connection:
+        """Get this thread's connection to the on-disk tier, opening it on first use"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+    
+    def _remember(self, key: str, expires: float, value: str):
+        """Insert an entry into the memory tier, evicting least recently used ones over budget"""
+        size = len(key.encode()) + len(value.encode()) + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (expires, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a result
+        
+        Args:
+            key: Key from cache_key
+            
+        Returns:
+            A fresh copy of the cached result, or None on a miss
+        """
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(entry[2])
+                del self._entries[key]
+                self._bytes -= entry[1]
+                self.expired += 1
+        
+        if self.path:
+            row = self._connection().execute(
+                "SELECT expires, value FROM extraction_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[0] > now:
+                self._remember(key, row[0], row[1])
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                return json.loads(row[1])
+        
+        with self._lock:
+            self.misses += 1
+        return None
+    
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        """
+        Store a result
+        
+        Args:
+            key: Key from cache_key
+            value: JSON-serializable extraction result
+        """
+        expires = self.clock() + self.ttl
+        serialized = json.dumps(value)
+        self._remember(key, expires, serialized)
+        if self.path:
+            connection = self._connection()
+            connection.execute(
+                "INSERT OR REPLACE INTO extraction_cache (key, expires, value) VALUES (?, ?, ?)",
+                (key, expires, serialized)
+            )
+            connection.execute("DELETE FROM extraction_cache WHERE expires <= ?", (self.clock(),))
+    
+    def stats(self) -> Dict[str, int]:
+        """Get cache counters for monitoring"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes
+            }
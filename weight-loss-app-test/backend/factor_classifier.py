@@ -0,0 +1,177 @@
+import re
+from typing import Any, Dict, Iterable, List
+from simplified_obesity_network import SimpleObesityNetwork
+from observation_ingest import sleep_score, steps_score
+
+# Confidence given to values read directly from explicit statements
+RULE_CONFIDENCE = 0.8
+
+# Exercise sessions per week that score 1.0 for physical_activity
+ACTIVE_SESSIONS_TARGET = 5
+
+# Words besides the factor's own name that signal it is being talked about
+FACTOR_KEYWORDS = {
+    "caloric_intake": r"eat\w*|ate|calori\w*|food|snack\w*|portion\w*|overeat\w*|binge\w*|diet\w*|sugar\w*|junk|dessert\w*|drink\w*|alcohol|beer|wine|soda",
+    "physical_activity": r"exercis\w*|work(?:ing|ed)? ?out\w*|gym|walk\w*|run\w*|jog\w*|steps|swim\w*|bik\w*|cycl\w*|yoga|train\w*|sport\w*|active|sedentary|lift\w*|hik\w*",
+    "sleep_quality": r"sleep\w*|slept|insomnia|nap\w*|tired|exhausted|bed|bedtime|rested|restless|restful|awake|wake|woke",
+    "stress_level": r"stress\w*|anxi\w*|overwhelm\w*|pressure|worr\w*|burn(?:ed|t)? ?out|tense|nervous|calm|relax\w*",
+    "meal_timing": r"breakfast|lunch|dinner|supper|skip\w* meals?|late[- ]night|midnight|fasting|meal times?|schedule",
+    "metabolism": r"metabol\w*|thyroid",
+    "hunger_hormones": r"hungry|hunger|crav\w*|appetite|(?:feel\w*|felt) full|stuffed|satiet\w*|starv\w*",
+    "weight": r"weigh\w*|pounds?|lbs?|kilos?|kgs?|bmi|gain\w*|lost (?:some |a lot of )?weight|los(?:e|ing) weight|fat",
+    "food_environment": r"grocer\w*|fast food|take ?out|takeaway|delivery|kitchen|cook\w*|restaurant\w*|vending|fridge|pantry",
+    "social_support": r"friend\w*|family|partner|spouse|husband|wife|support\w*|alone|lonely|coach|buddy",
+}
+
+# Whole messages made only of these are pleasantries and acknowledgements, the
+# only messages that skip extraction without an explicit statement
+SMALL_TALK = re.compile(
+    r"^(?:\W*\b(?:hi|hello|hey|thanks|thank you|thx|ok|okay|sure|yes|yeah|yep|no|nope|cool|great|nice|"
+    r"awesome|perfect|got it|sounds good|will do|bye|goodbye|see you|good (?:morning|afternoon|evening|night)|"
+    r"what(?:'s| is)? next)\b)+\W*$"
+)
+
+NUMBER_WORDS = {"once": 1, "twice": 2, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7}
+
+_NUMBER = r"(\d+(?:\.\d+)?|one|two|three|four|five|six|seven|eight|nine|ten)"
+_WORD_VALUES = {"eight": 8, "nine": 9, "ten": 10, **NUMBER_WORDS}
+
+# Statements explicit enough to turn into factor values without the model
+SLEEP_HOURS = [
+    re.compile(r"\b(?:sleep\w*|slept)\b[^.!?\d]{0,25}?" + _NUMBER + r"\s*(?:hours?|hrs?|h)\b"),
+    re.compile(_NUMBER + r"\s*(?:hours?|hrs?|h)\s+(?:of\s+)?sleep\b"),
+]
+STEPS = re.compile(r"(\d[\d,]*)\s*steps\b")
+EXERCISE_FREQUENCY = re.compile(
+    r"\b(?:exercis\w*|work(?:ing|ed)? ?out\w*|gym|run\w*|jog\w*|walk\w*|swim\w*|train\w*)\b[^.!?]{0,25}?"
+    r"\b(once|twice|(?:\d+|one|two|three|four|five|six|seven) times|every day|daily)"
+    r"(?:\s+(?:a|per|each)\s+(week|day))?"
+)
+STRESS_RATING = re.compile(r"\bstress\w*\b[^.!?\d]{0,20}?(\d+(?:\.\d+)?)\s*(?:/|out of)\s*10\b")
+
+# Words that can flip the meaning of an explicit statement; the model handles these
+NEGATION = re.compile(r"\b(?:not|no|never|don'?t|didn'?t|doesn'?t|can'?t|cannot|couldn'?t|won'?t|without|barely|hardly)\b")
+
+def _number(token: str) -> float:
+    return float(_WORD_VALUES.get(token, token))
+
+class FactorClassifier:
+    """
+    Cheap local pass that decides whether a message needs model extraction
+    
+    Pleasantries and acknowledgements ("thanks!", "ok") need no extraction. A
+    message whose every mention is an explicit statement (e.g. "I sleep 6
+    hours", "I run twice a week") is turned into factor values directly.
+    Anything else is left to the model, including messages that match no
+    factor keyword, since the keyword lists cannot name every food or habit.
+    """
+    
+    def __init__(self, factor_names: Iterable[str] = None):
+        """
+        Initialize the classifier
+        
+        Args:
+            factor_names: Factors to look for (defaults to the network's factors)
+        """
+        if factor_names is None:
+            factor_names = SimpleObesityNetwork().factors.keys()
+        self.patterns = {}
+        for factor in factor_names:
+            name = factor.replace("_", " ")
+            keywords = FACTOR_KEYWORDS.get(factor)
+            alternatives = re.escape(name) + (f"|{keywords}" if keywords else "")
+            self.patterns[factor] = re.compile(rf"\b(?:{alternatives})\b")
+        
+        self.classified = 0
+        self.small_talk = 0
+        self.rule_extracted = 0
+        self.model_extracted = 0
+    
+    def mentioned_factors(self, text: str) -> List[str]:
+        """
+        Find the factors a text talks about
+        
+        Args:
+            text: Message text
+            
+        Returns:
+            Names of the factors whose vocabulary appears in the text
+        """
+        text = text.lower()
+        return [factor for factor, pattern in self.patterns.items() if pattern.search(text)]
+    
+    def explicit_values(self, text: str) -> Dict[str, float]:
+        """
+        Read factor values from explicit numeric statements
+        
+        Args:
+            text: Message text
+            
+        Returns:
+            Map of factor names to values (0-1 scale)
+        """
+        text = text.lower()
+        values = {}
+        
+        for pattern in SLEEP_HOURS:
+            match = pattern.search(text)
+            if match:
+                values["sleep_quality"] = sleep_score(_number(match.group(1)))
+                break
+        
+        match = STEPS.search(text)
+        if match:
+            values["physical_activity"] = steps_score(float(match.group(1).replace(",", "")))
+        else:
+            match = EXERCISE_FREQUENCY.search(text)
+            if match:
+                frequency, period = match.group(1), match.group(2)
+                if frequency in ("every day", "daily"):
+                    sessions = 7
+                else:
+                    sessions = _number(frequency.split()[0])
+                    if period == "day":
+                        sessions *= 7
+                values["physical_activity"] = min(sessions / ACTIVE_SESSIONS_TARGET, 1.0)
+        
+        match = STRESS_RATING.search(text)
+        if match:
+            values["stress_level"] = min(float(match.group(1)) / 10, 1.0)
+        
+        return {factor: value for factor, value in values.items() if factor in self.patterns}
+    
+    def classify(self, text: str) -> Dict[str, Any]:
+        """
+        Decide whether a text needs model extraction
+        
+        Args:
+            text: The user's message text
+            
+        Returns:
+            Dict with "needs_extraction", and "factors" holding values read
+            directly from the text when no extraction is needed
+        """
+        self.classified += 1
+        if SMALL_TALK.match(text.lower()):
+            self.small_talk += 1
+            return {"needs_extraction": False, "factors": {}}
+        
+        mentioned = self.mentioned_factors(text)
+        if mentioned and not NEGATION.search(text.lower()):
+            values = self.explicit_values(text)
+            if values and set(mentioned) <= set(values):
+                self.rule_extracted += 1
+                return {"needs_extraction": False, "factors": values}
+        
+        self.model_extracted += 1
+        return {"needs_extraction": True, "factors": {}}
+    
+    def stats(self) -> Dict[str, int]:
+        """Get fast path counters for monitoring"""
+        return {
+            "classified": self.classified,
+            "small_talk": self.small_talk,
+            "rule_extracted": self.rule_extracted,
+            "model_extracted": self.model_extracted,
+            "fast_path": self.small_talk + self.rule_extracted
+        }
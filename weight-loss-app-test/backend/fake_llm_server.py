@@ -0,0 +1,172 @@
+import os
+import json
+import math
+import random
+import asyncio
+import hashlib
+import logging
+import uvicorn
+from typing import Any, Dict, List
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from factor_classifier import FactorClassifier
+
+# Stand-in for the Anthropic messages API, for load tests and offline development.
+# Point the backend at it with ANTHROPIC_BASE_URL=http://localhost:8100 (any API key works).
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+
+logger = logging.getLogger("fake-llm-server")
+
+# Latency to the first token is log-normal around the median; later tokens follow at a steady pace
+LATENCY_MEDIAN_MS = float(os.environ.get("FAKE_LLM_LATENCY_MS", 800))
+LATENCY_SIGMA = float(os.environ.get("FAKE_LLM_LATENCY_SIGMA", 0.5))
+TOKEN_INTERVAL_MS = float(os.environ.get("FAKE_LLM_TOKEN_MS", 15))
+# Fraction of requests answered with a 429 (or 529 when FAKE_LLM_ERROR_STATUS=529)
+ERROR_RATE = float(os.environ.get("FAKE_LLM_ERROR_RATE", 0))
+ERROR_STATUS = int(os.environ.get("FAKE_LLM_ERROR_STATUS", 429))
+PORT = int(os.environ.get("FAKE_LLM_PORT", 8100))
+
+REPLY_SENTENCES = [
+    "Thanks for sharing that with me.",
+    "Small, consistent changes tend to add up over time.",
+    "Based on your network model, the area with the most leverage right now is worth focusing on first.",
+    "Try setting one concrete goal for this week that you feel confident about.",
+    "It can help to notice what triggers the habits you want to change.",
+    "Getting enough sleep makes it easier to manage hunger and cravings.",
+    "Even a short walk after meals can make a difference.",
+    "How does that sound to you?",
+]
+
+ERROR_TYPES = {429: "rate_limit_error", 529: "overloaded_error", 500: "api_error"}
+
+app = FastAPI(title="Fake LLM Server", description="Local stand-in for the Anthropic messages API")
+
+classifier = FactorClassifier()
+stats = {"requests": 0, "tool_calls": 0, "streams": 0, "errors": 0}
+
+def sample_latency() -> float:
+    """Seconds before the first token of a response"""
+    return LATENCY_MEDIAN_MS / 1000 * math.exp(random.gauss(0, LATENCY_SIGMA))
+
+def prompt_text(body: Dict[str, Any]) -> str:
+    """Text of the last user message in a messages API request"""
+    content = body["messages"][-1]["content"]
+    if isinstance(content, list):
+        return " ".join(block.get("text", "") for block in content if block.get("type") == "text")
+    return content
+
+def seeded_random(text: str) -> random.Random:
+    """Random generator seeded by a prompt, so the same prompt gets the same answer"""
+    return random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+
+def extract_factors(prompt: str) -> Dict[str, Any]:
+    """Tool input like the extractor's: values for the factors the conversation mentions"""
+    conversation = prompt
+    if "Conversation:" in prompt:
+        conversation = prompt.split("Conversation:", 1)[1].split("Return the data", 1)[0]
+    rng = seeded_random(prompt)
+    factors = {factor: round(rng.uniform(0.1, 0.9), 2) for factor in classifier.mentioned_factors(conversation)}
+    return {"factors": factors, "confidence": round(rng.uniform(0.6, 0.95), 2)}
+
+def reply_text(prompt: str, max_tokens: int) -> str:
+    """A plausible coaching reply of a few sentences"""
+    rng = seeded_random(prompt)
+    text = " ".join(rng.sample(REPLY_SENTENCES, 4))
+    # Roughly four characters per token
+    return text[:max_tokens * 4]
+
+def split_tokens(text: str) -> List[str]:
+    """Split text into token-like pieces, keeping the spaces"""
+    words = text.split(" ")
+    return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+def usage(prompt: str, output: str) -> Dict[str, int]:
+    """Token counts for a response, estimated at four characters per token"""
+    return {"input_tokens": len(prompt) // 4 + 1, "output_tokens": len(output) // 4 + 1}
+
+def message(body: Dict[str, Any], content: List[Dict[str, Any]], stop_reason: str,
+            token_usage: Dict[str, int]) -> Dict[str, Any]:
+    """A messages API response"""
+    return {
+        "id": f"msg_fake_{random.getrandbits(48):012x}",
+        "type": "message",
+        "role": "assistant",
+        "model": body.get("model", "fake"),
+        "content": content,
+        "stop_reason": stop_reason,
+        "stop_sequence": None,
+        "usage": token_usage
+    }
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format one Server-Sent Event as the messages API streams them"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/v1/messages")
+async def create_message(request: Request):
+    """Answer a messages API request after a simulated delay"""
+    body = await request.json()
+    stats["requests"] += 1
+    if ERROR_RATE and random.random() < ERROR_RATE:
+        stats["errors"] += 1
+        return JSONResponse(
+            status_code=ERROR_STATUS,
+            content={"type": "error", "error": {"type": ERROR_TYPES.get(ERROR_STATUS, "api_error"), "message": "Simulated error"}},
+            headers={"retry-after": "0"}
+        )
+    
+    prompt = prompt_text(body)
+    latency = sample_latency()
+    
+    tools = body.get("tools")
+    if tools:
+        stats["tool_calls"] += 1
+        tool_input = extract_factors(prompt)
+        await asyncio.sleep(latency)
+        content = [{"type": "tool_use", "id": f"toolu_fake_{random.getrandbits(48):012x}",
+                    "name": tools[0]["name"], "input": tool_input}]
+        return message(body, content, "tool_use", usage(prompt, json.dumps(tool_input)))
+    
+    text = reply_text(prompt, body.get("max_tokens", 1000))
+    pieces = split_tokens(text)
+    
+    if not body.get("stream"):
+        await asyncio.sleep(latency + len(pieces) * TOKEN_INTERVAL_MS / 1000)
+        return message(body, [{"type": "text", "text": text}], "end_turn", usage(prompt, text))
+    
+    stats["streams"] += 1
+    
+    async def events():
+        start = message(body, [], None, {"input_tokens": usage(prompt, text)["input_tokens"], "output_tokens": 1})
+        yield sse_event("message_start", {"type": "message_start", "message": start})
+        yield sse_event("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+        await asyncio.sleep(latency)
+        for i, piece in enumerate(pieces):
+            if i:
+                await asyncio.sleep(TOKEN_INTERVAL_MS / 1000)
+            yield sse_event("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": piece}})
+        yield sse_event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        yield sse_event("message_delta", {
+            "type": "message_delta",
+            "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+            "usage": {"output_tokens": usage(prompt, text)["output_tokens"]}
+        })
+        yield sse_event("message_stop", {"type": "message_stop"})
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.get("/stats")
+async def get_stats():
+    """Get request counters"""
+    return stats
+
+if __name__ == "__main__":
+    logger.info(
+        f"Fake LLM server on port {PORT}: {LATENCY_MEDIAN_MS:.0f}ms median latency, "
+        f"{TOKEN_INTERVAL_MS:.0f}ms per token, {ERROR_RATE:.0%} errors"
+    )
+    uvicorn.run(app, host="0.0.0.0", port=PORT, log_level="warning")
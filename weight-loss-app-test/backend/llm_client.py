@@ -0,0 +1,63 @@
+import os
+import logging
+import httpx
+from anthropic import Anthropic, AsyncAnthropic
+
+logger = logging.getLogger("llm-client")
+
+# Model used for chat replies and data extraction
+MODEL = "claude-3-sonnet-20240229"
+
+# Connection pool and timeouts, overridable from the environment
+MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", 512))
+MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("LLM_MAX_KEEPALIVE_CONNECTIONS", 128))
+CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", 5.0))
+REQUEST_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", 60.0))
+MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 2))
+
+def client_timeout() -> httpx.Timeout:
+    """Timeout applied to every model request"""
+    return httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+def create_async_client(api_key: str, max_retries: int = MAX_RETRIES) -> AsyncAnthropic:
+    """
+    Create an async client over a pooled HTTP connection
+    
+    One client is meant to be shared by every request in a worker, so
+    connections are reused instead of set up per call. Close it with
+    `await client.close()` on shutdown.
+    
+    Args:
+        api_key: Anthropic API key
+        max_retries: Retries made by the client itself (0 when an
+            LLMScheduler retries its calls instead)
+            
+    Returns:
+        AsyncAnthropic client
+    """
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS
+        ),
+        timeout=client_timeout()
+    )
+    logger.info(f"Created LLM client pool ({MAX_CONNECTIONS} connections, {REQUEST_TIMEOUT}s timeout)")
+    return AsyncAnthropic(
+        api_key=api_key,
+        http_client=http_client,
+        timeout=client_timeout(),
+        max_retries=max_retries
+    )
+
+def create_client(api_key: str) -> Anthropic:
+    """
+    Create a blocking client with the same timeouts, for scripts and tests
+    
+    Args:
+        api_key: Anthropic API key
+        
+    Returns:
+        Anthropic client
+    """
+    return Anthropic(api_key=api_key, timeout=client_timeout(), max_retries=MAX_RETRIES)
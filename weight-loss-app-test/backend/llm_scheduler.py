@@ -0,0 +1,258 @@
+import os
+import time
+import heapq
+import random
+import asyncio
+import logging
+import itertools
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict
+from anthropic import APIConnectionError, APIStatusError
+from llm_client import MAX_RETRIES
+
+logger = logging.getLogger("llm-scheduler")
+
+# Priorities of outbound model calls; lower runs first
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+# Limits on outbound model calls per worker, overridable from the environment
+MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", 32))
+RATE_LIMIT = float(os.environ.get("LLM_RATE_LIMIT", 50.0))
+RATE_BURST = int(os.environ.get("LLM_RATE_BURST", MAX_CONCURRENCY))
+RETRY_BASE_DELAY = float(os.environ.get("LLM_RETRY_BASE_DELAY", 0.5))
+RETRY_MAX_DELAY = float(os.environ.get("LLM_RETRY_MAX_DELAY", 20.0))
+
+# Status codes worth retrying: conflicts, rate limits and server-side errors (incl. 529 overloaded)
+RETRY_STATUS_CODES = {408, 409, 429}
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a failed model call may succeed if tried again"""
+    if isinstance(error, APIConnectionError):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRY_STATUS_CODES or error.status_code >= 500
+    return False
+
+def retry_after(error: Exception) -> float:
+    """Seconds the API asked us to wait before retrying, or 0"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return 0.0
+    try:
+        return float(response.headers.get("retry-after", 0))
+    except ValueError:
+        return 0.0
+
+class LLMScheduler:
+    """
+    Process-wide gate for outbound model calls
+    
+    At most `max_concurrency` calls run at once; the rest wait in a priority
+    queue, so interactive replies go ahead of background extraction queued
+    before them. Calls also draw from a token bucket refilled at `rate` per
+    second, and calls failing with a retryable error are retried with
+    exponential backoff and full jitter, giving up their slot while they wait.
+    """
+    
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY, rate: float = RATE_LIMIT,
+                 burst: int = RATE_BURST, max_retries: int = MAX_RETRIES,
+                 base_delay: float = RETRY_BASE_DELAY, max_delay: float = RETRY_MAX_DELAY,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Initialize the scheduler
+        
+        Args:
+            max_concurrency: Maximum number of calls in flight
+            rate: Calls started per second (0 for no limit)
+            burst: Calls that may start at once after an idle period
+            max_retries: Retries of a call failing with a retryable error
+            base_delay: Backoff before the first retry, doubled for each one after
+            max_delay: Cap on the backoff
+            clock: Monotonic clock in seconds (overridable for tests)
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        
+        self._in_flight = 0
+        # Heap of [priority, sequence, future]; the sequence keeps equal priorities first in, first out
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._queued = {priority: 0 for priority in PRIORITY_NAMES}
+        self._tokens = float(self.burst)
+        self._refilled = clock()
+        
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+    
+    async def _acquire(self, priority: int):
+        """Wait for a free slot, in priority order"""
+        if self._in_flight < self.max_concurrency and not self._waiting:
+            self._in_flight += 1
+            return
+        
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, [priority, next(self._sequence), future])
+        self._queued[priority] += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            # The slot may have been handed over just as the caller was cancelled
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+        finally:
+            self._queued[priority] -= 1
+    
+    def _release(self):
+        """Hand the slot to the first live waiter, or free it"""
+        while self._waiting:
+            future = heapq.heappop(self._waiting)[2]
+            if not future.done():
+                future.set_result(None)
+                return
+        self._in_flight -= 1
+    
+    async def _take_token(self):
+        """Wait until the token bucket allows another call to start"""
+        if not self.rate:
+            return
+        while True:
+            now = self.clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+            self._refilled = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+    
+    @asynccontextmanager
+    async def slot(self, priority: int = BACKGROUND) -> AsyncIterator[None]:
+        """
+        Hold a slot for one call, e.g. a streamed reply that cannot be retried
+        once it has started sending
+        
+        Args:
+            priority: INTERACTIVE or BACKGROUND
+        """
+        start = self.clock()
+        await self._acquire(priority)
+        try:
+            await self._take_token()
+            waited = self.clock() - start
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            self.calls += 1
+            yield
+        finally:
+            self._release()
+    
+    def backoff(self, attempt: int, error: Exception = None) -> float:
+        """
+        Delay before a retry
+        
+        Args:
+            attempt: Number of the retry, from 0
+            error: The error being retried, whose retry-after header is honored
+            
+        Returns:
+            Seconds to wait
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if error is not None:
+            delay = max(delay, min(retry_after(error), self.max_delay))
+        return delay
+    
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        """Count a failed attempt and return the delay before the next one, or re-raise"""
+        if not is_retryable(error) or attempt >= self.max_retries:
+            self.failures += 1
+            raise error
+        delay = self.backoff(attempt, error)
+        self.retries += 1
+        logger.warning(f"Model call failed ({error}); retry {attempt + 1} in {delay:.2f}s")
+        return delay
+    
+    async def run(self, fn: Callable[[], Awaitable[Any]], priority: int = BACKGROUND) -> Any:
+        """
+        Run a model call under the concurrency cap and rate limit, retrying
+        retryable errors
+        
+        Args:
+            fn: Zero-argument coroutine function making the call
+            priority: INTERACTIVE or BACKGROUND
+            
+        Returns:
+            The call's result
+            
+        Raises:
+            Exception: The call's error, once it is not retryable or retries run out
+        """
+        attempt = 0
+        while True:
+            try:
+                async with self.slot(priority):
+                    return await fn()
+            except Exception as e:
+                delay = self._retry_delay(attempt, e)
+            attempt += 1
+            await asyncio.sleep(delay)
+    
+    async def stream_text(self, open_stream: Callable[[], Any], priority: int = INTERACTIVE) -> AsyncIterator[str]:
+        """
+        Stream a reply's text under the concurrency cap and rate limit
+        
+        Errors before the first piece of text are retried like in run; once
+        text has been yielded the stream cannot be replayed, so later errors
+        are raised.
+        
+        Args:
+            open_stream: Zero-argument function returning the client's
+                messages.stream(...) context manager
+            priority: INTERACTIVE or BACKGROUND
+            
+        Yields:
+            Text deltas from the model
+        """
+        attempt = 0
+        while True:
+            started = False
+            try:
+                async with self.slot(priority):
+                    async with open_stream() as stream:
+                        async for text in stream.text_stream:
+                            started = True
+                            yield text
+                return
+            except Exception as e:
+                if started:
+                    self.failures += 1
+                    raise
+                delay = self._retry_delay(attempt, e)
+            attempt += 1
+            await asyncio.sleep(delay)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get queue and wait time metrics for monitoring"""
+        return {
+            "in_flight": self._in_flight,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": sum(self._queued.values()),
+            "queued": {PRIORITY_NAMES[priority]: count for priority, count in self._queued.items()},
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+            "wait_avg_ms": round(self.wait_total / self.calls * 1000, 3) if self.calls else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 3)
+        }
@@ -0,0 +1,218 @@
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+import logging
+import httpx
+from typing import Any, Dict, List, Optional
+
+# Open-loop load generator for the backend. Requests are started on a fixed
+# schedule at the target rate whether or not earlier ones have finished, and
+# latency is measured from each request's scheduled start, so a slow server
+# shows up as latency instead of silently lowering the request rate.
+#
+# Offline, run it against the fake LLM server:
+#   python fake_llm_server.py &
+#   ANTHROPIC_API_KEY=fake ANTHROPIC_BASE_URL=http://localhost:8100 python run_server.py &
+#   python load_test.py --rps 50 --duration 30
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+
+logger = logging.getLogger("load-test")
+# One log line per request would swamp the report
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# API base URL
+BASE_URL = "http://localhost:8000"
+
+# Relative weight of each scenario in the request mix
+DEFAULT_MIX = {"chat": 1, "recommendations": 4, "factors": 3, "update_factor": 2}
+
+FACTORS = ["caloric_intake", "physical_activity", "sleep_quality", "stress_level", "meal_timing"]
+
+CHAT_MESSAGES = [
+    "I only slept 5 hours last night and I'm exhausted",
+    "Work has been really stressful this week",
+    "I've been snacking a lot in the evenings",
+    "I went for a walk after dinner today",
+    "What should I focus on first?",
+    "thanks, that helps!",
+]
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    # Rounded first so that e.g. 0.95 * 100 is not taken as just over 95
+    rank = math.ceil(round(fraction * len(sorted_values), 9))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+def build_request(scenario: str, user: int, rng: random.Random) -> Dict[str, Any]:
+    """Method, path, headers and body of one request in a scenario"""
+    headers = {"X-User-Id": f"load-user-{user}"}
+    if scenario == "chat":
+        return {"method": "POST", "url": "/chat", "headers": headers, "json": {
+            "message": rng.choice(CHAT_MESSAGES),
+            "conversation_id": f"load-{user}"
+        }}
+    if scenario == "recommendations":
+        return {"method": "GET", "url": "/recommendations", "headers": headers}
+    if scenario == "factors":
+        return {"method": "GET", "url": "/factors", "headers": headers}
+    if scenario == "update_factor":
+        factor = rng.choice(FACTORS)
+        return {"method": "POST", "url": f"/factors/{factor}", "headers": headers, "json": {
+            "factor": factor, "value": round(rng.random(), 2), "confidence": 0.7
+        }}
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+async def run_load(client: httpx.AsyncClient, rps: float, duration: float,
+                   mix: Optional[Dict[str, float]] = None, users: int = 100, seed: int = 0) -> Dict[str, Any]:
+    """
+    Drive the backend at a target request rate and measure latency
+    
+    Args:
+        client: Client whose base URL points at the backend
+        rps: Requests started per second
+        duration: Seconds to keep starting requests
+        mix: Relative weight of each scenario (defaults to DEFAULT_MIX)
+        users: Number of distinct users the requests are spread over
+        seed: Seed for the request mix, so runs are repeatable
+        
+    Returns:
+        Report from summarize
+    """
+    mix = mix or DEFAULT_MIX
+    scenarios = list(mix)
+    weights = [mix[scenario] for scenario in scenarios]
+    rng = random.Random(seed)
+    samples = {scenario: [] for scenario in scenarios}
+    errors = {scenario: 0 for scenario in scenarios}
+    
+    async def send(scenario: str, request: Dict[str, Any], scheduled: float):
+        try:
+            response = await client.request(**request)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        if ok:
+            samples[scenario].append(time.perf_counter() - scheduled)
+        else:
+            errors[scenario] += 1
+    
+    tasks = []
+    start = time.perf_counter()
+    total = int(rps * duration)
+    for i in range(total):
+        scheduled = start + i / rps
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        scenario = rng.choices(scenarios, weights)[0]
+        request = build_request(scenario, rng.randrange(users), rng)
+        tasks.append(asyncio.ensure_future(send(scenario, request, scheduled)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    
+    return summarize(samples, errors, elapsed, rps)
+
+def summarize(samples: Dict[str, List[float]], errors: Dict[str, int], elapsed: float,
+              rps: float) -> Dict[str, Any]:
+    """
+    Summarize latency samples per scenario and overall
+    
+    Args:
+        samples: Seconds taken by each successful request, per scenario
+        errors: Failed requests per scenario
+        elapsed: Seconds from the first request's start to the last one's end
+        rps: Target request rate
+        
+    Returns:
+        Dict with target_rps, throughput (successful requests per second),
+        and count, errors and p50/p95/p99/max latency in milliseconds per
+        scenario and in "all"
+    """
+    def stats(values: List[float], failed: int) -> Dict[str, Any]:
+        values = sorted(values)
+        return {
+            "count": len(values),
+            "errors": failed,
+            **{f"p{int(fraction * 100)}_ms": round(percentile(values, fraction) * 1000, 1)
+               for fraction in (0.5, 0.95, 0.99)},
+            "max_ms": round(values[-1] * 1000, 1) if values else 0.0
+        }
+    
+    report = {scenario: stats(samples[scenario], errors[scenario]) for scenario in samples}
+    report["all"] = stats([value for values in samples.values() for value in values], sum(errors.values()))
+    return {
+        "target_rps": rps,
+        "throughput_rps": round(report["all"]["count"] / elapsed, 1) if elapsed else 0.0,
+        "elapsed_s": round(elapsed, 2),
+        "scenarios": report
+    }
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Render a report as a table"""
+    lines = [
+        f"Target {report['target_rps']} rps, achieved {report['throughput_rps']} rps over {report['elapsed_s']}s",
+        f"{'scenario':<16}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    ]
+    for scenario, stats in report["scenarios"].items():
+        lines.append(
+            f"{scenario:<16}{stats['count']:>8}{stats['errors']:>8}{stats['p50_ms']:>10}"
+            f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['max_ms']:>10}"
+        )
+    return "\n".join(lines)
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """Parse a mix like "chat=1,recommendations=4" """
+    mix = {}
+    for part in text.split(","):
+        scenario, _, weight = part.partition("=")
+        if scenario not in DEFAULT_MIX:
+            raise ValueError(f"Unknown scenario: {scenario} (expected one of {', '.join(DEFAULT_MIX)})")
+        mix[scenario] = float(weight or 1)
+    return mix
+
+async def main(args: argparse.Namespace) -> int:
+    mix = parse_mix(args.mix) if args.mix else DEFAULT_MIX
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        logger.info(f"Sending {args.rps} rps to {args.url} for {args.duration}s (mix: {mix})")
+        report = await run_load(client, args.rps, args.duration, mix, args.users, args.seed)
+    
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    
+    # Regression gates for CI
+    overall = report["scenarios"]["all"]
+    if args.max_p99_ms is not None and overall["p99_ms"] > args.max_p99_ms:
+        logger.error(f"p99 latency {overall['p99_ms']}ms exceeds {args.max_p99_ms}ms")
+        return 1
+    if overall["errors"] > args.max_errors:
+        logger.error(f"{overall['errors']} requests failed (allowed: {args.max_errors})")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the Weight Management API")
+    parser.add_argument("--url", default=BASE_URL, help="Backend base URL")
+    parser.add_argument("--rps", type=float, default=20, help="Requests started per second")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run")
+    parser.add_argument("--mix", help="Scenario weights, e.g. chat=1,recommendations=4,factors=3,update_factor=2")
+    parser.add_argument("--users", type=int, default=100, help="Distinct users (X-User-Id) to spread requests over")
+    parser.add_argument("--connections", type=int, default=256, help="Maximum open connections")
+    parser.add_argument("--timeout", type=float, default=60, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the request mix")
+    parser.add_argument("--json", help="Also write the report to this file")
+    parser.add_argument("--max-p99-ms", type=float, help="Exit with status 1 if overall p99 latency is higher")
+    parser.add_argument("--max-errors", type=int, default=0, help="Exit with status 1 if more requests fail")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -1,13 +1,32 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse, Response
+from pydantic import BaseModel, StrictFloat
 from typing import Dict, List, Optional, Any
 import uvicorn
 import os
+import asyncio
 import logging
 from simplified_obesity_network import SimpleObesityNetwork
+from network_store import (
+    NetworkTopology, UserNetworkStore, UserNetwork, SharedStateDB, batch_top_recommendations, widen
+)
+import numpy as np
+from observation_ingest import ingest_stream, DEFAULT_WINDOW
 from data_extraction import ConversationDataExtractor
+from extraction_cache import ExtractionCache, DEFAULT_MAX_BYTES, DEFAULT_TTL
+from llm_client import MODEL, create_async_client
+from chat_pipeline import ChatPipeline, build_chat_prompt
+from conversation_memory import ConversationMemory, DEFAULT_TOKEN_BUDGET, DEFAULT_CAPACITY, format_context
+from singleflight import SingleFlight
+from factor_classifier import FactorClassifier
+from llm_scheduler import LLMScheduler, INTERACTIVE
+from network_render import NetworkRenderer, IMAGE_FORMATS, DEFAULT_MAX_BYTES as RENDER_CACHE_BYTES, etag_matches
+from simulation import DEFAULT_DRAWS, shutdown_pool
+from contextlib import asynccontextmanager
 import json
+from collections import Counter
 
 # Configure logging
 logging.basicConfig(
@@ -17,7 +36,60 @@ logging.basicConfig(
 
 logger = logging.getLogger("weight-management-api")
 
-app = FastAPI(title="Weight Management API", description="API for the weight management system")
+# The shared LLM client and everything built on it are created at startup (see lifespan)
+api_key = os.environ.get("ANTHROPIC_API_KEY")
+llm_client = None
+llm_scheduler = None
+data_extractor = None
+conversation_memory = None
+chat_pipeline = None
+
+# Identical chat requests from the same user (e.g. client retries) share one in-flight turn
+chat_flight = SingleFlight()
+
+def start_llm_services():
+    """Create the pooled LLM client, the scheduler and the extraction and chat pipeline on it"""
+    global llm_client, llm_scheduler, data_extractor, conversation_memory, chat_pipeline
+    if not api_key:
+        logger.warning("ANTHROPIC_API_KEY environment variable not set. Data extraction will not work.")
+        return
+    
+    # Every outbound model call goes through the scheduler, which does the retrying
+    llm_scheduler = LLMScheduler()
+    llm_client = create_async_client(api_key, max_retries=0)
+    # With EXTRACTION_CACHE_DB set, cached extractions also persist in a SQLite file
+    extraction_cache = ExtractionCache(
+        max_bytes=int(os.environ.get("EXTRACTION_CACHE_BYTES", DEFAULT_MAX_BYTES)),
+        ttl=float(os.environ.get("EXTRACTION_CACHE_TTL", DEFAULT_TTL)),
+        path=os.environ.get("EXTRACTION_CACHE_DB")
+    )
+    data_extractor = ConversationDataExtractor(
+        api_key, client=llm_client, cache=extraction_cache,
+        classifier=FactorClassifier(), scheduler=llm_scheduler
+    )
+    # With CONVERSATION_DB set, conversation logs and summaries are kept in a SQLite file shared by all workers
+    conversation_memory = ConversationMemory(
+        token_budget=int(os.environ.get("CONVERSATION_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET)),
+        capacity=int(os.environ.get("CONVERSATION_CAPACITY", DEFAULT_CAPACITY)),
+        path=os.environ.get("CONVERSATION_DB")
+    )
+    chat_pipeline = ChatPipeline(
+        llm_client, data_extractor, mode=os.environ.get("CHAT_MODE", "speculative"),
+        scheduler=llm_scheduler, memory=conversation_memory
+    )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_llm_services()
+    yield
+    # Persist modified user states still held in memory, then release pooled
+    # LLM connections and simulation workers
+    await run_in_threadpool(store.flush)
+    if llm_client is not None:
+        await llm_client.close()
+    shutdown_pool()
+
+app = FastAPI(title="Weight Management API", description="API for the weight management system", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -28,16 +100,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize the network model
-network = SimpleObesityNetwork()
+# Initialize the per-user network store over the shared factor graph, defined by
+# the model file in NETWORK_MODEL (the bundled obesity model by default).
+# With NETWORK_STORE_DB set, state lives in a SQLite database shared by all workers.
+template_network = SimpleObesityNetwork()
+logger.info(f"Loaded network model {template_network.model.name} {template_network.model.version} "
+            f"({len(template_network.model.factors)} factors, {len(template_network.relationships)} relationships)")
+shared_db_path = os.environ.get("NETWORK_STORE_DB")
+store = UserNetworkStore(
+    NetworkTopology.from_network(template_network),
+    capacity=int(os.environ.get("NETWORK_STORE_CAPACITY", 10000)),
+    spill_dir=os.environ.get("NETWORK_STORE_DIR", "network_store"),
+    shared_db=SharedStateDB(shared_db_path) if shared_db_path else None,
+    forgetting=float(os.environ.get("FACTOR_FORGETTING", 1.0))
+)
+
+# Rendered network images, cached by content so unchanged networks are not redrawn
+renderer = NetworkRenderer(max_bytes=int(os.environ.get("RENDER_CACHE_BYTES", RENDER_CACHE_BYTES)))
 
-# Initialize the data extractor
-api_key = os.environ.get("ANTHROPIC_API_KEY")
-if not api_key:
-    logger.warning("ANTHROPIC_API_KEY environment variable not set. Data extraction will not work.")
-    data_extractor = None
-else:
-    data_extractor = ConversationDataExtractor(api_key)
+# Worker processes per API worker for what-if simulations on large graphs (0 runs them in-process)
+simulation_workers = int(os.environ.get("SIMULATION_WORKERS", 0))
+
+# Callers that do not identify themselves share this user's network
+DEFAULT_USER_ID = "default"
+
+def get_network(x_user_id: Optional[str] = Header(None)) -> UserNetwork:
+    """Resolve the calling user's network from the X-User-Id header"""
+    return store.view(x_user_id or DEFAULT_USER_ID)
 
 # Pydantic models for request/response validation
 class FactorUpdate(BaseModel):
@@ -51,8 +140,32 @@ class RelationshipUpdate(BaseModel):
     strength: float
     confidence: Optional[float] = 0.7
 
+class BatchUser(BaseModel):
+    user_id: str
+    # Edge weights in GET /relationships order; read from the user's stored network if omitted
+    weights: Optional[List[float]] = None
+    factors: Optional[Dict[str, float]] = None
+
+class BatchRecommendationRequest(BaseModel):
+    users: List[BatchUser]
+    n: int = 3
+    mode: str = "second_order"
+
+class BulkUpdate(BaseModel):
+    factors: Optional[List[FactorUpdate]] = None
+    relationships: Optional[List[RelationshipUpdate]] = None
+
+class SimulationRequest(BaseModel):
+    # Factor -> value it is set to (0-1), e.g. {"sleep_quality": 0.8, "stress_level": 0.3}
+    interventions: Dict[str, StrictFloat]
+    draws: int = DEFAULT_DRAWS
+    mode: str = "second_order"
+    # Fixes the draws so repeated queries return the same distribution
+    seed: Optional[int] = None
+
 class NetworkState(BaseModel):
     factors: Dict[str, float]
+    precisions: Optional[Dict[str, float]] = None
     relationships: List[Dict[str, Any]]
 
 class RecommendationResponse(BaseModel):
@@ -60,7 +173,12 @@ class RecommendationResponse(BaseModel):
 
 class ConversationRequest(BaseModel):
     message: str
+    # Omit (with a conversation_id) to have the server keep the history
     conversation_history: Optional[List[Dict[str, str]]] = None
+    # "pre_update" or "speculative" (see chat_pipeline.py); defaults to CHAT_MODE
+    mode: Optional[str] = None
+    # Lets extraction skip messages already processed in earlier turns, and keys server-side history
+    conversation_id: Optional[str] = None
 
 class ConversationResponse(BaseModel):
     response: str
@@ -73,36 +191,28 @@ async def root():
     return {"message": "Weight Management API"}
 
 @app.get("/factors", response_model=Dict[str, Dict[str, Any]])
-async def get_factors():
+async def get_factors(network: UserNetwork = Depends(get_network)):
     """Get all factors and their current values"""
-    return network.factors
+    return await run_in_threadpool(lambda: network.factors)
 
 @app.post("/factors/{factor}")
-async def update_factor(factor: str, update: FactorUpdate):
+async def update_factor(factor: str, update: FactorUpdate, network: UserNetwork = Depends(get_network)):
     """Update a factor's value"""
-    success = network.update_factor(factor, update.value, update.confidence)
+    success = await run_in_threadpool(network.update_factor, factor, update.value, update.confidence)
     if not success:
         raise HTTPException(status_code=400, detail=f"Invalid factor: {factor}")
     return {"message": f"Factor {factor} updated successfully"}
 
 @app.get("/relationships")
-async def get_relationships():
+async def get_relationships(network: UserNetwork = Depends(get_network)):
     """Get all relationships in the network"""
-    relationships = []
-    for source, target, data in network.G.edges(data=True):
-        relationships.append({
-            "from": source,
-            "to": target,
-            "weight": data["weight"],
-            "confidence": data["confidence"]
-        })
-    return relationships
+    return await run_in_threadpool(network.get_relationships)
 
 @app.post("/relationships")
-async def update_relationship(update: RelationshipUpdate):
+async def update_relationship(update: RelationshipUpdate, network: UserNetwork = Depends(get_network)):
     """Update a relationship's strength"""
-    success = network.update_relationship(
-        update.source, update.target, update.strength, update.confidence
+    success = await run_in_threadpool(
+        network.update_relationship, update.source, update.target, update.strength, update.confidence
     )
     if not success:
         raise HTTPException(
@@ -111,92 +221,259 @@ async def update_relationship(update: RelationshipUpdate):
         )
     return {"message": "Relationship updated successfully"}
 
+@app.post("/bulk-updates")
+async def bulk_update(update: BulkUpdate, network: UserNetwork = Depends(get_network)):
+    """Apply many factor and relationship updates atomically"""
+    try:
+        counts = await run_in_threadpool(network.apply_updates, update.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "Bulk update applied successfully", **counts}
+
+@app.post("/observations/stream")
+async def ingest_observations(request: Request, window: int = DEFAULT_WINDOW, final: bool = False,
+                              network: UserNetwork = Depends(get_network)):
+    """
+    Aggregate a stream of NDJSON observations (sleep, steps, meals) into factor
+    updates, applied to the network in batches as windows close (the windows
+    still open at the end are only applied if final is set)
+    """
+    if window <= 0:
+        raise HTTPException(status_code=400, detail="window must be positive")
+    
+    async def apply_batch(batch):
+        await run_in_threadpool(network.apply_updates, batch)
+    
+    summary = await ingest_stream(request.stream(), apply_batch, window=window, final=final)
+    return {"message": "Observations ingested successfully", **summary}
+
 @app.get("/recommendations", response_model=RecommendationResponse)
-async def get_recommendations(n: int = 3):
+async def get_recommendations(n: int = 3, mode: str = "second_order",
+                              network: UserNetwork = Depends(get_network)):
     """Get top n recommendations based on intervention potential"""
-    recommendations = network.get_top_recommendations(n)
+    try:
+        recommendations = await run_in_threadpool(network.get_top_recommendations, n, mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {"recommendations": recommendations}
 
+@app.post("/recommendations/batch")
+async def get_batch_recommendations(request: BatchRecommendationRequest):
+    """Get top n recommendations for many users, scored in one vectorized pass"""
+    topology = store.topology
+    # Results are keyed by user, so a repeated id would silently lose all but one entry
+    duplicates = sorted(user_id for user_id, count in Counter(user.user_id for user in request.users).items() if count > 1)
+    if duplicates:
+        raise HTTPException(status_code=400, detail=f"Duplicate user_ids: {', '.join(duplicates)}")
+    stored = [user for user in request.users if user.weights is None]
+    supplied = [user for user in request.users if user.weights is not None]
+    
+    try:
+        results = dict(zip(
+            (user.user_id for user in stored),
+            await run_in_threadpool(
+                store.batch_top_recommendations, [user.user_id for user in stored], request.n, request.mode
+            )
+        ))
+        
+        if supplied:
+            factor_values = np.tile(widen(topology.baselines), (len(supplied), 1))
+            for row, user in enumerate(supplied):
+                for factor, value in (user.factors or {}).items():
+                    if factor not in topology.node_index:
+                        raise ValueError(f"Invalid factor for user {user.user_id}: {factor}")
+                    factor_values[row, topology.node_index[factor]] = value
+            results.update(zip(
+                (user.user_id for user in supplied),
+                await run_in_threadpool(
+                    batch_top_recommendations,
+                    topology, [user.weights for user in supplied], request.n, request.mode, factor_values
+                )
+            ))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "results": [
+            {"user_id": user.user_id, "recommendations": results[user.user_id]}
+            if results[user.user_id] is not None else
+            {"user_id": user.user_id, "recommendations": [], "error": "Path effects do not converge"}
+            for user in request.users
+        ]
+    }
+
+@app.post("/simulate")
+async def simulate(request: SimulationRequest, network: UserNetwork = Depends(get_network)):
+    """
+    Simulate setting factors to new values together, sampling edge weights from
+    their confidences, and return the distribution of the outcome on weight
+    """
+    try:
+        return await run_in_threadpool(
+            network.simulate, request.interventions, request.draws, request.mode, request.seed, simulation_workers
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/network-state", response_model=NetworkState)
-async def get_network_state():
+async def get_network_state(network: UserNetwork = Depends(get_network)):
     """Get the current state of the network"""
-    return network.get_network_state()
+    return await run_in_threadpool(network.get_network_state)
 
 @app.post("/network-state")
-async def set_network_state(state: NetworkState):
+async def set_network_state(state: NetworkState, network: UserNetwork = Depends(get_network)):
     """Set the network state"""
-    success = network.set_network_state(state.dict())
+    success = await run_in_threadpool(network.set_network_state, state.dict())
     if not success:
         raise HTTPException(status_code=400, detail="Failed to set network state")
     return {"message": "Network state updated successfully"}
 
-@app.get("/visualization")
-async def get_visualization():
-    """Get a visualization of the network"""
-    fig = network.visualize_network()
-    # In a real implementation, you would save this to a file or return as base64
-    # For now, we'll just return a success message
-    return {"message": "Visualization generated successfully"}
+@app.get("/metrics")
+async def get_metrics():
+    """Get cache counters for monitoring"""
+    metrics = {"model": store.topology.model.summary(), "network_store": store.stats(), "visualization": renderer.stats()}
+    if chat_pipeline is not None:
+        metrics["chat"] = chat_pipeline.stats()
+        metrics["extraction"] = data_extractor.stats()
+        metrics["extraction_cache"] = data_extractor.cache.stats()
+        metrics["extraction_fast_path"] = data_extractor.classifier.stats()
+        metrics["conversation_memory"] = conversation_memory.stats()
+        metrics["llm_scheduler"] = llm_scheduler.stats()
+        metrics["singleflight"] = {"chat": chat_flight.stats(), "extraction": data_extractor.flight.stats()}
+    return metrics
 
-@app.post("/chat", response_model=ConversationResponse)
-async def chat(request: ConversationRequest):
+@app.get("/visualization")
+async def get_visualization(format: str = "png", if_none_match: Optional[str] = Header(None),
+                            network: UserNetwork = Depends(get_network)):
     """
-    Process a chat message, extract data, update the network, and return recommendations
+    Get an image of the network with the top recommendations highlighted
+    
+    Images are cached by content and carry an ETag, so a client revalidating
+    an unchanged network gets a 304 without anything being drawn.
     """
-    # Get recommendations from the network model
-    recommendations = network.get_top_recommendations(3)
-    
-    # Extract data from the conversation if data extractor is available
-    extracted_data = None
-    if data_extractor and request.conversation_history:
-        # Combine conversation history into a single string
-        conversation = "\n".join([
-            f"{msg.get('role', 'user')}: {msg.get('content', '')}"
-            for msg in request.conversation_history
-        ])
-        conversation += f"\nuser: {request.message}"
-        
-        # Extract data
-        extracted_data = data_extractor.extract_data(conversation)
-        
-        # Update network with extracted data
-        data_extractor.update_network(extracted_data)
-        
-        # Get updated recommendations
-        recommendations = network.get_top_recommendations(3)
+    if format not in IMAGE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format: {format} (expected one of {', '.join(IMAGE_FORMATS)})")
     
-    # Format recommendations for Claude
-    recommendations_text = "\n".join([
-        f"- {rec['factor']}: {rec['direction']} (impact: {rec['potential']:.2f})"
-        for rec in recommendations
-    ])
+    def read_network():
+        state = network.get_network_state()
+        potentials = network.calculate_intervention_potential()
+        highlighted = [r["factor"] for r in network.get_top_recommendations(3)]
+        return state, potentials, highlighted
     
-    # Create the prompt for Claude
-    prompt = f"""You are a weight management coach. Use the following recommendations from our network model to inform your response, but maintain a natural, conversational tone:
+    # Reading a spilled or shared state touches disk, so keep it off the event loop
+    state, potentials, highlighted = await run_in_threadpool(read_network)
+    
+    headers = {"Cache-Control": "private, max-age=0, must-revalidate", "Vary": "X-User-Id"}
+    etag = renderer.etag(state, potentials, highlighted, format)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={**headers, "ETag": etag})
+    
+    # Drawing takes a while on a cache miss, so keep it off the event loop
+    image, etag = await run_in_threadpool(renderer.render, state, potentials, highlighted, format)
+    return Response(content=image, media_type=IMAGE_FORMATS[format], headers={**headers, "ETag": etag})
 
-{recommendations_text}
+def conversation_key(request: ConversationRequest, network: UserNetwork) -> Optional[str]:
+    """Scope a client's conversation id to the calling user"""
+    if request.conversation_id is None:
+        return None
+    return f"{network.user_id}:{request.conversation_id}"
 
-User message: {request.message}
+def sse_event(event: str, data: Any) -> str:
+    """Format one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-Respond in a helpful, empathetic way while incorporating relevant recommendations when appropriate."""
+@app.post("/chat", response_model=ConversationResponse)
+async def chat(request: ConversationRequest, network: UserNetwork = Depends(get_network)):
+    """
+    Process a chat message, extract data, update the network, and return recommendations
     
-    # Get response from Claude
-    from anthropic import Anthropic
-    anthropic = Anthropic(api_key=api_key)
+    Extraction and the reply run concurrently; `mode` picks whether the reply
+    keeps the pre-update recommendations or is restarted when they change.
+    """
+    if chat_pipeline is None:
+        raise HTTPException(status_code=503, detail="Chat is unavailable: ANTHROPIC_API_KEY is not set")
     
-    completion = anthropic.messages.create(
-        model="claude-3-sonnet-20240229",
-        max_tokens=1000,
-        messages=[{"role": "user", "content": prompt}]
-    )
+    try:
+        return await chat_flight.do(
+            (network.user_id, request.model_dump_json()),
+            lambda: chat_pipeline.run(
+                request.message, request.conversation_history, network, request.mode,
+                conversation_key(request, network)
+            )
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/chat/stream")
+async def chat_stream(request: ConversationRequest, network: UserNetwork = Depends(get_network)):
+    """
+    Process a chat message, streaming the reply as Server-Sent Events
     
-    response_text = completion.content[0].text
+    Events, in order: `recommendations` (sent immediately), one `token` per
+    text delta from the model, `extracted_data` with the data extracted from
+    the conversation and the updated recommendations, then `done`. A failure
+    after the stream has started is reported as an `error` event.
+    """
+    if llm_client is None:
+        raise HTTPException(status_code=503, detail="Chat is unavailable: ANTHROPIC_API_KEY is not set")
     
-    return {
-        "response": response_text,
-        "recommendations": recommendations,
-        "extracted_data": extracted_data
-    }
+    key = conversation_key(request, network)
+    history = request.conversation_history
+    context = await chat_pipeline.load_context(history, key)
+    offset = 0
+    context_text = ""
+    if context is not None:
+        history, offset = context["messages"], context["offset"]
+        context_text = format_context(context)
+    
+    recommendations = await run_in_threadpool(network.get_top_recommendations, 3)
+    
+    # Extract data while the reply streams; the tokens already sent use the pre-update recommendations
+    extraction = None
+    if data_extractor and history:
+        extraction = asyncio.ensure_future(
+            chat_pipeline.extract_and_update(history, request.message, network, key, offset)
+        )
+    
+    async def events():
+        yield sse_event("recommendations", {"recommendations": recommendations})
+        try:
+            prompt = build_chat_prompt(recommendations, request.message, context_text)
+            reply = []
+            async for text in llm_scheduler.stream_text(
+                lambda: llm_client.messages.stream(
+                    model=MODEL,
+                    max_tokens=1000,
+                    messages=[{"role": "user", "content": prompt}]
+                ),
+                INTERACTIVE
+            ):
+                reply.append(text)
+                yield sse_event("token", {"text": text})
+            if context is not None:
+                await chat_pipeline.remember(key, request.message, "".join(reply))
+            
+            extracted_data = None
+            updated = recommendations
+            if extraction is not None:
+                extracted_data = await extraction
+                updated = await run_in_threadpool(network.get_top_recommendations, 3)
+            yield sse_event("extracted_data", {"extracted_data": extracted_data, "recommendations": updated})
+        except Exception as e:
+            logger.error(f"Error streaming chat: {e}")
+            yield sse_event("error", {"detail": "Failed to generate a response"})
+            return
+        finally:
+            if extraction is not None:
+                extraction.cancel()
+        yield sse_event("done", {})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Stop proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # Run the server
 if __name__ == "__main__":
@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+import numpy as np
+from typing import Any, Dict, List
+from network_model import FactorModel, load_model, parse_model, clear_loaded_models, SCHEMA_VERSION
+from simplified_obesity_network import SimpleObesityNetwork
+from network_store import NetworkTopology, UserNetworkStore, batch_top_recommendations
+
+# Scaling benchmark for the network model: recommendation latency against
+# factor and edge count, on random models of increasing size.
+#
+#   python network_benchmark.py --sizes 10,50,100,250,500 --degree 3
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+
+logger = logging.getLogger("network-benchmark")
+
+DEFAULT_SIZES = [10, 50, 100, 250, 500]
+
+def random_model_data(n_factors: int, degree: float = 3, seed: int = 0) -> Dict[str, Any]:
+    """
+    Model file contents for a random factor graph
+    
+    Edges only run from lower to higher factor numbers, so the graph is acyclic
+    and all-paths scores always converge. The last factor is the target, and
+    every other factor has at least one edge.
+    
+    Args:
+        n_factors: Number of factors, including the target
+        degree: Average number of edges leaving a factor
+        seed: Seed for the topology and weights
+        
+    Returns:
+        Dict in the model file format
+    """
+    rng = random.Random(seed)
+    names = [f"factor_{i:04d}" for i in range(n_factors - 1)] + ["target"]
+    factors = {
+        name: {"description": name.replace("_", " "), "modifiable": rng.randint(1, 10), "baseline": round(rng.random(), 2)}
+        for name in names
+    }
+    factors["target"]["modifiable"] = 0
+    
+    edges = set()
+    for i in range(n_factors - 1):
+        edges.add((i, rng.randrange(i + 1, n_factors)))
+    while len(edges) < min(int(degree * (n_factors - 1)), n_factors * (n_factors - 1) // 2):
+        i = rng.randrange(n_factors - 1)
+        edges.add((i, rng.randrange(i + 1, n_factors)))
+    
+    return {
+        "schema_version": SCHEMA_VERSION,
+        "name": f"random-{n_factors}",
+        "version": str(seed),
+        "target": "target",
+        "factors": factors,
+        "relationships": [
+            {"from": names[i], "to": names[j], "weight": round(rng.uniform(0.1, 0.9), 2)}
+            for i, j in sorted(edges)
+        ]
+    }
+
+def random_model(n_factors: int, degree: float = 3, seed: int = 0) -> FactorModel:
+    """A random FactorModel (see random_model_data)"""
+    return parse_model(random_model_data(n_factors, degree, seed))
+
+def timed(fn, repeat: int) -> float:
+    """Best of repeat runs, in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def benchmark_size(n_factors: int, degree: float = 3, users: int = 32, repeat: int = 5, seed: int = 0) -> Dict[str, Any]:
+    """
+    Measure one model size
+    
+    Args:
+        n_factors: Number of factors
+        degree: Average edges per factor
+        users: Users scored together in the batch measurement
+        repeat: Runs per measurement (the best is kept)
+        seed: Seed for the random model
+        
+    Returns:
+        Dict with the model size and timings in milliseconds
+    """
+    data = random_model_data(n_factors, degree, seed)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "model.json")
+        with open(path, "w") as f:
+            json.dump(data, f)
+        cache_dir = os.path.join(directory, "cache")
+        
+        def load(use_cache: bool):
+            clear_loaded_models()
+            return load_model(path, cache_dir=cache_dir, use_cache=use_cache)
+        
+        parse_ms = timed(lambda: load(False), repeat)
+        load(True)
+        cached_ms = timed(lambda: load(True), repeat)
+        model = load_model(path, cache_dir=cache_dir)
+    
+    network = SimpleObesityNetwork(model)
+    source, target = network.relationships[0][:2]
+    strengths = iter(np.linspace(0.1, 0.9, 10000).tolist())
+    
+    def update_and_recommend(mode: str):
+        network.update_relationship(source, target, next(strengths))
+        network.get_top_recommendations(3, mode=mode)
+    
+    result = {
+        "factors": n_factors,
+        "edges": len(model.relationships),
+        "parse_ms": parse_ms,
+        "cached_load_ms": cached_ms,
+        "build_ms": timed(lambda: SimpleObesityNetwork(model), repeat),
+        "second_order_ms": timed(lambda: update_and_recommend("second_order"), repeat),
+        "all_paths_ms": timed(lambda: update_and_recommend("all_paths"), repeat),
+    }
+    
+    topology = NetworkTopology.from_network(network)
+    store = UserNetworkStore(topology, spill_dir=None)
+    result["store_ms"] = timed(lambda: (
+        store.update_relationship("user", source, target, next(strengths)),
+        store.get_top_recommendations("user", 3)
+    ), repeat)
+    
+    weights = np.tile(topology.default_weights, (users, 1))
+    result["batch_per_user_ms"] = timed(lambda: batch_top_recommendations(topology, weights, 3), repeat) / users
+    return result
+
+def format_report(results: List[Dict[str, Any]]) -> str:
+    """Render benchmark results as a table"""
+    columns = ["factors", "edges", "parse_ms", "cached_load_ms", "build_ms", "second_order_ms",
+               "all_paths_ms", "store_ms", "batch_per_user_ms"]
+    lines = ["".join(f"{column:>18}" for column in columns)]
+    for result in results:
+        lines.append("".join(
+            f"{result[column]:>18}" if isinstance(result[column], int) else f"{result[column]:>18.3f}"
+            for column in columns
+        ))
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark recommendation latency against model size")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="Comma-separated factor counts")
+    parser.add_argument("--degree", type=float, default=3, help="Average edges leaving each factor")
+    parser.add_argument("--users", type=int, default=32, help="Users scored together in the batch measurement")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement (the best is kept)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the random models")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+    
+    results = []
+    for size in (int(size) for size in args.sizes.split(",")):
+        logger.info(f"Benchmarking {size} factors...")
+        results.append(benchmark_size(size, args.degree, args.users, args.repeat, args.seed))
+    print(format_report(results))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
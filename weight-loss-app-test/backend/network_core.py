@@ -0,0 +1,135 @@
+import numpy as np
+from typing import Dict, List, Tuple, Optional, Any, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import networkx as nx
+
+
+class FactorNode:
+    """
+    Attributes of one factor in a FactorGraph (change modifiable through
+    FactorGraph.set_modifiable so the graph's array stays in step)
+    """
+    
+    __slots__ = ("name", "index", "description", "baseline", "modifiable", "direction")
+    
+    def __init__(self, name: str, index: int, description: str, baseline: float, modifiable: float,
+                 direction: str = "increase"):
+        self.name = name
+        self.index = index
+        self.description = description
+        self.baseline = baseline
+        self.modifiable = modifiable
+        # "increase" or "decrease": the way a change improves the factor
+        self.direction = direction
+
+
+class FactorGraph:
+    """
+    Directed factor graph with a fixed node and edge order.
+    
+    Factor values and precisions are float64 arrays indexed by node, and edge
+    weights and confidences are float64 arrays indexed by edge (in the order the
+    relationships were given). Successors are stored CSR-style: the edges leaving
+    node i are successor_edges[successor_offsets[i]:successor_offsets[i + 1]].
+    The topology is fixed once built; only the arrays change.
+    """
+    
+    def __init__(self, factors: Dict[str, Dict[str, Any]], relationships: List[Tuple[str, str, float]],
+                 precision: float, confidence: float):
+        """
+        Initialize the graph at its baseline values and default weights
+        
+        Args:
+            factors: Map of factor names to attributes (modifiable, baseline, description,
+                and optionally direction, "increase" by default)
+            relationships: List of (source, target, default weight) edges
+            precision: Initial precision of every factor value
+            confidence: Initial confidence of every edge
+            
+        Raises:
+            ValueError: If an edge names an unknown factor or appears twice
+        """
+        self.nodes = tuple(
+            FactorNode(name, i, attrs["description"], attrs["baseline"], attrs["modifiable"],
+                       attrs.get("direction", "increase"))
+            for i, (name, attrs) in enumerate(factors.items())
+        )
+        self.node_index = {node.name: node.index for node in self.nodes}
+        self.n_nodes = len(self.nodes)
+        
+        unknown = [f"{s} -> {t}" for s, t, _ in relationships if s not in self.node_index or t not in self.node_index]
+        if unknown:
+            raise ValueError(f"Relationships between unknown factors: {', '.join(unknown)}")
+        self.edges = tuple((source, target) for source, target, _ in relationships)
+        self.edge_index = {edge: k for k, edge in enumerate(self.edges)}
+        if len(self.edge_index) != len(self.edges):
+            raise ValueError("Duplicate relationships")
+        self.n_edges = len(self.edges)
+        
+        self.edge_sources = np.array([self.node_index[s] for s, _ in self.edges], dtype=np.intp)
+        self.edge_targets = np.array([self.node_index[t] for _, t in self.edges], dtype=np.intp)
+        
+        # CSR successor lists: edge ids grouped by source, in relationship order within a source
+        self.successor_edges = np.argsort(self.edge_sources, kind="stable")
+        self.successor_offsets = np.searchsorted(
+            self.edge_sources[self.successor_edges], np.arange(self.n_nodes + 1)
+        )
+        for array in (self.edge_sources, self.edge_targets, self.successor_edges, self.successor_offsets):
+            array.setflags(write=False)
+        
+        self.values = np.array([node.baseline for node in self.nodes], dtype=np.float64)
+        self.precisions = np.full(self.n_nodes, precision, dtype=np.float64)
+        self.weights = np.array([w for _, _, w in relationships], dtype=np.float64)
+        self.confidences = np.full(self.n_edges, confidence, dtype=np.float64)
+        # Modifiability on a 0-1 scale, as the scoring engines use it
+        self.modifiability = np.array([node.modifiable for node in self.nodes], dtype=np.float64) / 10.0
+    
+    def edge(self, source: str, target: str) -> Optional[int]:
+        """Index of the edge from source to target, or None if there is none"""
+        return self.edge_index.get((source, target))
+    
+    def successors(self, i: int) -> np.ndarray:
+        """Ids of the edges leaving node i"""
+        return self.successor_edges[self.successor_offsets[i]:self.successor_offsets[i + 1]]
+    
+    def set_modifiable(self, i: int, modifiable: float) -> None:
+        """Set how modifiable node i is, on a 0-10 scale"""
+        self.nodes[i].modifiable = modifiable
+        self.modifiability[i] = modifiable / 10.0
+    
+    def weight_matrix(self) -> np.ndarray:
+        """
+        Expand the edge weights into a dense adjacency matrix
+        
+        Returns:
+            (n_nodes, n_nodes) matrix, entry [i, j] is the weight of edge i -> j
+        """
+        matrix = np.zeros((self.n_nodes, self.n_nodes))
+        matrix[self.edge_sources, self.edge_targets] = self.weights
+        return matrix
+    
+    def to_networkx(self) -> "nx.DiGraph":
+        """
+        Build a networkx graph of the current state (for drawing or export)
+        
+        Nodes carry the factor attributes and edges carry weight and confidence.
+        The graph is a copy, so changing it does not change this one.
+        
+        Returns:
+            networkx DiGraph
+        """
+        import networkx as nx
+        
+        graph = nx.DiGraph()
+        values = self.values.tolist()
+        precisions = self.precisions.tolist()
+        for node in self.nodes:
+            graph.add_node(
+                node.name, modifiable=node.modifiable, baseline=node.baseline,
+                current=values[node.index], description=node.description,
+                precision=precisions[node.index]
+            )
+        for (source, target), weight, confidence in zip(self.edges, self.weights.tolist(), self.confidences.tolist()):
+            graph.add_edge(source, target, weight=weight, confidence=confidence)
+        return graph
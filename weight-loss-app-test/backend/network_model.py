@@ -0,0 +1,246 @@
+import os
+import json
+import math
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Tuple, Optional, Any
+
+logger = logging.getLogger("network-model")
+
+# Model file layout this loader understands
+SCHEMA_VERSION = 1
+
+# Model used when neither a path nor NETWORK_MODEL is given
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "obesity.json")
+
+# Bumped whenever the cached form of a parsed model changes
+CACHE_FORMAT = 3
+
+# Ways a factor can improve; edges carry no sign, so this is what orients an intervention
+DIRECTIONS = ("increase", "decrease")
+
+YAML_SUFFIXES = (".yaml", ".yml")
+
+
+class FactorModel:
+    """
+    Parsed factor graph definition: the factors with their modifiability,
+    baselines, descriptions and improving directions, the relationships with their default weights,
+    and the target node. Shared by every network built from it, so treat it
+    as read-only.
+    """
+    
+    __slots__ = ("name", "version", "target", "factors", "relationships", "digest")
+    
+    def __init__(self, name: str, version: str, target: str, factors: Dict[str, Dict[str, Any]],
+                 relationships: List[Tuple[str, str, float]], digest: str = ""):
+        self.name = name
+        self.version = version
+        self.target = target
+        self.factors = factors
+        self.relationships = relationships
+        # sha256 of the file the model was read from
+        self.digest = digest
+    
+    def summary(self) -> Dict[str, Any]:
+        """Name, version and size of the model, for logs and monitoring"""
+        return {
+            "name": self.name,
+            "version": self.version,
+            "factors": len(self.factors),
+            "relationships": len(self.relationships),
+            "digest": self.digest[:12]
+        }
+
+
+def _number(value: Any, where: str, low: float = -math.inf, high: float = math.inf) -> float:
+    if (isinstance(value, bool) or not isinstance(value, (int, float))
+            or not math.isfinite(value) or not low <= value <= high):
+        if math.isinf(low):
+            raise ValueError(f"{where} must be a finite number")
+        raise ValueError(f"{where} must be a number from {low} to {high}")
+    return value
+
+
+def parse_model(data: Dict[str, Any], digest: str = "") -> FactorModel:
+    """
+    Validate a model definition and build a FactorModel from it
+    
+    Args:
+        data: Decoded model file (schema_version, name, version, target,
+            factors and relationships)
+        digest: sha256 of the file it came from
+        
+    Returns:
+        FactorModel instance
+        
+    Raises:
+        ValueError: If the definition is malformed or uses an unknown schema version
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Model must be a mapping")
+    if data.get("schema_version") != SCHEMA_VERSION:
+        raise ValueError(f"Unsupported model schema_version: {data.get('schema_version')} (expected {SCHEMA_VERSION})")
+    for key in ("name", "version", "target", "factors", "relationships"):
+        if key not in data:
+            raise ValueError(f"Model is missing {key}")
+    
+    raw_factors = data["factors"]
+    if not isinstance(raw_factors, dict) or not raw_factors:
+        raise ValueError("Model factors must be a non-empty mapping")
+    factors = {}
+    for name, attrs in raw_factors.items():
+        if not isinstance(attrs, dict):
+            raise ValueError(f"Factor {name} must be a mapping")
+        direction = attrs.get("direction", "increase")
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Factor {name} direction must be one of {', '.join(DIRECTIONS)}")
+        factors[str(name)] = {
+            "modifiable": _number(attrs.get("modifiable"), f"Factor {name} modifiable", 0, 10),
+            "baseline": _number(attrs.get("baseline"), f"Factor {name} baseline", 0, 1),
+            "description": str(attrs.get("description", name)),
+            "direction": direction
+        }
+    
+    target = data["target"]
+    if target not in factors:
+        raise ValueError(f"Model target {target} is not a factor")
+    
+    relationships = []
+    seen = set()
+    if not isinstance(data["relationships"], list):
+        raise ValueError("Model relationships must be a list")
+    for rel in data["relationships"]:
+        if not isinstance(rel, dict):
+            raise ValueError(f"Relationship {rel} must be a mapping")
+        source, destination = rel.get("from"), rel.get("to")
+        if source not in factors or destination not in factors:
+            raise ValueError(f"Relationship {source} -> {destination} names an unknown factor")
+        if (source, destination) in seen:
+            raise ValueError(f"Relationship {source} -> {destination} appears twice")
+        seen.add((source, destination))
+        weight = _number(rel.get("weight"), f"Relationship {source} -> {destination} weight")
+        relationships.append((source, destination, float(weight)))
+    
+    return FactorModel(str(data["name"]), str(data["version"]), target, factors, relationships, digest)
+
+
+def _decode(path: str, raw: bytes) -> Dict[str, Any]:
+    """Decode a JSON or YAML model file"""
+    if path.endswith(YAML_SUFFIXES):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError(f"Reading {path} requires PyYAML (pip install pyyaml)")
+        try:
+            return yaml.safe_load(raw)
+        except yaml.YAMLError as e:
+            raise ValueError(f"Could not parse model {path}: {e}")
+    try:
+        return json.loads(raw)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ValueError(f"Could not parse model {path}: {e}")
+
+
+def cache_path(path: str, cache_dir: Optional[str] = None) -> str:
+    """Where the compiled form of a model file is kept"""
+    directory = cache_dir or os.environ.get("NETWORK_MODEL_CACHE_DIR") or os.path.join(os.path.dirname(path), "__pycache__")
+    return os.path.join(directory, os.path.basename(path) + ".model-cache")
+
+
+def _read_cache(path: str, digest: str) -> Optional[FactorModel]:
+    """Load a compiled model if it was built from a file with this digest"""
+    try:
+        with open(path, "rb") as f:
+            # Plain JSON data, so a tampered cache cannot run code
+            cached = json.load(f)
+        if cached.get("format") != CACHE_FORMAT or cached.get("digest") != digest:
+            return None
+        name, version, target, factors, relationships = cached["model"]
+        return FactorModel(name, version, target, factors,
+                           [(source, destination, weight) for source, destination, weight in relationships],
+                           digest=digest)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable model cache {path}: {e}")
+        return None
+
+
+def _write_cache(path: str, model: FactorModel) -> None:
+    """Save a compiled model, atomically so concurrent workers never see half a file"""
+    payload = {
+        "format": CACHE_FORMAT,
+        "digest": model.digest,
+        "model": (model.name, model.version, model.target, model.factors, model.relationships)
+    }
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(temporary, path)
+    except OSError as e:
+        # A read-only deployment still works, it just parses the file each start
+        logger.warning(f"Could not write model cache {path}: {e}")
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+
+
+# Models already loaded in this process: path -> (file signature, model)
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def clear_loaded_models() -> None:
+    """Forget the models loaded in this process, so the next load reads the file or cache again"""
+    with _loaded_lock:
+        _loaded.clear()
+
+
+def load_model(path: Optional[str] = None, cache_dir: Optional[str] = None, use_cache: bool = True) -> FactorModel:
+    """
+    Load a factor graph model from a JSON or YAML file
+    
+    The parsed model is kept in a JSON cache next to the file (in
+    __pycache__, or NETWORK_MODEL_CACHE_DIR) and reused while the file's
+    contents are unchanged. Within a process, a model is only read again
+    when the file changes.
+    
+    Args:
+        path: Model file (defaults to NETWORK_MODEL, then the bundled obesity model)
+        cache_dir: Directory for the compiled cache
+        use_cache: Whether to read and write the compiled cache
+        
+    Returns:
+        FactorModel instance
+        
+    Raises:
+        OSError: If the file cannot be read
+        ValueError: If the file is not a valid model
+    """
+    path = os.path.abspath(path or os.environ.get("NETWORK_MODEL") or DEFAULT_MODEL_PATH)
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _loaded_lock:
+        loaded = _loaded.get(path)
+    if loaded is not None and loaded[0] == signature:
+        return loaded[1]
+    
+    with open(path, "rb") as f:
+        raw = f.read()
+    digest = hashlib.sha256(raw).hexdigest()
+    compiled = cache_path(path, cache_dir)
+    
+    model = _read_cache(compiled, digest) if use_cache else None
+    if model is None:
+        model = parse_model(_decode(path, raw), digest)
+        if use_cache:
+            _write_cache(compiled, model)
+    
+    with _loaded_lock:
+        _loaded[path] = (signature, model)
+    return model
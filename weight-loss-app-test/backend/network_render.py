@@ -0,0 +1,213 @@
+import io
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Optional, Sequence, Tuple, TYPE_CHECKING
+
+# Matplotlib and networkx are imported on first render, so importing this
+# module does not slow down server startup or grow every worker
+if TYPE_CHECKING:
+    import numpy as np
+    import networkx as nx
+
+# Formats GET /visualization can return, with their media types
+IMAGE_FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+
+# Default memory budget for rendered images
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+# Distinct topologies whose layouts are kept
+LAYOUT_CACHE_SIZE = 64
+
+FIGURE_SIZE = (10, 8)
+PNG_DPI = 80
+
+@lru_cache(maxsize=LAYOUT_CACHE_SIZE)
+def topology_layout(nodes: Tuple[str, ...], edges: Tuple[Tuple[str, str], ...]) -> Dict[str, "np.ndarray"]:
+    """
+    Node positions for a graph topology
+    
+    The spring layout ignores edge weights, so nodes stay put as a user's
+    weights change and one layout serves every user of a topology.
+    
+    Args:
+        nodes: Node names in graph order
+        edges: (source, target) pairs in graph order
+        
+    Returns:
+        Map of node names to 2D positions (shared; do not modify)
+    """
+    import networkx as nx
+    
+    graph = nx.DiGraph()
+    graph.add_nodes_from(nodes)
+    graph.add_edges_from(edges)
+    return nx.spring_layout(graph, weight=None, seed=42)
+
+def draw_network(ax, graph: "nx.DiGraph", potentials: Dict[str, float], highlighted: Sequence[str]) -> None:
+    """
+    Draw a factor network with node sizes showing intervention potential
+    
+    Args:
+        ax: Matplotlib axes to draw on
+        graph: Factor graph whose edges carry a "weight" attribute
+        potentials: Intervention potential of each factor
+        highlighted: Factors to highlight, e.g. the top recommendations
+    """
+    import networkx as nx
+    
+    pos = topology_layout(tuple(graph.nodes()), tuple(graph.edges()))
+    
+    # Node sizes based on intervention potential; the target node has none
+    node_sizes = {node: potentials.get(node, 0) * 1000 + 300 for node in graph.nodes()}
+    
+    # Edge widths based on weights
+    edge_widths = [graph[u][v]["weight"] * 2 for u, v in graph.edges()]
+    
+    nx.draw_networkx_nodes(graph, pos, node_size=list(node_sizes.values()), node_color="skyblue", ax=ax)
+    if highlighted:
+        nx.draw_networkx_nodes(graph, pos, nodelist=list(highlighted),
+                               node_size=[node_sizes[node] for node in highlighted],
+                               node_color="orange", ax=ax)
+    nx.draw_networkx_edges(graph, pos, width=edge_widths, edge_color="gray", alpha=0.7, ax=ax)
+    nx.draw_networkx_labels(graph, pos, font_size=10, ax=ax)
+    
+    ax.set_title("Obesity Factor Network")
+    ax.axis("off")
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header names the given ETag"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+class NetworkRenderer:
+    """
+    Renders network images off-screen, caching them by content
+    
+    Each image is keyed by a hash of the graph, its weights, the intervention
+    potentials and the highlighted factors, which also serves as its ETag.
+    Images are kept in least recently used order up to a byte budget. Figures
+    are created without pyplot, so none are left registered after rendering.
+    """
+    
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Initialize the renderer
+        
+        Args:
+            max_bytes: Memory budget for cached images
+        """
+        self.max_bytes = max_bytes
+        self._images = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Matplotlib's text and font caches are not thread-safe
+        self._render_lock = threading.Lock()
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    @staticmethod
+    def etag(state: Dict[str, Any], potentials: Dict[str, float], highlighted: Sequence[str], fmt: str) -> str:
+        """
+        Content hash of an image, quoted for use as an ETag
+        
+        Args:
+            state: Network state as returned by get_network_state
+            potentials: Intervention potential of each factor
+            highlighted: Factors to highlight
+            fmt: One of IMAGE_FORMATS
+            
+        Returns:
+            The quoted hash
+        """
+        digest = hashlib.sha256()
+        digest.update(json.dumps([
+            fmt,
+            list(state["factors"]),
+            [[rel["from"], rel["to"], rel["strength"]] for rel in state["relationships"]],
+            sorted(potentials.items()),
+            list(highlighted)
+        ]).encode("utf-8"))
+        return f'"{digest.hexdigest()[:32]}"'
+    
+    def _draw(self, state: Dict[str, Any], potentials: Dict[str, float], highlighted: Sequence[str],
+              fmt: str) -> bytes:
+        """Render an image without touching the cache"""
+        import networkx as nx
+        from matplotlib.figure import Figure
+        
+        graph = nx.DiGraph()
+        graph.add_nodes_from(state["factors"])
+        for rel in state["relationships"]:
+            graph.add_edge(rel["from"], rel["to"], weight=rel["strength"])
+        
+        fig = Figure(figsize=FIGURE_SIZE)
+        try:
+            draw_network(fig.add_subplot(), graph, potentials, highlighted)
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format=fmt, dpi=PNG_DPI)
+            return buffer.getvalue()
+        finally:
+            fig.clear()
+    
+    def render(self, state: Dict[str, Any], potentials: Dict[str, float], highlighted: Sequence[str],
+               fmt: str = "png") -> Tuple[bytes, str]:
+        """
+        Get an image of a network, rendering it only if not cached
+        
+        Args:
+            state: Network state as returned by get_network_state
+            potentials: Intervention potential of each factor
+            highlighted: Factors to highlight
+            fmt: One of IMAGE_FORMATS
+            
+        Returns:
+            The image bytes and their ETag
+            
+        Raises:
+            ValueError: If the format is not supported
+        """
+        if fmt not in IMAGE_FORMATS:
+            raise ValueError(f"Unsupported image format: {fmt} (expected one of {', '.join(IMAGE_FORMATS)})")
+        etag = self.etag(state, potentials, highlighted, fmt)
+        with self._lock:
+            image = self._images.get(etag)
+            if image is not None:
+                self._images.move_to_end(etag)
+                self.hits += 1
+                return image, etag
+            self.misses += 1
+        
+        with self._render_lock:
+            image = self._draw(state, potentials, highlighted, fmt)
+        
+        if len(image) <= self.max_bytes:
+            with self._lock:
+                if etag not in self._images:
+                    self._images[etag] = image
+                    self._bytes += len(image)
+                while self._bytes > self.max_bytes:
+                    _, evicted = self._images.popitem(last=False)
+                    self._bytes -= len(evicted)
+                    self.evictions += 1
+        return image, etag
+    
+    def stats(self) -> Dict[str, int]:
+        """Get cache counters for monitoring"""
+        layouts = topology_layout.cache_info()
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._images),
+                "bytes": self._bytes,
+                "layout_hits": layouts.hits,
+                "layout_misses": layouts.misses
+            }
@@ -0,0 +1,1052 @@
+import os
+import json
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Tuple, Optional, Any
+import numpy as np
+from simplified_obesity_network import (
+    SimpleObesityNetwork,
+    matrix_intervention_potential,
+    all_paths_intervention_potential,
+    batch_intervention_potential,
+    bayesian_factor_update,
+    bayesian_edge_update,
+    make_recommendation,
+    parse_update_batch,
+    FACTOR_PRIOR_CONFIDENCE,
+    MATERIALIZED_DEPTH,
+    pool_observations,
+)
+from network_model import FactorModel
+from simulation import simulate_interventions, DEFAULT_DRAWS
+
+logger = logging.getLogger("network-store")
+
+# Default number of user states kept in memory before spilling to disk
+DEFAULT_CAPACITY = 10000
+
+# Default confidence for edges in a fresh user state
+DEFAULT_EDGE_CONFIDENCE = 0.7
+
+# Significant decimal digits a float32 holds
+FLOAT32_DIGITS = 7
+
+# Spill files start with this marker and the fingerprint of the topology that wrote them
+SPILL_MAGIC = b"UNS\x01"
+
+# Locks that serialize work on each user's state (users share them by hash)
+USER_LOCK_STRIPES = 64
+
+# Users scored per stacked NumPy operation in batch scoring (bounds temporary memory)
+BATCH_CHUNK_SIZE = 4096
+
+# Cap on the dense matrices built per chunk; each user needs two n x n float64
+# matrices, so large models score fewer users per chunk
+BATCH_CHUNK_BYTES = 256 * 1024 * 1024
+
+
+def widen(values: np.ndarray) -> np.ndarray:
+    """
+    Convert float32 values to float64, rounded to the 7 significant digits
+    float32 carries, so a stored 0.6 reads back as 0.6 rather than 0.6000000238418579
+    
+    Args:
+        values: float32 array of any shape
+        
+    Returns:
+        float64 array of the same shape
+    """
+    wide = np.asarray(values, dtype=np.float64)
+    magnitude = np.abs(wide)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        exponent = np.where(magnitude > 0, np.floor(np.log10(magnitude)), 0.0)
+    exponent = np.where(np.isfinite(exponent), exponent, 0.0)
+    # Scale each value to a 7-digit integer, round, and scale back; both scalings
+    # are exact powers of ten, so the result is the double nearest that decimal
+    scale = 10.0 ** (FLOAT32_DIGITS - 1 - exponent)
+    return np.where(np.isfinite(wide), np.round(wide * scale) / scale, wide)
+
+
+class NetworkTopology:
+    """
+    Immutable description of the factor graph shared by every user.
+    
+    Per-user state only holds the numbers that can change (factor values, edge
+    weights and confidences); names, descriptions, modifiability and the edge
+    list live here once.
+    """
+    
+    def __init__(self, factors: Dict[str, Dict[str, Any]], relationships: List[Tuple[str, str, float]],
+                 target: str = "weight", model: Optional[FactorModel] = None):
+        """
+        Initialize the topology
+        
+        Args:
+            factors: Map of factor names to attributes (modifiable, baseline, description)
+            relationships: List of (source, target, default weight) edges
+            target: The factor every other factor is scored against
+            model: Model the factors came from, used to materialize full networks
+        """
+        self.model = model
+        self.factor_names = tuple(factors)
+        self.node_index = {factor: i for i, factor in enumerate(self.factor_names)}
+        self.descriptions = tuple(factors[f]["description"] for f in self.factor_names)
+        self.directions = tuple(factors[f].get("direction", "increase") for f in self.factor_names)
+        self.modifiable = tuple(factors[f]["modifiable"] for f in self.factor_names)
+        self.modifiability = np.array(self.modifiable, dtype=np.float64) / 10.0
+        self.baselines = np.array([factors[f]["baseline"] for f in self.factor_names], dtype=np.float32)
+        self.target = self.node_index[target]
+        
+        self.edges = tuple((source, target) for source, target, _ in relationships)
+        self.edge_index = {edge: k for k, edge in enumerate(self.edges)}
+        self.edge_sources = np.array([self.node_index[s] for s, _ in self.edges], dtype=np.intp)
+        self.edge_targets = np.array([self.node_index[t] for _, t in self.edges], dtype=np.intp)
+        self.default_weights = np.array([w for _, _, w in relationships], dtype=np.float32)
+        
+        for array in (self.modifiability, self.baselines, self.edge_sources,
+                      self.edge_targets, self.default_weights):
+            array.setflags(write=False)
+        
+        self.n_factors = len(self.factor_names)
+        self.n_edges = len(self.edges)
+        
+        # Identifies the model and its factor and edge order in stored states, so a
+        # state saved under another model is never applied to the wrong factors
+        name, version = (model.name, model.version) if model is not None else ("", "")
+        layout = json.dumps([name, version, self.factor_names, self.edges])
+        self.fingerprint = hashlib.sha256(layout.encode("utf-8")).digest()
+        
+        # Layout of a packed user state
+        self.factor_slice = slice(0, self.n_factors)
+        self.precision_slice = slice(self.n_factors, 2 * self.n_factors)
+        self.weight_slice = slice(2 * self.n_factors, 2 * self.n_factors + self.n_edges)
+        self.confidence_slice = slice(2 * self.n_factors + self.n_edges, 2 * self.n_factors + 2 * self.n_edges)
+    
+    @classmethod
+    def from_network(cls, network: SimpleObesityNetwork) -> 'NetworkTopology':
+        """
+        Build a topology from a network's factors and relationships
+        
+        Args:
+            network: Template network
+            
+        Returns:
+            NetworkTopology instance
+        """
+        return cls(network.factors, network.relationships, network.model.target, network.model)
+    
+    @property
+    def state_size(self) -> int:
+        """Number of floats in a packed user state"""
+        return 2 * self.n_factors + 2 * self.n_edges
+    
+    def unpack(self, data: np.ndarray, fingerprint: bytes) -> Optional[np.ndarray]:
+        """
+        Check a stored state's model and size
+        
+        Args:
+            data: Packed float32 state read from disk or the shared database
+            fingerprint: Fingerprint stored with the state
+            
+        Returns:
+            The state, or None if it was saved under another model or the size
+            does not match this topology
+        """
+        if fingerprint != self.fingerprint or data.size != self.state_size:
+            return None
+        return data
+    
+    def new_state(self) -> 'UserNetworkState':
+        """
+        Create a fresh user state at the baseline values and default weights
+        
+        Returns:
+            UserNetworkState instance
+        """
+        data = np.empty(self.state_size, dtype=np.float32)
+        data[self.factor_slice] = self.baselines
+        data[self.precision_slice] = FACTOR_PRIOR_CONFIDENCE
+        data[self.weight_slice] = self.default_weights
+        data[self.confidence_slice] = DEFAULT_EDGE_CONFIDENCE
+        return UserNetworkState(data)
+    
+    def factors_of(self, state: 'UserNetworkState') -> np.ndarray:
+        """View of the factor values in a state"""
+        return state.data[self.factor_slice]
+    
+    def precisions_of(self, state: 'UserNetworkState') -> np.ndarray:
+        """View of the factor precisions in a state"""
+        return state.data[self.precision_slice]
+    
+    def weights_of(self, state: 'UserNetworkState') -> np.ndarray:
+        """View of the edge weights in a state"""
+        return state.data[self.weight_slice]
+    
+    def confidences_of(self, state: 'UserNetworkState') -> np.ndarray:
+        """View of the edge confidences in a state"""
+        return state.data[self.confidence_slice]
+    
+    def weight_matrix(self, weights: np.ndarray) -> np.ndarray:
+        """
+        Expand an edge weight vector into a dense adjacency matrix
+        
+        Args:
+            weights: (n_edges,) edge weights in topology order
+            
+        Returns:
+            (n_factors, n_factors) float64 adjacency matrix
+        """
+        matrix = np.zeros((self.n_factors, self.n_factors))
+        matrix[self.edge_sources, self.edge_targets] = weights
+        return matrix
+
+
+def _top_n_indices(potentials: np.ndarray, n: int, target: int) -> np.ndarray:
+    """
+    Indices of the n highest potentials in each row, highest first
+    
+    Ties are broken by factor order, except that a partial selection on a wide
+    graph may pick either of two factors tied for the last place.
+    
+    Args:
+        potentials: (users, n_factors) potentials
+        n: Number of factors to keep per row
+        target: Index of the target node, which is never recommended
+        
+    Returns:
+        (users, n) array of factor indices
+    """
+    ranking = -potentials
+    ranking[:, target] = np.inf
+    if n * 4 < ranking.shape[1]:
+        # Partial selection, then order just the selected columns
+        selected = np.argpartition(ranking, n - 1, axis=1)[:, :n]
+        order = np.lexsort((selected, np.take_along_axis(ranking, selected, axis=1)))
+        return np.take_along_axis(selected, order, axis=1)
+    return np.argsort(ranking, axis=1, kind="stable")[:, :n]
+
+
+def batch_top_recommendations(topology: NetworkTopology, edge_weights: np.ndarray, n: int = 3,
+                              mode: str = "second_order",
+                              factor_values: Optional[np.ndarray] = None) -> List[Optional[List[Dict]]]:
+    """
+    Score many users' networks at once and return each user's top n recommendations
+    
+    Args:
+        topology: Shared factor graph
+        edge_weights: (users, n_edges) edge weights in topology edge order
+        n: Number of recommendations per user
+        mode: "second_order" or "all_paths"
+        factor_values: (users, n_factors) current factor values (baselines if None)
+        
+    Returns:
+        One list of recommendation dictionaries per user, or None for a user
+        whose all-paths effects do not converge
+        
+    Raises:
+        ValueError: If the arrays do not match the topology or the mode is unknown
+    """
+    edge_weights = np.asarray(edge_weights, dtype=np.float64)
+    if edge_weights.ndim != 2 or edge_weights.shape[1] != topology.n_edges:
+        raise ValueError(f"Expected edge weights of shape (users, {topology.n_edges})")
+    if factor_values is None:
+        factor_values = np.broadcast_to(widen(topology.baselines), (len(edge_weights), topology.n_factors))
+    elif np.shape(factor_values) != (len(edge_weights), topology.n_factors):
+        raise ValueError(f"Expected factor values of shape (users, {topology.n_factors})")
+    n = max(0, min(n, topology.n_factors - 1))
+    
+    chunk_size = max(1, min(BATCH_CHUNK_SIZE, BATCH_CHUNK_BYTES // (2 * 8 * topology.n_factors ** 2)))
+    
+    results = []
+    for start in range(0, len(edge_weights), chunk_size):
+        chunk = edge_weights[start:start + chunk_size]
+        matrices = np.zeros((len(chunk), topology.n_factors, topology.n_factors))
+        matrices[:, topology.edge_sources, topology.edge_targets] = chunk
+        potentials = batch_intervention_potential(matrices, topology.target, topology.modifiability, mode)
+        
+        top = _top_n_indices(potentials, n, topology.target) if n else np.zeros((len(chunk), 0), dtype=np.intp)
+        converged = ~np.isnan(potentials).any(axis=1)
+        for row in range(len(chunk)):
+            if not converged[row]:
+                results.append(None)
+                continue
+            values = factor_values[start + row]
+            results.append([
+                make_recommendation(
+                    topology.factor_names[i], topology.descriptions[i],
+                    float(potentials[row, i]), float(values[i]), topology.directions[i]
+                )
+                for i in top[row]
+            ])
+    return results
+
+
+class UserNetworkState:
+    """
+    Compact per-user network parameters: one packed float32 array holding the
+    factor values and precisions, edge weights and edge confidences (see NetworkTopology).
+    """
+    
+    __slots__ = ("data", "dirty", "rankings", "version")
+    
+    def __init__(self, data: np.ndarray, version: int = 0):
+        self.data = data
+        self.dirty = False
+        # Row version in the shared database (0 if never written)
+        self.version = version
+        # [potentials, top factor indices] per mode, only kept while the state is in memory
+        self.rankings = None
+
+
+class SharedStateDB:
+    """
+    SQLite (WAL mode) table of packed user states shared by every worker
+    process on a host. Each row carries a version that is bumped on every
+    write, so workers can tell whether their in-memory copy is stale.
+    """
+    
+    def __init__(self, path: str, timeout: float = 10.0):
+        """
+        Initialize the database
+        
+        Args:
+            path: Path of the SQLite file
+            timeout: Seconds to wait for another worker's write lock
+        """
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS network_states ("
+            "user_id TEXT PRIMARY KEY, version INTEGER NOT NULL, data BLOB NOT NULL, "
+            "model BLOB NOT NULL)"
+        )
+    
+    def _connection(self) -> sqlite3.Connection:
+        """Get this thread's connection, opening it on first use"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Autocommit mode; transactions are opened explicitly in transaction()
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+    
+    def load(self, user_id: str) -> Optional[Tuple[int, bytes, bytes]]:
+        """
+        Read a user's row
+        
+        Args:
+            user_id: The user's id
+            
+        Returns:
+            Tuple of (version, packed float32 bytes, model fingerprint), or None
+            if the user has no row
+        """
+        return self._connection().execute(
+            "SELECT version, data, model FROM network_states WHERE user_id = ?", (user_id,)
+        ).fetchone()
+    
+    def version(self, user_id: str) -> Optional[int]:
+        """
+        Read just a user's row version, to check a cached state without fetching it
+        
+        Args:
+            user_id: The user's id
+            
+        Returns:
+            The row version, or None if the user has no row
+        """
+        row = self._connection().execute(
+            "SELECT version FROM network_states WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return None if row is None else row[0]
+    
+    def save(self, user_id: str, version: int, data: np.ndarray, model: bytes) -> None:
+        """
+        Write a user's row (call inside transaction())
+        
+        Args:
+            user_id: The user's id
+            version: New row version
+            data: Packed float32 state
+            model: Fingerprint of the topology the state belongs to
+        """
+        self._connection().execute(
+            "INSERT OR REPLACE INTO network_states (user_id, version, data, model) VALUES (?, ?, ?, ?)",
+            (user_id, version, data.tobytes(), model)
+        )
+    
+    @contextmanager
+    def transaction(self):
+        """Hold the database write lock so a read-modify-write is atomic across workers"""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+
+class UserNetworkStore:
+    """
+    Per-user network states over a shared topology, held in a bounded LRU.
+    
+    Standalone, least recently used states are spilled to disk. With a
+    SharedStateDB, the database is authoritative: every write goes through it
+    and the LRU only caches states (and their rankings) while their version
+    is current, so all worker processes see the same values.
+    
+    Work on a user's state runs under that user's lock, which also covers its
+    spill file and database I/O; the store-wide lock only guards the LRU
+    bookkeeping, so users whose states are on disk do not hold up the others.
+    """
+    
+    def __init__(self, topology: NetworkTopology, capacity: int = DEFAULT_CAPACITY,
+                 spill_dir: Optional[str] = None, shared_db: Optional[SharedStateDB] = None,
+                 forgetting: float = 1.0):
+        """
+        Initialize the store
+        
+        Args:
+            topology: Shared factor graph
+            capacity: Maximum number of user states kept in memory
+            spill_dir: Directory for evicted states (evicted states are dropped if None)
+            shared_db: Database shared with other worker processes (spill_dir is unused if set)
+            forgetting: Fraction of a factor's precision kept at each update (below 1 forgets old evidence)
+            
+        Raises:
+            ValueError: If forgetting is not in (0, 1]
+        """
+        if not 0 < forgetting <= 1:
+            raise ValueError(f"forgetting must be in (0, 1], got {forgetting}")
+        self.topology = topology
+        self.capacity = capacity
+        self.forgetting = forgetting
+        self.shared_db = shared_db
+        self.spill_dir = spill_dir if shared_db is None else None
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+        
+        self._states = OrderedDict()
+        # Modified states evicted from the LRU, waiting to be written to their spill files
+        self._evicted = {}
+        # Guards _states, _evicted and the counters; never held across I/O
+        self._lock = threading.Lock()
+        self._user_locks = [threading.Lock() for _ in range(USER_LOCK_STRIPES)]
+        
+        self.spills = 0
+        self.loads = 0
+        self.ranking_hits = 0
+        self.ranking_misses = 0
+    
+    def _spill_path(self, user_id: str) -> str:
+        """Path of a user's spilled state (hashed so any user id is a safe file name)"""
+        digest = hashlib.sha1(user_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.spill_dir, f"{digest}.bin")
+    
+    @contextmanager
+    def _user(self, user_id: str):
+        """Hold a user's lock, then write out any states evicted meanwhile"""
+        try:
+            with self._user_locks[hash(user_id) % USER_LOCK_STRIPES]:
+                yield
+        finally:
+            self._spill_evicted()
+    
+    def _load(self, user_id: str) -> Optional[UserNetworkState]:
+        """Load a spilled state from disk, if there is one (caller holds the user's lock)"""
+        if not self.spill_dir:
+            return None
+        path = self._spill_path(user_id)
+        if not os.path.exists(path):
+            return None
+        
+        with open(path, "rb") as f:
+            raw = f.read()
+        data = None
+        if raw.startswith(SPILL_MAGIC):
+            header = len(SPILL_MAGIC) + len(self.topology.fingerprint)
+            fingerprint, raw = raw[len(SPILL_MAGIC):header], raw[header:]
+            data = self.topology.unpack(np.frombuffer(raw, dtype=np.float32).copy(), fingerprint)
+        if data is None:
+            logger.warning(f"Ignoring spilled state for {user_id}: saved under another model or of unexpected size")
+            return None
+        with self._lock:
+            self.loads += 1
+        return UserNetworkState(data)
+    
+    def _write(self, user_id: str, state: UserNetworkState) -> None:
+        """Atomically write a state to its spill file (caller holds the user's lock)"""
+        path = self._spill_path(user_id)
+        with open(path + ".tmp", "wb") as f:
+            f.write(SPILL_MAGIC + self.topology.fingerprint)
+            f.write(state.data.tobytes())
+        os.replace(path + ".tmp", path)
+        state.dirty = False
+    
+    def _evict(self) -> None:
+        """Evict least recently used states until the store is within capacity (caller holds _lock)"""
+        while len(self._states) > self.capacity:
+            user_id, state = self._states.popitem(last=False)
+            if state.dirty and self.spill_dir:
+                # Written by _spill_evicted once the lock is released
+                self._evicted[user_id] = state
+    
+    def _install(self, user_id: str, state: UserNetworkState) -> None:
+        """Make a state the user's most recently used one (caller holds _lock)"""
+        self._states[user_id] = state
+        self._states.move_to_end(user_id)
+        self._evict()
+    
+    def _spill_evicted(self) -> None:
+        """Write evicted modified states to disk, each under its user's lock (caller holds no lock)"""
+        while True:
+            with self._lock:
+                if not self._evicted:
+                    return
+                user_id, state = next(iter(self._evicted.items()))
+            with self._user_locks[hash(user_id) % USER_LOCK_STRIPES]:
+                with self._lock:
+                    # Another thread may have written it, or taken it back into the LRU
+                    if self._evicted.get(user_id) is not state:
+                        continue
+                self._write(user_id, state)
+                with self._lock:
+                    del self._evicted[user_id]
+                    self.spills += 1
+    
+    def _state(self, user_id: str) -> UserNetworkState:
+        """Get a user's state, loading or creating it as needed (caller holds the user's lock)"""
+        with self._lock:
+            state = self._states.get(user_id) or self._evicted.pop(user_id, None)
+            if state is not None:
+                self._install(user_id, state)
+        
+        if self.shared_db is not None:
+            # Another worker may have written since we cached this state
+            version = self.shared_db.version(user_id)
+            if version is not None and (state is None or state.version != version):
+                row = self.shared_db.load(user_id)
+                raw = np.frombuffer(row[1], dtype=np.float32).copy()
+                data = self.topology.unpack(raw, row[2])
+                if data is None:
+                    logger.warning(f"Ignoring shared state for {user_id}: saved under another model or of unexpected size")
+                    # Start afresh, but above the row's version so the next write replaces it
+                    data = self.topology.new_state().data
+                else:
+                    with self._lock:
+                        self.loads += 1
+                state = UserNetworkState(data, version=row[0])
+                with self._lock:
+                    self._install(user_id, state)
+        
+        if state is not None:
+            return state
+        
+        state = self._load(user_id) or self.topology.new_state()
+        with self._lock:
+            self._install(user_id, state)
+        return state
+    
+    def _changed(self, state: UserNetworkState, weights_changed: bool) -> None:
+        """Mark a state as modified, dropping rankings if the edge weights moved"""
+        state.dirty = True
+        if weights_changed:
+            state.rankings = None
+    
+    @contextmanager
+    def _mutate(self, user_id: str, weights_changed: bool):
+        """
+        Yield a user's latest state for modification and record the change
+        
+        With a shared database the whole read-modify-write runs inside one
+        database transaction, so concurrent Bayesian updates from different
+        workers are applied one after the other instead of overwriting each other.
+        
+        Args:
+            user_id: The user's id
+            weights_changed: Whether the change touches edge weights
+        """
+        with self._user(user_id):
+            if self.shared_db is None:
+                state = self._state(user_id)
+                yield state
+                self._changed(state, weights_changed)
+                with self._lock:
+                    if self._states.get(user_id) is not state and self.spill_dir:
+                        # Evicted while clean during the change; spill it now it is modified
+                        self._evicted[user_id] = state
+                return
+            
+            try:
+                with self.shared_db.transaction():
+                    state = self._state(user_id)
+                    yield state
+                    self._changed(state, weights_changed)
+                    self.shared_db.save(user_id, state.version + 1, state.data, self.topology.fingerprint)
+                state.version += 1
+                state.dirty = False
+            except BaseException:
+                # The in-memory copy may hold changes that never reached the database
+                with self._lock:
+                    self._states.pop(user_id, None)
+                raise
+    
+    def view(self, user_id: str) -> 'UserNetwork':
+        """
+        Get a network-like view of one user's state
+        
+        Args:
+            user_id: The user's id
+            
+        Returns:
+            UserNetwork bound to this store and user
+        """
+        return UserNetwork(self, user_id)
+    
+    def flush(self) -> None:
+        """Write every modified in-memory state to disk"""
+        if not self.spill_dir:
+            return
+        with self._lock:
+            states = list(self._states.items())
+        for user_id, state in states:
+            with self._user(user_id):
+                if state.dirty:
+                    self._write(user_id, state)
+        self._spill_evicted()
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get store counters for monitoring
+        
+        Returns:
+            Dict with memory usage, spill/load counts and ranking cache hits
+        """
+        with self._lock:
+            return {
+                "users_in_memory": len(self._states),
+                "shared": self.shared_db is not None,
+                "capacity": self.capacity,
+                "bytes_per_user": self.topology.state_size * 4,
+                "spills": self.spills,
+                "loads": self.loads,
+                "ranking_hits": self.ranking_hits,
+                "ranking_misses": self.ranking_misses
+            }
+    
+    def get_factors(self, user_id: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Get a user's factors in the same shape as SimpleObesityNetwork.factors
+        
+        Args:
+            user_id: The user's id
+            
+        Returns:
+            Map of factor names to attributes
+        """
+        topology = self.topology
+        baselines = widen(topology.baselines).tolist()
+        with self._user(user_id):
+            state = self._state(user_id)
+            values = widen(topology.factors_of(state)).tolist()
+            precisions = widen(topology.precisions_of(state)).tolist()
+            return {
+                factor: {
+                    "modifiable": topology.modifiable[i],
+                    "baseline": baselines[i],
+                    "current": values[i],
+                    "description": topology.descriptions[i],
+                    "direction": topology.directions[i],
+                    "precision": precisions[i]
+                }
+                for i, factor in enumerate(topology.factor_names)
+            }
+    
+    def update_factor(self, user_id: str, factor: str, value: float, confidence: float = 0.7) -> bool:
+        """
+        Update one of a user's factors using Bayesian updating
+        
+        Args:
+            user_id: The user's id
+            factor: The name of the factor to update
+            value: The new value (0-1 scale)
+            confidence: Confidence in this measurement (0-1)
+            
+        Returns:
+            bool: True if update was successful
+        """
+        i = self.topology.node_index.get(factor)
+        if i is None:
+            return False
+        
+        with self._mutate(user_id, weights_changed=False) as state:
+            values = self.topology.factors_of(state)
+            precisions = self.topology.precisions_of(state)
+            values[i], precisions[i] = bayesian_factor_update(
+                float(values[i]), float(precisions[i]), value, confidence, self.forgetting
+            )
+        return True
+    
+    def update_relationship(self, user_id: str, source: str, target: str, strength: float,
+                            confidence: float = 0.7) -> bool:
+        """
+        Update one of a user's relationships using Bayesian updating
+        
+        Args:
+            user_id: The user's id
+            source: Source factor
+            target: Target factor
+            strength: New relationship strength (0-1)
+            confidence: Confidence in this update
+            
+        Returns:
+            bool: True if update was successful
+        """
+        k = self.topology.edge_index.get((source, target))
+        if k is None:
+            return False
+        
+        with self._mutate(user_id, weights_changed=True) as state:
+            weights = self.topology.weights_of(state)
+            confidences = self.topology.confidences_of(state)
+            weights[k], confidences[k] = bayesian_edge_update(
+                float(weights[k]), float(confidences[k]), strength, confidence
+            )
+        return True
+    
+    def apply_updates(self, user_id: str, batch: Dict[str, Any]) -> Dict[str, int]:
+        """
+        Apply many factor and relationship updates to a user's state at once
+        
+        Same semantics as SimpleObesityNetwork.apply_updates; the whole batch is
+        applied under one lock (one transaction with a shared database).
+        
+        Args:
+            user_id: The user's id
+            batch: Dict with optional "factors" and "relationships" update lists
+            
+        Returns:
+            Dict with the number of factors and relationships updated
+            
+        Raises:
+            ValueError: If any factor or relationship does not exist
+        """
+        topology = self.topology
+        factors, values, confidences, edges, strengths, edge_confidences = parse_update_batch(
+            batch, topology.node_index, topology.edge_index
+        )
+        slots, pooled_values, pooled_confidences = pool_observations(
+            [topology.node_index[f] for f in factors], values, confidences, topology.n_factors
+        )
+        edge_slots, pooled_strengths, pooled_edge_confidences = pool_observations(
+            [topology.edge_index[e] for e in edges], strengths, edge_confidences, topology.n_edges
+        )
+        
+        with self._mutate(user_id, weights_changed=len(edge_slots) > 0) as state:
+            current = topology.factors_of(state)
+            precisions = topology.precisions_of(state)
+            current[slots], precisions[slots] = bayesian_factor_update(
+                current[slots].astype(np.float64), precisions[slots].astype(np.float64),
+                pooled_values, pooled_confidences, self.forgetting
+            )
+            weights = topology.weights_of(state)
+            edge_confidences = topology.confidences_of(state)
+            weights[edge_slots], edge_confidences[edge_slots] = bayesian_edge_update(
+                weights[edge_slots].astype(np.float64), edge_confidences[edge_slots].astype(np.float64),
+                pooled_strengths, pooled_edge_confidences
+            )
+        
+        return {"factors_updated": len(slots), "relationships_updated": len(edge_slots)}
+    
+    def _ranking(self, state: UserNetworkState, mode: str) -> List[Any]:
+        """
+        Get a state's potentials and materialized top factors for a mode (caller holds the user's lock)
+        
+        Returns:
+            [potentials, top] where potentials is the (n_factors,) array and top
+            holds the indices of the highest-potential factors, highest first
+        """
+        if state.rankings is not None and mode in state.rankings:
+            with self._lock:
+                self.ranking_hits += 1
+            return state.rankings[mode]
+        with self._lock:
+            self.ranking_misses += 1
+        
+        topology = self.topology
+        matrix = topology.weight_matrix(widen(topology.weights_of(state)))
+        if mode == "all_paths":
+            potentials = all_paths_intervention_potential(matrix, topology.target, topology.modifiability)
+        elif mode == "second_order":
+            potentials = matrix_intervention_potential(matrix, topology.target, topology.modifiability)
+        else:
+            raise ValueError(f"Unknown mode: {mode}")
+        
+        if state.rankings is None:
+            state.rankings = {}
+        state.rankings[mode] = ranking = [potentials, self._top(potentials, MATERIALIZED_DEPTH)]
+        return ranking
+    
+    def _top(self, potentials: np.ndarray, n: int) -> List[int]:
+        """Indices of the n highest potentials, by partial selection"""
+        n = min(n, self.topology.n_factors - 1)
+        if n <= 0:
+            return []
+        return _top_n_indices(potentials[None, :], n, self.topology.target)[0].tolist()
+    
+    def calculate_intervention_potential(self, user_id: str, mode: str = "second_order") -> Dict[str, float]:
+        """
+        Calculate a user's intervention potential for each factor
+        
+        Args:
+            user_id: The user's id
+            mode: "second_order" or "all_paths"
+            
+        Returns:
+            Dict mapping factor names to intervention potential scores
+        """
+        topology = self.topology
+        with self._user(user_id):
+            potentials = self._ranking(self._state(user_id), mode)[0].tolist()
+        return {f: potentials[i] for i, f in enumerate(topology.factor_names) if i != topology.target}
+    
+    def get_top_recommendations(self, user_id: str, n: int = 3, mode: str = "second_order") -> List[Dict]:
+        """
+        Get a user's top n recommendations based on intervention potential
+        
+        Args:
+            user_id: The user's id
+            n: Number of recommendations to return
+            mode: "second_order" or "all_paths"
+            
+        Returns:
+            List of recommendation dictionaries
+        """
+        topology = self.topology
+        with self._user(user_id):
+            state = self._state(user_id)
+            ranking = self._ranking(state, mode)
+            potentials, top = ranking
+            if len(top) < min(n, topology.n_factors - 1):
+                # Deeper than materialized: select again, and keep the deeper list
+                ranking[1] = top = self._top(potentials, n)
+            values = widen(topology.factors_of(state))
+            return [
+                make_recommendation(
+                    topology.factor_names[i], topology.descriptions[i], float(potentials[i]), float(values[i]),
+                    topology.directions[i]
+                )
+                for i in top[:max(n, 0)]
+            ]
+    
+    def get_network_state(self, user_id: str) -> Dict[str, Any]:
+        """
+        Get a user's network state in the SimpleObesityNetwork format
+        
+        Args:
+            user_id: The user's id
+            
+        Returns:
+            Dict containing the current state of the network
+        """
+        topology = self.topology
+        with self._user(user_id):
+            state = self._state(user_id)
+            values = widen(topology.factors_of(state)).tolist()
+            precisions = widen(topology.precisions_of(state)).tolist()
+            weights = widen(topology.weights_of(state)).tolist()
+            confidences = widen(topology.confidences_of(state)).tolist()
+            return {
+                "factors": {f: values[i] for i, f in enumerate(topology.factor_names)},
+                "precisions": {f: precisions[i] for i, f in enumerate(topology.factor_names)},
+                "relationships": [
+                    {
+                        "from": source,
+                        "to": target,
+                        "strength": weights[k],
+                        "confidence": confidences[k]
+                    }
+                    for k, (source, target) in enumerate(topology.edges)
+                ]
+            }
+    
+    def set_network_state(self, user_id: str, state: Dict[str, Any]) -> bool:
+        """
+        Set a user's network state from a saved state
+        
+        Args:
+            user_id: The user's id
+            state: Dict containing the network state
+            
+        Returns:
+            bool: True if update was successful
+        """
+        topology = self.topology
+        try:
+            with self._mutate(user_id, weights_changed=True) as current:
+                # Stage the changes on a copy so a bad entry leaves the state untouched
+                staged = UserNetworkState(current.data.copy())
+                values = topology.factors_of(staged)
+                precisions = topology.precisions_of(staged)
+                weights = topology.weights_of(staged)
+                confidences = topology.confidences_of(staged)
+                
+                for factor, value in state["factors"].items():
+                    i = topology.node_index.get(factor)
+                    if i is not None:
+                        values[i] = value
+                
+                for factor, precision in (state.get("precisions") or {}).items():
+                    i = topology.node_index.get(factor)
+                    if i is not None:
+                        precisions[i] = precision
+                
+                for rel in state["relationships"]:
+                    k = topology.edge_index.get((rel["from"], rel["to"]))
+                    if k is not None:
+                        weights[k] = rel["strength"]
+                        confidences[k] = rel.get("confidence", DEFAULT_EDGE_CONFIDENCE)
+                
+                current.data = staged.data
+            return True
+        except Exception as e:
+            logger.error(f"Error setting network state for {user_id}: {e}")
+            return False
+    
+    def batch_top_recommendations(self, user_ids: List[str], n: int = 3,
+                                  mode: str = "second_order") -> List[Optional[List[Dict]]]:
+        """
+        Get top n recommendations for many stored users in one vectorized pass
+        
+        Args:
+            user_ids: The users' ids
+            n: Number of recommendations per user
+            mode: "second_order" or "all_paths"
+            
+        Returns:
+            One list of recommendation dictionaries per user (None if all-paths does not converge)
+        """
+        topology = self.topology
+        states = np.empty((len(user_ids), topology.state_size), dtype=np.float32)
+        for row, user_id in enumerate(user_ids):
+            with self._user(user_id):
+                states[row] = self._state(user_id).data
+        
+        widened = widen(states)
+        return batch_top_recommendations(
+            topology,
+            widened[:, topology.weight_slice],
+            n, mode,
+            factor_values=widened[:, topology.factor_slice]
+        )
+    
+    def simulate(self, user_id: str, interventions: Dict[str, float], draws: int = DEFAULT_DRAWS,
+                 mode: str = "second_order", seed: Optional[int] = None, workers: int = 0) -> Dict[str, Any]:
+        """
+        Simulate a what-if intervention on a user's network (see simulation.simulate_interventions)
+        
+        Args:
+            user_id: The user's id
+            interventions: Map of factor names to the values they are set to (0-1)
+            draws: Number of Monte Carlo draws
+            mode: "second_order" or "all_paths"
+            seed: Seed for reproducible draws (random if None)
+            workers: Worker processes for large graphs
+            
+        Returns:
+            Simulation result dict
+            
+        Raises:
+            ValueError: If an intervention, the draw count or the mode is invalid
+        """
+        topology = self.topology
+        with self._user(user_id):
+            data = widen(self._state(user_id).data)
+        # The draws run outside the lock, on a snapshot of the user's state
+        return simulate_interventions(
+            topology.factor_names, topology.directions, data[topology.factor_slice], data[topology.weight_slice],
+            data[topology.confidence_slice], topology.edge_sources, topology.edge_targets,
+            topology.target, interventions, draws, mode, seed, workers
+        )
+    
+    def to_network(self, user_id: str) -> SimpleObesityNetwork:
+        """
+        Materialize a full SimpleObesityNetwork for a user (e.g. for visualization)
+        
+        Args:
+            user_id: The user's id
+            
+        Returns:
+            SimpleObesityNetwork instance holding the user's state
+        """
+        network = SimpleObesityNetwork(self.topology.model)
+        network.set_network_state(self.get_network_state(user_id))
+        return network
+
+
+class UserNetwork:
+    """
+    Network-like view of a single user's state in a UserNetworkStore, exposing
+    the same methods the API uses on SimpleObesityNetwork.
+    """
+    
+    __slots__ = ("store", "user_id")
+    
+    def __init__(self, store: UserNetworkStore, user_id: str):
+        self.store = store
+        self.user_id = user_id
+    
+    @property
+    def factors(self) -> Dict[str, Dict[str, Any]]:
+        return self.store.get_factors(self.user_id)
+    
+    def update_factor(self, factor: str, value: float, confidence: float = 0.7) -> bool:
+        return self.store.update_factor(self.user_id, factor, value, confidence)
+    
+    def update_relationship(self, source: str, target: str, strength: float, confidence: float = 0.7) -> bool:
+        return self.store.update_relationship(self.user_id, source, target, strength, confidence)
+    
+    def apply_updates(self, batch: Dict[str, Any]) -> Dict[str, int]:
+        return self.store.apply_updates(self.user_id, batch)
+    
+    def calculate_intervention_potential(self, mode: str = "second_order") -> Dict[str, float]:
+        return self.store.calculate_intervention_potential(self.user_id, mode)
+    
+    def get_top_recommendations(self, n: int = 3, mode: str = "second_order") -> List[Dict]:
+        return self.store.get_top_recommendations(self.user_id, n, mode)
+    
+    def get_network_state(self) -> Dict[str, Any]:
+        return self.store.get_network_state(self.user_id)
+    
+    def set_network_state(self, state: Dict[str, Any]) -> bool:
+        return self.store.set_network_state(self.user_id, state)
+    
+    def get_relationships(self) -> List[Dict[str, Any]]:
+        """
+        Get all relationships in the user's network
+        
+        Returns:
+            List of relationship dicts with from, to, weight and confidence
+        """
+        return [
+            {"from": rel["from"], "to": rel["to"], "weight": rel["strength"], "confidence": rel["confidence"]}
+            for rel in self.get_network_state()["relationships"]
+        ]
+    
+    def simulate(self, interventions: Dict[str, float], draws: int = DEFAULT_DRAWS, mode: str = "second_order",
+                 seed: Optional[int] = None, workers: int = 0) -> Dict[str, Any]:
+        return self.store.simulate(self.user_id, interventions, draws, mode, seed, workers)
+    
+    def to_network(self) -> SimpleObesityNetwork:
+        return self.store.to_network(self.user_id)
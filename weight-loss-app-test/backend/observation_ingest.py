@@ -0,0 +1,393 @@
+import asyncio
+import json
+import math
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Any, AsyncIterable, Awaitable, Callable, Dict, List, Optional
+
+# Length of one aggregation window in seconds (one day)
+DEFAULT_WINDOW = 86400
+
+# Factor updates per apply call, and batches buffered between the reader and the network
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_QUEUE_SIZE = 4
+
+# Longest NDJSON line accepted; longer lines are rejected without being buffered
+MAX_LINE_BYTES = 64 * 1024
+
+# Confidence given to factor values derived from device data
+DEVICE_CONFIDENCE = 0.8
+
+# Sleep hours that score 1.0, and the point past which oversleeping lowers the score
+SLEEP_TARGET_HOURS = 8.0
+SLEEP_EXCESS_HOURS = 9.0
+
+# Daily steps that score 1.0
+STEPS_TARGET = 10000
+
+# Deviation from a meal's usual time (seconds) at which meal_timing scores 0.0
+MEAL_TOLERANCE = 3 * 3600
+
+# Meals per window tracked for timing; later meals are ignored
+MAX_MEALS = 6
+
+# Weight given to the newest window when updating usual meal times
+MEAL_SMOOTHING = 0.3
+
+# Rejected lines reported back to the client
+MAX_REPORTED_ERRORS = 10
+
+def parse_timestamp(value: Any) -> float:
+    """
+    Parse an observation timestamp into Unix seconds
+    
+    Args:
+        value: Unix seconds, or an ISO 8601 string (naive times are taken as UTC)
+        
+    Returns:
+        Unix timestamp in seconds
+        
+    Raises:
+        ValueError: If the timestamp cannot be parsed
+    """
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    if isinstance(value, (int, float)):
+        if not math.isfinite(value):
+            raise ValueError(f"Invalid timestamp: {value!r}")
+        return float(value)
+    if isinstance(value, str):
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+    raise ValueError(f"Invalid timestamp: {value!r}")
+
+def sleep_score(hours: float) -> float:
+    """Map hours slept in a window to a sleep_quality value in [0, 1]"""
+    if hours > SLEEP_EXCESS_HOURS:
+        return max(0.0, 1.0 - (hours - SLEEP_EXCESS_HOURS) / 4.0)
+    return min(hours / SLEEP_TARGET_HOURS, 1.0)
+
+def steps_score(steps: float) -> float:
+    """Map steps taken in a window to a physical_activity value in [0, 1]"""
+    return min(steps / STEPS_TARGET, 1.0)
+
+class WindowedReducer(ABC):
+    """
+    Aggregates one observation type over tumbling time windows
+    
+    Only the open window is kept, so memory does not grow with the stream.
+    Observations must arrive in time order per type; ones that fall in an
+    already closed window are counted as late and skipped.
+    """
+    
+    factor = None
+    
+    def __init__(self, window: float = DEFAULT_WINDOW):
+        self.window = window
+        self.current = None
+        self.late = 0
+        self.reset()
+    
+    @abstractmethod
+    def reset(self):
+        """Clear the open window's accumulator"""
+    
+    @abstractmethod
+    def accumulate(self, offset: float, value: Optional[float]):
+        """Fold one observation into the open window"""
+    
+    @abstractmethod
+    def result(self) -> Optional[float]:
+        """Factor value for the open window, or None if it has none"""
+    
+    def add(self, timestamp: float, value: Optional[float]) -> Optional[Dict[str, Any]]:
+        """
+        Add an observation, closing the open window if the observation is past it
+        
+        Args:
+            timestamp: Unix timestamp of the observation
+            value: Observed value (None for events such as meals)
+            
+        Returns:
+            Factor update for the window that closed, or None
+        """
+        window_id = math.floor(timestamp / self.window)
+        update = None
+        if self.current is None:
+            self.current = window_id
+        elif window_id < self.current:
+            self.late += 1
+            return None
+        elif window_id > self.current:
+            update = self.close()
+            self.current = window_id
+        self.accumulate(timestamp - window_id * self.window, value)
+        return update
+    
+    def close(self) -> Optional[Dict[str, Any]]:
+        """
+        Close the open window
+        
+        Returns:
+            Factor update for the closed window, or None if it produced no value
+        """
+        value = self.result()
+        self.reset()
+        if value is None:
+            return None
+        return {"factor": self.factor, "value": value, "confidence": DEVICE_CONFIDENCE}
+
+class SleepReducer(WindowedReducer):
+    """Total hours slept per window, scored into sleep_quality"""
+    
+    factor = "sleep_quality"
+    
+    def reset(self):
+        self.hours = 0.0
+        self.count = 0
+    
+    def accumulate(self, offset: float, value: Optional[float]):
+        self.hours += value
+        self.count += 1
+    
+    def result(self) -> Optional[float]:
+        return sleep_score(self.hours) if self.count else None
+
+class StepsReducer(WindowedReducer):
+    """Total steps per window, scored into physical_activity"""
+    
+    factor = "physical_activity"
+    
+    def reset(self):
+        self.steps = 0.0
+        self.count = 0
+    
+    def accumulate(self, offset: float, value: Optional[float]):
+        self.steps += value
+        self.count += 1
+    
+    def result(self) -> Optional[float]:
+        return steps_score(self.steps) if self.count else None
+
+class MealTimingReducer(WindowedReducer):
+    """
+    Meal times per window, scored into meal_timing by how close each meal is
+    to the usual time of the same meal (first, second, ...) in earlier windows
+    
+    The first window of a stream only establishes the usual times.
+    """
+    
+    factor = "meal_timing"
+    
+    def __init__(self, window: float = DEFAULT_WINDOW):
+        self.usual = [None] * MAX_MEALS
+        super().__init__(window)
+    
+    def reset(self):
+        self.offsets = []
+    
+    def accumulate(self, offset: float, value: Optional[float]):
+        if len(self.offsets) < MAX_MEALS:
+            self.offsets.append(offset)
+    
+    def result(self) -> Optional[float]:
+        deviations = []
+        for i, offset in enumerate(sorted(self.offsets)):
+            usual = self.usual[i]
+            if usual is None:
+                self.usual[i] = offset
+                continue
+            deviations.append(abs(offset - usual))
+            self.usual[i] = usual + MEAL_SMOOTHING * (offset - usual)
+        if not deviations:
+            return None
+        return max(0.0, 1.0 - sum(deviations) / len(deviations) / MEAL_TOLERANCE)
+
+# Observation types accepted on the stream, and whether they carry a value
+REDUCERS = {
+    "sleep": (SleepReducer, True),
+    "steps": (StepsReducer, True),
+    "meal": (MealTimingReducer, False),
+}
+
+class ObservationAggregator:
+    """Routes timestamped observations to per-type windowed reducers"""
+    
+    def __init__(self, window: float = DEFAULT_WINDOW):
+        self.reducers = {kind: reducer(window) for kind, (reducer, _) in REDUCERS.items()}
+        self.observations = 0
+    
+    def add(self, observation: Any) -> Optional[Dict[str, Any]]:
+        """
+        Add one decoded observation
+        
+        Args:
+            observation: Dict with "type", "timestamp" and, for sleep and steps, a
+                non-negative "value" (hours slept or steps taken)
+                
+        Returns:
+            Factor update for a window the observation closed, or None
+            
+        Raises:
+            ValueError: If the observation is malformed
+        """
+        if not isinstance(observation, dict):
+            raise ValueError("Observation must be a JSON object")
+        kind = observation.get("type")
+        if kind not in REDUCERS:
+            raise ValueError(f"Unknown observation type: {kind!r}")
+        timestamp = parse_timestamp(observation.get("timestamp"))
+        value = None
+        if REDUCERS[kind][1]:
+            value = observation.get("value")
+            if isinstance(value, bool) or not isinstance(value, (int, float)) \
+                    or not math.isfinite(value) or value < 0:
+                raise ValueError(f"Invalid {kind} value: {value!r}")
+            value = float(value)
+        self.observations += 1
+        return self.reducers[kind].add(timestamp, value)
+    
+    def flush(self) -> List[Dict[str, Any]]:
+        """Close every open window and return their factor updates"""
+        updates = [reducer.close() for reducer in self.reducers.values()]
+        return [update for update in updates if update is not None]
+    
+    @property
+    def open_windows(self) -> int:
+        """Number of observation types with a window still open"""
+        return sum(reducer.current is not None for reducer in self.reducers.values())
+    
+    @property
+    def late(self) -> int:
+        return sum(reducer.late for reducer in self.reducers.values())
+
+async def iter_lines(chunks: AsyncIterable[bytes], max_line: int = MAX_LINE_BYTES):
+    """
+    Split a byte stream into lines with a bounded buffer
+    
+    Args:
+        chunks: Async iterable of byte chunks (e.g. Request.stream())
+        max_line: Longest line kept; longer lines are yielded as None
+        
+    Yields:
+        Each non-empty line as bytes, or None for an over-long line
+    """
+    buffer = bytearray()
+    overflow = False
+    async for chunk in chunks:
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            piece = chunk[start:] if end < 0 else chunk[start:end]
+            if not overflow:
+                buffer += piece
+                if len(buffer) > max_line:
+                    overflow = True
+                    buffer.clear()
+            if end < 0:
+                break
+            if overflow:
+                yield None
+            elif buffer.strip():
+                yield bytes(buffer)
+            buffer.clear()
+            overflow = False
+            start = end + 1
+    if overflow:
+        yield None
+    elif buffer.strip():
+        yield bytes(buffer)
+
+async def ingest_stream(chunks: AsyncIterable[bytes],
+                        apply_batch: Callable[[Dict[str, Any]], Awaitable[Any]],
+                        window: float = DEFAULT_WINDOW,
+                        batch_size: int = DEFAULT_BATCH_SIZE,
+                        queue_size: int = DEFAULT_QUEUE_SIZE,
+                        final: bool = False) -> Dict[str, Any]:
+    """
+    Aggregate an NDJSON observation stream into factor updates applied in batches
+    
+    Reading and applying run concurrently through a bounded queue: when the
+    network falls behind, the reader stops pulling from the stream, which
+    pushes back on the sender. Memory stays bounded by the line limit, the
+    queue size and the open windows.
+    
+    The windows still open when the stream ends are not applied, since a later
+    stream may carry more of the same day; pass final=True to close and apply
+    them when no more observations for them will arrive.
+    
+    Args:
+        chunks: Async iterable of NDJSON byte chunks
+        apply_batch: Coroutine applying one {"factors": [...]} batch to the network
+        window: Aggregation window in seconds
+        batch_size: Factor updates per batch
+        queue_size: Batches buffered before the reader waits
+        final: Whether to apply the windows still open at the end of the stream
+        
+    Returns:
+        Dict with counts of observations, late and rejected lines, updates and
+        batches applied, windows left open, and the first few rejection messages
+    """
+    aggregator = ObservationAggregator(window)
+    queue = asyncio.Queue(maxsize=queue_size)
+    summary = {"observations": 0, "late": 0, "rejected": 0, "updates": 0, "batches": 0, "errors": []}
+    
+    def reject(message: str):
+        summary["rejected"] += 1
+        if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+            summary["errors"].append(message)
+    
+    async def read():
+        pending = []
+        line_number = 0
+        try:
+            async for line in iter_lines(chunks):
+                line_number += 1
+                if line is None:
+                    reject(f"Line {line_number}: longer than {MAX_LINE_BYTES} bytes")
+                    continue
+                try:
+                    update = aggregator.add(json.loads(line))
+                except ValueError as e:
+                    reject(f"Line {line_number}: {e}")
+                    continue
+                if update is not None:
+                    pending.append(update)
+                    if len(pending) >= batch_size:
+                        await queue.put(pending)
+                        pending = []
+            if final:
+                pending.extend(aggregator.flush())
+            if pending:
+                await queue.put(pending)
+        except Exception:
+            # Wake the applier when the stream fails (a cancelled reader has no applier left to wake)
+            await queue.put(None)
+            raise
+        await queue.put(None)
+    
+    async def apply():
+        while True:
+            batch = await queue.get()
+            if batch is None:
+                return
+            await apply_batch({"factors": batch})
+            summary["updates"] += len(batch)
+            summary["batches"] += 1
+    
+    reader = asyncio.ensure_future(read())
+    try:
+        await apply()
+    except BaseException:
+        # The applier stopped early, so the reader may be blocked on a full queue
+        reader.cancel()
+        await asyncio.gather(reader, return_exceptions=True)
+        raise
+    await reader
+    
+    summary["observations"] = aggregator.observations
+    summary["late"] = aggregator.late
+    summary["open_windows"] = 0 if final else aggregator.open_windows
+    return summary
@@ -1,6 +1,7 @@
 import uvicorn
 import logging
 import os
+import importlib.util
 import sys
 from pathlib import Path
 
@@ -14,6 +15,9 @@ logging.basicConfig(
     ]
 )
 
+# Modules the server needs; they are found rather than imported, since each worker imports what it uses
+REQUIRED_MODULES = ["fastapi", "networkx", "numpy", "matplotlib"]
+
 logger = logging.getLogger("weight-management-production")
 
 def run_production_server():
@@ -21,17 +25,13 @@ def run_production_server():
     try:
         logger.info("Starting Weight Management API server in production mode...")
         
-        # Check if the required modules are installed
-        try:
-            import fastapi
-            import networkx
-            import numpy
-            import matplotlib
-            logger.info("All required modules are installed")
-        except ImportError as e:
-            logger.error(f"Missing required module: {e}")
+        # Check if the required modules are installed, without importing them here
+        missing = [name for name in REQUIRED_MODULES if importlib.util.find_spec(name) is None]
+        if missing:
+            logger.error(f"Missing required modules: {', '.join(missing)}")
             logger.error("Please install all required modules using: pip install -r requirements.txt")
             return
+        logger.info("All required modules are installed")
         
         # Check if ANTHROPIC_API_KEY is set
         if not os.environ.get("ANTHROPIC_API_KEY"):
@@ -40,6 +40,15 @@ def run_production_server():
         # Get port from environment variable or use default
         port = int(os.environ.get("PORT", 8000))
         
+        # One worker per core by default
+        workers = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 4))
+        
+        # Workers are separate processes, so network state and conversation memory must live in shared databases
+        os.environ.setdefault("NETWORK_STORE_DB", "network_store.db")
+        os.environ.setdefault("CONVERSATION_DB", "conversations.db")
+        logger.info(f"Sharing network state across {workers} workers via {os.environ['NETWORK_STORE_DB']}")
+        logger.info(f"Sharing conversation memory across {workers} workers via {os.environ['CONVERSATION_DB']}")
+        
         # Run the server
         uvicorn.run(
             "main:app",
@@ -47,7 +56,7 @@ def run_production_server():
             port=port,
             reload=False,  # Disable reload in production
             log_level="info",
-            workers=4  # Use multiple workers in production
+            workers=workers  # Use multiple workers in production
         )
     except Exception as e:
         logger.error(f"Error starting server: {e}")
@@ -2,6 +2,7 @@ import uvicorn
 import logging
 import sys
 import os
+import importlib.util
 from pathlib import Path
 
 # Configure logging
@@ -14,6 +15,9 @@ logging.basicConfig(
     ]
 )
 
+# Modules the server needs; they are found rather than imported, since each worker imports what it uses
+REQUIRED_MODULES = ["fastapi", "networkx", "numpy", "matplotlib"]
+
 logger = logging.getLogger("weight-management-server")
 
 def run_server():
@@ -21,17 +25,13 @@ def run_server():
     try:
         logger.info("Starting Weight Management API server...")
         
-        # Check if the required modules are installed
-        try:
-            import fastapi
-            import networkx
-            import numpy
-            import matplotlib
-            logger.info("All required modules are installed")
-        except ImportError as e:
-            logger.error(f"Missing required module: {e}")
+        # Check if the required modules are installed, without importing them here
+        missing = [name for name in REQUIRED_MODULES if importlib.util.find_spec(name) is None]
+        if missing:
+            logger.error(f"Missing required modules: {', '.join(missing)}")
             logger.error("Please install all required modules using: pip install -r requirements.txt")
             return
+        logger.info("All required modules are installed")
         
         # Run the server
         uvicorn.run(
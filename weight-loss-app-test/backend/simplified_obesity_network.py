@@ -1,59 +1,473 @@
-import networkx as nx
 import numpy as np
-import matplotlib.pyplot as plt
-from typing import Dict, List, Tuple, Optional, Any
+from typing import Dict, List, Tuple, Optional, Any, TYPE_CHECKING
 import json
+import heapq
+from bisect import bisect_left
+from network_core import FactorGraph
+from network_model import FactorModel, load_model
+from network_render import draw_network
+
+if TYPE_CHECKING:
+    import networkx as nx
+    from matplotlib.figure import Figure
+
+# Discounts applied to first- and second-order indirect paths
+FIRST_ORDER_DISCOUNT = 0.5
+SECOND_ORDER_DISCOUNT = 0.25
+
+# Per-hop discount for the all-paths mode (0.5 reproduces the first- and second-order terms)
+PATH_DISCOUNT = 0.5
+
+# The Neumann series only converges if the spectral radius stays below 1
+MAX_SPECTRAL_RADIUS = 0.99
+
+# Number of recommendations kept pre-sorted per mode (grows if a caller asks for more)
+MATERIALIZED_DEPTH = 10
+
+# Precision of a factor's value before any observation (also the default observation confidence)
+FACTOR_PRIOR_CONFIDENCE = 0.7
+
+# Confidence of an edge weight before any observation
+EDGE_PRIOR_CONFIDENCE = 0.7
+
+
+def bayesian_factor_update(prior, prior_precision, value, confidence, forgetting=1.0):
+    """
+    Merge an observation into a factor value (works on floats and NumPy arrays)
+    
+    Conjugate Gaussian update: the observation's confidence is its precision, and
+    the factor's precision accumulates across observations so repeated evidence
+    moves the estimate less and less. A forgetting factor below 1 decays the prior
+    precision before each merge, so old evidence fades and the estimate can track
+    slow changes.
+    
+    Args:
+        prior: Current factor value
+        prior_precision: Precision of the current value
+        value: Observed value (0-1 scale)
+        confidence: Confidence in the observation (0-1)
+        forgetting: Fraction of the prior precision kept (1.0 keeps all of it)
+        
+    Returns:
+        Tuple of (posterior value, posterior precision)
+    """
+    prior_precision = prior_precision * forgetting
+    posterior_precision = prior_precision + confidence
+    
+    # Precision-weighted average (Bayesian update); with no precision at all the prior is kept
+    if np.ndim(posterior_precision) == 0:
+        if posterior_precision <= 0:
+            return prior, posterior_precision
+        return (prior * prior_precision + value * confidence) / posterior_precision, posterior_precision
+    
+    informed = posterior_precision > 0
+    posterior = np.where(
+        informed,
+        (prior * prior_precision + value * confidence) / np.where(informed, posterior_precision, 1.0),
+        prior
+    )
+    return posterior, posterior_precision
+
+
+def bayesian_edge_update(prior_weight, prior_confidence, strength, confidence):
+    """
+    Merge an observed relationship strength into an edge (works on floats and NumPy arrays)
+    
+    Args:
+        prior_weight: Current edge weight
+        prior_confidence: Current edge confidence
+        strength: Observed relationship strength (0-1)
+        confidence: Confidence in the observation
+        
+    Returns:
+        Tuple of (posterior weight, posterior confidence)
+    """
+    # Weighted average based on confidence (Bayesian update)
+    posterior_weight = (prior_weight * prior_confidence + strength * confidence) / (prior_confidence + confidence)
+    
+    # Increase confidence with more data, but cap at 1.0
+    posterior_confidence = np.minimum(prior_confidence + confidence * 0.3, 1.0)
+    return posterior_weight, posterior_confidence
+
+
+def parse_update_batch(batch: Dict[str, Any], factor_names, edges) -> Tuple[list, np.ndarray, np.ndarray,
+                                                                         list, np.ndarray, np.ndarray]:
+    """
+    Validate a bulk update and split it into arrays
+    
+    Every name is checked before anything is returned, so a batch with one bad
+    entry can be rejected as a whole.
+    
+    Args:
+        batch: Dict with optional "factors" (factor, value, confidence) and
+            "relationships" (source, target, strength, confidence) lists
+        factor_names: Container of valid factor names
+        edges: Container of valid (source, target) pairs
+        
+    Returns:
+        Tuple of (factors, values, confidences, edges, strengths, edge confidences)
+        
+    Raises:
+        ValueError: If any factor or relationship does not exist
+    """
+    factor_updates = batch.get("factors") or []
+    edge_updates = batch.get("relationships") or []
+    
+    invalid = [u["factor"] for u in factor_updates if u["factor"] not in factor_names]
+    invalid += [f"{u['source']} -> {u['target']}" for u in edge_updates
+                if (u["source"], u["target"]) not in edges]
+    if invalid:
+        raise ValueError(f"Invalid factors or relationships: {', '.join(invalid)}")
+    
+    def confidence_of(update):
+        confidence = update.get("confidence")
+        return FACTOR_PRIOR_CONFIDENCE if confidence is None else confidence
+    
+    return (
+        [u["factor"] for u in factor_updates],
+        np.array([u["value"] for u in factor_updates], dtype=np.float64),
+        np.array([confidence_of(u) for u in factor_updates], dtype=np.float64),
+        [(u["source"], u["target"]) for u in edge_updates],
+        np.array([u["strength"] for u in edge_updates], dtype=np.float64),
+        np.array([confidence_of(u) for u in edge_updates], dtype=np.float64),
+    )
+
+
+def pool_observations(indices: np.ndarray, values: np.ndarray, confidences: np.ndarray,
+                      size: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Pool repeated observations of the same slot into one confidence-weighted observation
+    
+    Args:
+        indices: Slot index of each observation
+        values: Observed values
+        confidences: Confidence of each observation
+        size: Number of slots
+        
+    Returns:
+        Tuple of (slots, pooled values, pooled confidences) for every slot with
+        non-zero total confidence
+    """
+    indices = np.asarray(indices, dtype=np.intp)
+    total_confidence = np.bincount(indices, weights=confidences, minlength=size)
+    weighted_values = np.bincount(indices, weights=values * confidences, minlength=size)
+    
+    # A zero-confidence observation leaves the posterior unchanged, so it can be dropped
+    slots = np.flatnonzero(total_confidence > 0)
+    return slots, weighted_values[slots] / total_confidence[slots], total_confidence[slots]
+
+
+def make_recommendation(factor: str, description: str, potential: float, current_value: float,
+                        direction: str) -> Dict[str, Any]:
+    """
+    Build the recommendation dictionary for a factor
+    
+    Args:
+        factor: The factor to recommend
+        description: Human-readable description of the factor
+        potential: Its intervention potential
+        current_value: The factor's current value
+        direction: Way the factor improves, from the model ("increase" or "decrease")
+        
+    Returns:
+        Recommendation dictionary
+    """
+    return {
+        "factor": factor,
+        "description": description,
+        "potential": potential,
+        "current_value": current_value,
+        "direction": direction,
+        "confidence": min(0.5 + potential, 0.9)  # Higher potential = higher confidence
+    }
+
+
+def matrix_intervention_potential(weights: np.ndarray, target: int, modifiability: np.ndarray) -> np.ndarray:
+    """
+    Compute intervention potentials for all factors at once from a weighted adjacency matrix
+    
+    Equivalent to walking every direct, first-order and second-order path into the
+    target node, but expressed as matrix-vector products.
+    
+    Args:
+        weights: (n, n) adjacency matrix, weights[i, j] is the strength of edge i -> j
+        target: Index of the target node (weight)
+        modifiability: (n,) modifiability of each factor on a 0-1 scale
+        
+    Returns:
+        (n,) array of intervention potentials (the target's own entry is 0)
+    """
+    # Direct effect of every factor on the target
+    direct = weights[:, target]
+    
+    # Paths may not pass through the target, so drop it as an intermediate
+    through = weights.copy()
+    through[:, target] = 0.0
+    
+    first_order = through @ direct
+    second_order = through @ first_order
+    
+    total = direct + FIRST_ORDER_DISCOUNT * first_order + SECOND_ORDER_DISCOUNT * second_order
+    potentials = total * modifiability
+    potentials[target] = 0.0
+    return potentials
+
+
+def all_paths_intervention_potential(weights: np.ndarray, target: int, modifiability: np.ndarray,
+                                     discount: float = PATH_DISCOUNT) -> np.ndarray:
+    """
+    Compute intervention potentials over paths of every length into the target node
+    
+    A path with k intermediate nodes is discounted by discount**k, so the total effect
+    is the Neumann series sum_k (discount * W)^k w = (I - discount * W)^-1 w, where W
+    excludes the target as an intermediate and w is the target's weight column.
+    
+    Args:
+        weights: (n, n) adjacency matrix, weights[i, j] is the strength of edge i -> j
+        target: Index of the target node (weight)
+        modifiability: (n,) modifiability of each factor on a 0-1 scale
+        discount: Per-hop discount applied to indirect paths
+        
+    Returns:
+        (n,) array of intervention potentials (the target's own entry is 0)
+        
+    Raises:
+        ValueError: If cycles in the graph are too strong for the series to converge
+    """
+    direct = weights[:, target]
+    through = weights.copy()
+    through[:, target] = 0.0
+    through *= discount
+    
+    # Cycles (e.g. stress_level <-> sleep_quality) must decay for the series to converge
+    spectral_radius = float(np.max(np.abs(np.linalg.eigvals(through)))) if len(through) else 0.0
+    if spectral_radius >= MAX_SPECTRAL_RADIUS:
+        raise ValueError(
+            f"Path effects do not converge (spectral radius {spectral_radius:.3f}); "
+            f"lower the path discount"
+        )
+    
+    total = np.linalg.solve(np.eye(len(through)) - through, direct)
+    potentials = total * modifiability
+    potentials[target] = 0.0
+    return potentials
+
+
+def batch_intervention_potential(weights: np.ndarray, target: int, modifiability: np.ndarray,
+                                 mode: str = "second_order", discount: float = PATH_DISCOUNT) -> np.ndarray:
+    """
+    Compute intervention potentials for a stack of networks in one pass
+    
+    Same scores as matrix_intervention_potential / all_paths_intervention_potential
+    applied to each network separately.
+    
+    Args:
+        weights: (users, n, n) stack of adjacency matrices
+        target: Index of the target node (weight)
+        modifiability: (n,) modifiability of each factor on a 0-1 scale
+        mode: "second_order" or "all_paths"
+        discount: Per-hop discount for the all-paths mode
+        
+    Returns:
+        (users, n) array of intervention potentials. In all-paths mode, rows for
+        networks whose path effects do not converge are NaN.
+    """
+    direct = weights[:, :, target]
+    through = weights.copy()
+    through[:, :, target] = 0.0
+    
+    if mode == "second_order":
+        first_order = np.einsum("uij,uj->ui", through, direct)
+        second_order = np.einsum("uij,uj->ui", through, first_order)
+        total = direct + FIRST_ORDER_DISCOUNT * first_order + SECOND_ORDER_DISCOUNT * second_order
+    elif mode == "all_paths":
+        through *= discount
+        total = np.full(direct.shape, np.nan)
+        if len(through):
+            spectral_radius = np.max(np.abs(np.linalg.eigvals(through)), axis=1)
+            converges = spectral_radius < MAX_SPECTRAL_RADIUS
+            identity = np.eye(through.shape[1])
+            total[converges] = np.linalg.solve(
+                identity - through[converges], direct[converges][:, :, None]
+            )[:, :, 0]
+    else:
+        raise ValueError(f"Unknown mode: {mode}")
+    
+    potentials = total * modifiability
+    potentials[:, target] = 0.0
+    return potentials
+
 
 class SimpleObesityNetwork:
     """
-    A simplified obesity factor network with 10 key nodes.
+    An obesity factor network defined by a model file (by default the
+    bundled 10-factor model, see network_model.py).
     Implements Bayesian updates for network parameters and generates
     recommendations based on intervention potential.
     """
     
-    def __init__(self):
-        # Initialize the directed graph
-        self.G = nx.DiGraph()
-        
-        # Define the 10 key factors (nodes)
-        self.factors = {
-            "caloric_intake": {"modifiable": 10, "baseline": 0.7, "current": 0.7, "description": "Daily caloric intake"},
-            "physical_activity": {"modifiable": 9, "baseline": 0.5, "current": 0.5, "description": "Level of physical activity"},
-            "sleep_quality": {"modifiable": 7, "baseline": 0.6, "current": 0.6, "description": "Quality and duration of sleep"},
-            "stress_level": {"modifiable": 6, "baseline": 0.6, "current": 0.6, "description": "Level of stress (lower is better)"},
-            "meal_timing": {"modifiable": 8, "baseline": 0.5, "current": 0.5, "description": "Consistency of meal timing"},
-            "metabolism": {"modifiable": 2, "baseline": 0.5, "current": 0.5, "description": "Metabolic rate"},
-            "hunger_hormones": {"modifiable": 3, "baseline": 0.5, "current": 0.5, "description": "Regulation of hunger hormones"},
-            "weight": {"modifiable": 0, "baseline": 0.5, "current": 0.5, "description": "Current weight (target node)"},
-            "food_environment": {"modifiable": 5, "baseline": 0.6, "current": 0.6, "description": "Access to healthy food options"},
-            "social_support": {"modifiable": 4, "baseline": 0.4, "current": 0.4, "description": "Support from friends and family"}
+    def __init__(self, model: Optional[FactorModel] = None):
+        """
+        Initialize the network at the model's baselines and default weights
+        
+        Args:
+            model: Factors and relationships to use (defaults to load_model())
+        """
+        self.model = model if model is not None else load_model()
+        
+        # Fraction of a factor's precision kept at each update (below 1 forgets old evidence)
+        self.forgetting = 1.0
+        
+        # Relationships (edges) with default weights representing strength of influence
+        self.relationships = list(self.model.relationships)
+        
+        # Factor values and edge weights live in the graph's index-addressed arrays;
+        # a networkx graph is only built when one is asked for (to_networkx)
+        self.graph = FactorGraph(self.model.factors, self.relationships, FACTOR_PRIOR_CONFIDENCE, EDGE_PRIOR_CONFIDENCE)
+        self.node_index = self.graph.node_index
+        self.edge_index = self.graph.edge_index
+        # The node every other factor is scored against
+        self.target = self.node_index[self.model.target]
+        
+        # Memoized potentials per mode, cleared whenever an input changes
+        self._potential_cache = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        
+        # Materialized, pre-sorted recommendation dicts per mode, refreshed on write
+        self._recommendations = {}
+        self._recommendation_depth = {}
+    
+    @property
+    def factors(self) -> Dict[str, Dict[str, Any]]:
+        """Map of factor names to attributes (modifiable, baseline, current, description, direction, precision)"""
+        values = self.graph.values.tolist()
+        precisions = self.graph.precisions.tolist()
+        return {
+            node.name: {
+                "modifiable": node.modifiable,
+                "baseline": node.baseline,
+                "current": values[node.index],
+                "description": node.description,
+                "direction": node.direction,
+                "precision": precisions[node.index]
+            }
+            for node in self.graph.nodes
         }
+    
+    @property
+    def weight_matrix(self) -> np.ndarray:
+        """Dense (n, n) adjacency matrix of the current edge weights"""
+        return self.graph.weight_matrix()
+    
+    @property
+    def modifiability(self) -> np.ndarray:
+        """(n,) modifiability of each factor on a 0-1 scale"""
+        return self.graph.modifiability
+    
+    def _invalidate_cache(self) -> Dict[str, Dict[str, float]]:
+        """
+        Drop memoized potentials after an edge weight or modifiability change
         
-        # Add nodes to the graph
-        for factor, attrs in self.factors.items():
-            self.G.add_node(factor, **attrs)
-        
-        # Define the relationships (edges) with weights representing strength of influence
-        self.relationships = [
-            ("caloric_intake", "weight", 0.8),
-            ("physical_activity", "weight", 0.7),
-            ("physical_activity", "metabolism", 0.5),
-            ("sleep_quality", "hunger_hormones", 0.6),
-            ("sleep_quality", "stress_level", 0.5),
-            ("stress_level", "caloric_intake", 0.4),
-            ("stress_level", "sleep_quality", 0.6),
-            ("meal_timing", "hunger_hormones", 0.5),
-            ("meal_timing", "metabolism", 0.3),
-            ("metabolism", "weight", 0.6),
-            ("hunger_hormones", "caloric_intake", 0.7),
-            ("food_environment", "caloric_intake", 0.6),
-            ("social_support", "stress_level", 0.5),
-            ("social_support", "physical_activity", 0.4)
-        ]
+        Returns:
+            The potentials that were cached before invalidation, keyed by mode
+        """
+        previous = dict(self._potential_cache)
+        self._potential_cache.clear()
+        return previous
+    
+    def _rank_key(self, factor: str, potential: float) -> Tuple[float, int]:
+        """Sort key for recommendations: highest potential first, ties in factor order"""
+        return (-potential, self.node_index[factor])
+    
+    def _build_recommendation(self, factor: str, potential: float) -> Dict[str, Any]:
+        """Build the recommendation dictionary for a factor from its current attributes"""
+        i = self.node_index[factor]
+        node = self.graph.nodes[i]
+        return make_recommendation(factor, node.description, potential, float(self.graph.values[i]), node.direction)
+    
+    def _rerank(self, mode: str, depth: int) -> None:
+        """
+        Rebuild the materialized recommendations for a mode with a partial selection
+        
+        Args:
+            mode: Path mode to rank
+            depth: Number of recommendations to keep
+        """
+        potentials = self.calculate_intervention_potential(mode=mode)
+        top = heapq.nsmallest(depth, potentials.items(), key=lambda item: self._rank_key(*item))
+        self._recommendations[mode] = [self._build_recommendation(f, p) for f, p in top]
+        self._recommendation_depth[mode] = depth
+    
+    def _patch_current_value(self, factor: str, value: float) -> None:
+        """Keep current_value in the materialized recommendations in sync with a factor"""
+        for recommendations in self._recommendations.values():
+            for recommendation in recommendations:
+                if recommendation["factor"] == factor:
+                    recommendation["current_value"] = value
+    
+    def _refresh_recommendations(self, previous: Dict[str, Dict[str, float]]) -> None:
+        """
+        Patch the materialized recommendations after potentials changed
+        
+        Only factors whose potential changed are removed and re-inserted. A full
+        (partial-selection) re-rank is needed only when an entry drops out of the
+        list and an unlisted factor might take its place.
+        
+        Args:
+            previous: Potentials per mode from before the change
+        """
+        for mode in list(self._recommendations):
+            depth = self._recommendation_depth[mode]
+            try:
+                potentials = self.calculate_intervention_potential(mode=mode)
+            except ValueError:
+                # e.g. all-paths no longer converges; surface the error on the next read
+                del self._recommendations[mode]
+                continue
+            
+            old_potentials = previous.get(mode)
+            if old_potentials is None:
+                self._rerank(mode, depth)
+                continue
+            
+            changed = [f for f, p in potentials.items() if p != old_potentials[f]]
+            if not changed:
+                continue
+            
+            recommendations = self._recommendations[mode]
+            changed_set = set(changed)
+            kept = [r for r in recommendations if r["factor"] not in changed_set]
+            keys = [self._rank_key(r["factor"], r["potential"]) for r in kept]
+            for factor in changed:
+                key = self._rank_key(factor, potentials[factor])
+                position = bisect_left(keys, key)
+                keys.insert(position, key)
+                kept.insert(position, self._build_recommendation(factor, potentials[factor]))
+            
+            # Unlisted factors all rank below the previous last entry, so the patched
+            # list is exact up to that entry
+            if len(recommendations) < len(potentials):
+                last_key = self._rank_key(recommendations[-1]["factor"], recommendations[-1]["potential"])
+                if bisect_left(keys, last_key) + (last_key in keys) < depth:
+                    self._rerank(mode, depth)
+                    continue
+            
+            self._recommendations[mode] = kept[:depth]
+    
+    def cache_stats(self) -> Dict[str, float]:
+        """
+        Get hit/miss counters for the potential cache and materialized recommendations
         
-        # Add edges to the graph
-        for source, target, weight in self.relationships:
-            self.G.add_edge(source, target, weight=weight, confidence=0.7)
+        Returns:
+            Dict with hits, misses and hit rate
+        """
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "hit_rate": self.cache_hits / lookups if lookups else 0.0
+        }
     
     def update_factor(self, factor: str, value: float, confidence: float = 0.7) -> bool:
         """
@@ -67,19 +481,19 @@ class SimpleObesityNetwork:
         Returns:
             bool: True if update was successful
         """
-        if factor not in self.factors:
+        i = self.node_index.get(factor)
+        if i is None:
             return False
         
         # Bayesian update
-        prior = self.factors[factor]["current"]
-        prior_confidence = 0.7  # Default prior confidence
-        
-        # Weighted average based on confidence (Bayesian update)
-        posterior = (prior * prior_confidence + value * confidence) / (prior_confidence + confidence)
+        graph = self.graph
+        posterior, posterior_precision = bayesian_factor_update(
+            graph.values[i], graph.precisions[i], value, confidence, self.forgetting
+        )
         
-        # Update both the factors dictionary and the graph node
-        self.factors[factor]["current"] = posterior
-        self.G.nodes[factor]["current"] = posterior
+        graph.values[i] = posterior
+        graph.precisions[i] = posterior_precision
+        self._patch_current_value(factor, float(graph.values[i]))
         
         return True
     
@@ -96,113 +510,216 @@ class SimpleObesityNetwork:
         Returns:
             bool: True if update was successful
         """
-        if not self.G.has_edge(source, target):
+        k = self.graph.edge(source, target)
+        if k is None:
             return False
         
         # Bayesian update for edge weight
-        prior_weight = self.G[source][target]["weight"]
-        prior_confidence = self.G[source][target]["confidence"]
+        graph = self.graph
+        posterior_weight, posterior_confidence = bayesian_edge_update(
+            graph.weights[k], graph.confidences[k], strength, confidence
+        )
         
-        # Weighted average based on confidence (Bayesian update)
-        posterior_weight = (prior_weight * prior_confidence + strength * confidence) / (prior_confidence + confidence)
+        # Update the edge attributes
+        graph.weights[k] = posterior_weight
+        graph.confidences[k] = posterior_confidence
+        self._refresh_recommendations(self._invalidate_cache())
         
-        # Increase confidence with more data, but cap at 1.0
-        posterior_confidence = min(prior_confidence + confidence * 0.3, 1.0)
+        return True
+    
+    def apply_updates(self, batch: Dict[str, Any]) -> Dict[str, int]:
+        """
+        Apply many factor and relationship updates at once
         
-        # Update the edge attributes
-        self.G[source][target]["weight"] = posterior_weight
-        self.G[source][target]["confidence"] = posterior_confidence
+        All names are validated before anything changes. Observations of the same
+        factor or relationship within the batch are pooled into one
+        confidence-weighted observation, then every posterior is computed in a
+        single vectorized pass with the same formulas as update_factor and
+        update_relationship. For factors, pooling gives the same result as
+        applying the observations one by one, except that forgetting is applied
+        once per batch rather than once per observation.
+        
+        Args:
+            batch: Dict with optional "factors" (factor, value, confidence) and
+                "relationships" (source, target, strength, confidence) lists
+                
+        Returns:
+            Dict with the number of factors and relationships updated
+            
+        Raises:
+            ValueError: If any factor or relationship does not exist
+        """
+        factors, values, confidences, edges, strengths, edge_confidences = parse_update_batch(
+            batch, self.node_index, self.edge_index
+        )
+        
+        graph = self.graph
+        
+        # Factors
+        slots, pooled_values, pooled_confidences = pool_observations(
+            [self.node_index[f] for f in factors], values, confidences, graph.n_nodes
+        )
+        graph.values[slots], graph.precisions[slots] = bayesian_factor_update(
+            graph.values[slots], graph.precisions[slots], pooled_values, pooled_confidences, self.forgetting
+        )
+        for i, posterior in zip(slots.tolist(), graph.values[slots].tolist()):
+            self._patch_current_value(graph.nodes[i].name, posterior)
+        
+        # Relationships
+        edge_slots, pooled_strengths, pooled_edge_confidences = pool_observations(
+            [self.edge_index[e] for e in edges], strengths, edge_confidences, graph.n_edges
+        )
+        if len(edge_slots):
+            graph.weights[edge_slots], graph.confidences[edge_slots] = bayesian_edge_update(
+                graph.weights[edge_slots], graph.confidences[edge_slots],
+                pooled_strengths, pooled_edge_confidences
+            )
+            self._refresh_recommendations(self._invalidate_cache())
+        
+        return {"factors_updated": len(slots), "relationships_updated": len(edge_slots)}
+    
+    def update_modifiability(self, factor: str, modifiable: float) -> bool:
+        """
+        Update how modifiable a factor is
+        
+        Args:
+            factor: The name of the factor to update
+            modifiable: Modifiability on a 0-10 scale
+            
+        Returns:
+            bool: True if update was successful
+        """
+        i = self.node_index.get(factor)
+        if i is None:
+            return False
+        
+        self.graph.set_modifiable(i, modifiable)
+        self._refresh_recommendations(self._invalidate_cache())
         
         return True
     
-    def calculate_intervention_potential(self) -> Dict[str, float]:
+    def calculate_intervention_potential(self, engine: str = "matrix",
+                                         mode: str = "second_order") -> Dict[str, float]:
         """
         Calculate the potential impact of intervening on each factor
         
+        Args:
+            engine: "matrix" for the vectorized engine, "loop" for the path-walking reference
+            mode: "second_order" to stop at two intermediate nodes, "all_paths" to include
+                discounted paths of every length
+            
+        Returns:
+            Dict mapping factor names to intervention potential scores
+            
+        Raises:
+            ValueError: If the engine or mode is unknown, or all-paths effects do not converge
+        """
+        if mode not in ("second_order", "all_paths"):
+            raise ValueError(f"Unknown mode: {mode}")
+        if engine == "loop":
+            if mode != "second_order":
+                raise ValueError("The loop engine only supports second_order mode")
+            return self._loop_intervention_potential()
+        if engine != "matrix":
+            raise ValueError(f"Unknown engine: {engine}")
+        
+        if mode in self._potential_cache:
+            self.cache_hits += 1
+            return dict(self._potential_cache[mode])
+        self.cache_misses += 1
+        
+        weights = self.graph.weight_matrix()
+        modifiability = self.graph.modifiability
+        if mode == "all_paths":
+            potentials = all_paths_intervention_potential(weights, self.target, modifiability)
+        else:
+            potentials = matrix_intervention_potential(weights, self.target, modifiability)
+        values = potentials.tolist()
+        self._potential_cache[mode] = {
+            factor: values[i]
+            for factor, i in self.node_index.items()
+            if i != self.target
+        }
+        return dict(self._potential_cache[mode])
+    
+    def _loop_intervention_potential(self) -> Dict[str, float]:
+        """
+        Reference implementation that walks the graph path by path
+        
         Returns:
             Dict mapping factor names to intervention potential scores
         """
+        graph = self.graph
+        target = self.target
+        weights = graph.weights.tolist()
+        edge_targets = graph.edge_targets.tolist()
+        
+        # Weight of each factor's edge into the target, for factors that have one
+        into_target = {
+            source: weights[k] for k, source in enumerate(graph.edge_sources.tolist())
+            if edge_targets[k] == target
+        }
+        
         intervention_potentials = {}
         
-        for factor in self.factors:
-            # Skip the target node (weight)
-            if factor == "weight":
+        for node in graph.nodes:
+            # Skip the target node
+            if node.index == target:
                 continue
             
-            # Direct effect on weight (if any)
-            direct_effect = 0
-            if self.G.has_edge(factor, "weight"):
-                direct_effect = self.G[factor]["weight"]["weight"]
+            # Direct effect on the target (if any)
+            direct_effect = into_target.get(node.index, 0)
             
             # First-order indirect effects
             indirect_effect = 0
-            for intermediate in self.G.successors(factor):
-                if intermediate != "weight" and self.G.has_edge(intermediate, "weight"):
+            for k in graph.successors(node.index).tolist():
+                intermediate = edge_targets[k]
+                if intermediate != target and intermediate in into_target:
                     # The effect through this path is the product of the weights
-                    path_effect = self.G[factor][intermediate]["weight"] * self.G[intermediate]["weight"]["weight"]
-                    indirect_effect += path_effect
+                    indirect_effect += weights[k] * into_target[intermediate]
             
             # Second-order indirect effects (through two intermediate nodes)
             second_order_effect = 0
-            for intermediate1 in self.G.successors(factor):
-                if intermediate1 != "weight":
-                    for intermediate2 in self.G.successors(intermediate1):
-                        if intermediate2 != "weight" and self.G.has_edge(intermediate2, "weight"):
+            for k1 in graph.successors(node.index).tolist():
+                intermediate1 = edge_targets[k1]
+                if intermediate1 != target:
+                    for k2 in graph.successors(intermediate1).tolist():
+                        intermediate2 = edge_targets[k2]
+                        if intermediate2 != target and intermediate2 in into_target:
                             # The effect through this path is the product of the weights
-                            path_effect = (self.G[factor][intermediate1]["weight"] * 
-                                          self.G[intermediate1][intermediate2]["weight"] * 
-                                          self.G[intermediate2]["weight"]["weight"])
-                            second_order_effect += path_effect
+                            second_order_effect += weights[k1] * weights[k2] * into_target[intermediate2]
             
             # Total effect combines direct and indirect (with indirect discounted)
-            total_effect = direct_effect + 0.5 * indirect_effect + 0.25 * second_order_effect
+            total_effect = (direct_effect + FIRST_ORDER_DISCOUNT * indirect_effect
+                            + SECOND_ORDER_DISCOUNT * second_order_effect)
             
             # Modifiability from node attributes
-            modifiability = self.G.nodes[factor]["modifiable"] / 10.0  # Scale to 0-1
+            modifiability = node.modifiable / 10.0  # Scale to 0-1
             
             # Intervention potential combines effect size with modifiability
-            intervention_potentials[factor] = total_effect * modifiability
+            intervention_potentials[node.name] = total_effect * modifiability
         
         return intervention_potentials
     
-    def get_top_recommendations(self, n: int = 3) -> List[Dict]:
+    def get_top_recommendations(self, n: int = 3, mode: str = "second_order") -> List[Dict]:
         """
         Get the top n recommendations based on intervention potential
         
         Args:
             n: Number of recommendations to return
+            mode: Path mode passed to calculate_intervention_potential
             
         Returns:
             List of recommendation dictionaries
         """
-        potentials = self.calculate_intervention_potential()
-        
-        # Sort factors by intervention potential
-        sorted_factors = sorted(potentials.items(), key=lambda x: x[1], reverse=True)
-        
-        recommendations = []
-        for factor, potential in sorted_factors[:n]:
-            # Determine if the recommendation is to increase or decrease
-            # For most factors, higher values are better except for stress_level
-            direction = "increase" if factor != "stress_level" else "decrease"
-            
-            # Get current value and description
-            current_value = self.factors[factor]["current"]
-            description = self.factors[factor]["description"]
-            
-            # Generate a recommendation
-            recommendation = {
-                "factor": factor,
-                "description": description,
-                "potential": potential,
-                "current_value": current_value,
-                "direction": direction,
-                "confidence": min(0.5 + potential, 0.9)  # Higher potential = higher confidence
-            }
-            
-            recommendations.append(recommendation)
-        
-        return recommendations
+        if mode not in self._recommendations or self._recommendation_depth[mode] < n:
+            # Counts as a potential cache hit or miss inside calculate_intervention_potential
+            self._rerank(mode, max(n, MATERIALIZED_DEPTH))
+        else:
+            self.cache_hits += 1
+        
+        # Copies keep callers from mutating the materialized list
+        return [dict(r) for r in self._recommendations[mode][:n]]
     
     def get_network_state(self) -> Dict[str, Any]:
         """
@@ -211,21 +728,24 @@ class SimpleObesityNetwork:
         Returns:
             Dict containing the current state of the network
         """
-        # Get current factor values
-        factors = {factor: self.factors[factor]["current"] for factor in self.factors}
+        graph = self.graph
+        names = [node.name for node in graph.nodes]
+        
+        # Get current factor values and their precisions
+        factors = dict(zip(names, graph.values.tolist()))
+        precisions = dict(zip(names, graph.precisions.tolist()))
         
         # Get current relationship strengths
-        relationships = []
-        for source, target, data in self.G.edges(data=True):
-            relationships.append({
-                "from": source,
-                "to": target,
-                "strength": data["weight"],
-                "confidence": data["confidence"]
-            })
+        relationships = [
+            {"from": source, "to": target, "strength": weight, "confidence": confidence}
+            for (source, target), weight, confidence in zip(
+                graph.edges, graph.weights.tolist(), graph.confidences.tolist()
+            )
+        ]
         
         return {
             "factors": factors,
+            "precisions": precisions,
             "relationships": relationships
         }
     
@@ -240,29 +760,46 @@ class SimpleObesityNetwork:
             bool: True if update was successful
         """
         try:
+            graph = self.graph
+            previous = None
+            
             # Update factor values
             for factor, value in state["factors"].items():
-                if factor in self.factors:
-                    self.factors[factor]["current"] = value
-                    self.G.nodes[factor]["current"] = value
+                i = self.node_index.get(factor)
+                if i is not None:
+                    graph.values[i] = value
+                    self._patch_current_value(factor, float(graph.values[i]))
+            
+            # Update factor precisions (absent in states saved before precision tracking)
+            for factor, precision in (state.get("precisions") or {}).items():
+                i = self.node_index.get(factor)
+                if i is not None:
+                    graph.precisions[i] = precision
             
             # Update relationship strengths
             for rel in state["relationships"]:
-                source = rel["from"]
-                target = rel["to"]
+                k = graph.edge(rel["from"], rel["to"])
                 strength = rel["strength"]
-                confidence = rel.get("confidence", 0.7)
+                confidence = rel.get("confidence", EDGE_PRIOR_CONFIDENCE)
                 
-                if self.G.has_edge(source, target):
-                    self.G[source][target]["weight"] = strength
-                    self.G[source][target]["confidence"] = confidence
+                if k is not None:
+                    if previous is None and graph.weights[k] != strength:
+                        previous = self._invalidate_cache()
+                    graph.weights[k] = strength
+                    graph.confidences[k] = confidence
             
+            if previous is not None:
+                self._invalidate_cache()
+                self._refresh_recommendations(previous)
             return True
         except Exception as e:
             print(f"Error setting network state: {e}")
+            # A partial update may have changed weights, so start the rankings over
+            self._invalidate_cache()
+            self._recommendations.clear()
             return False
     
-    def visualize_network(self, highlight_recommendations: bool = True) -> plt.Figure:
+    def visualize_network(self, highlight_recommendations: bool = True) -> "Figure":
         """
         Visualize the network with node sizes representing intervention potential
         
@@ -272,43 +809,32 @@ class SimpleObesityNetwork:
         Returns:
             matplotlib Figure object
         """
-        # Get positions for nodes
-        pos = nx.spring_layout(self.G, seed=42)
-        
         # Get intervention potentials for node sizes
         potentials = self.calculate_intervention_potential()
-        potentials["weight"] = 0  # Target node has no intervention potential
         
-        # Get node sizes based on intervention potential
-        node_sizes = [potentials.get(node, 0) * 1000 + 300 for node in self.G.nodes()]
+        highlighted = []
+        if highlight_recommendations:
+            highlighted = [r["factor"] for r in self.get_top_recommendations(3)]
         
-        # Get edge widths based on weights
-        edge_widths = [self.G[u][v]["weight"] * 2 for u, v in self.G.edges()]
+        # Plotting is only needed here, so pyplot is not loaded with the model
+        import matplotlib.pyplot as plt
         
         # Create figure
         fig, ax = plt.subplots(figsize=(10, 8))
-        
-        # Draw the graph
-        nx.draw_networkx_nodes(self.G, pos, node_size=node_sizes, node_color="skyblue", ax=ax)
-        
-        # Highlight top recommendations if requested
-        if highlight_recommendations:
-            top_recs = [r["factor"] for r in self.get_top_recommendations(3)]
-            nx.draw_networkx_nodes(self.G, pos, nodelist=top_recs, node_size=node_sizes, 
-                                node_color="orange", ax=ax)
-        
-        # Draw edges with varying widths
-        nx.draw_networkx_edges(self.G, pos, width=edge_widths, edge_color="gray", 
-                            alpha=0.7, ax=ax)
-        
-        # Draw labels
-        nx.draw_networkx_labels(self.G, pos, font_size=10, ax=ax)
-        
-        plt.title("Obesity Factor Network")
-        plt.axis("off")
+        draw_network(ax, self.to_networkx(), potentials, highlighted)
         
         return fig
     
+    def to_networkx(self) -> "nx.DiGraph":
+        """
+        Build a networkx graph of the network's current state
+        
+        Returns:
+            networkx DiGraph with factor attributes on nodes and weight and
+            confidence on edges (a copy; changing it does not change the network)
+        """
+        return self.graph.to_networkx()
+    
     def to_json(self) -> str:
         """
         Convert the network state to JSON
@@ -347,6 +873,7 @@ if __name__ == "__main__":
         print(f"{i}. {rec['factor']} - {rec['description']} - {rec['direction']} (impact: {rec['potential']:.2f})")
     
     # Visualize the network
+    import matplotlib.pyplot as plt
     fig = network.visualize_network()
     plt.show()
     
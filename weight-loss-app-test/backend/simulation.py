@@ -0,0 +1,381 @@
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Any, Sequence
+import numpy as np
+from simplified_obesity_network import (
+    SimpleObesityNetwork,
+    FIRST_ORDER_DISCOUNT,
+    SECOND_ORDER_DISCOUNT,
+    PATH_DISCOUNT,
+)
+
+# Draws per what-if query unless the caller asks for another number
+DEFAULT_DRAWS = 2000
+MAX_DRAWS = 100000
+
+# Standard deviation of a sampled edge weight at confidence 0 (it shrinks
+# linearly to 0 at confidence 1, so the prior 0.7 gives 0.15)
+EDGE_WEIGHT_SD = 0.5
+
+# Draws propagated together; each chunk gets its own seed, so results for a
+# seed do not depend on whether chunks run in this process or a pool
+CHUNK_DRAWS = 1000
+
+# Cap on the sampled weight arrays per chunk (large graphs use smaller chunks)
+CHUNK_BYTES = 64 * 1024 * 1024
+
+# Below this many sampled edge weights (draws x edges) a query runs in-process,
+# since shipping it to worker processes costs more than it saves
+POOL_MIN_SAMPLES = 5_000_000
+
+# All-paths propagation stops once every draw's remaining effect is this small
+PATH_TOLERANCE = 1e-9
+MAX_PATH_HOPS = 200
+
+OUTCOME_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def sample_edge_weights(weights: np.ndarray, confidences: np.ndarray, draws: int,
+                        rng: np.random.Generator) -> np.ndarray:
+    """
+    Sample edge weights from the distributions their confidences imply
+    
+    Each weight is drawn from a normal distribution around its current value
+    with standard deviation EDGE_WEIGHT_SD * (1 - confidence). Draws that
+    would flip an edge's sign are clipped to 0.
+    
+    Args:
+        weights: (n_edges,) current edge weights
+        confidences: (n_edges,) edge confidences (0-1)
+        draws: Number of samples
+        rng: Random generator
+        
+    Returns:
+        (n_edges, draws) float32 sampled weights, one row per edge
+    """
+    spread = EDGE_WEIGHT_SD * (1.0 - np.clip(confidences, 0.0, 1.0))
+    samples = rng.standard_normal((len(weights), draws), dtype=np.float32)
+    samples *= spread[:, None]
+    samples += weights[:, None]
+    samples[samples * np.sign(weights)[:, None] < 0] = 0.0
+    return samples
+
+
+def _hop_discounts(mode: str) -> List[float]:
+    """Discount applied to paths with 0, 1, 2, ... intermediate factors"""
+    if mode == "second_order":
+        return [1.0, FIRST_ORDER_DISCOUNT, SECOND_ORDER_DISCOUNT]
+    if mode == "all_paths":
+        return [PATH_DISCOUNT ** hop for hop in range(MAX_PATH_HOPS + 1)]
+    raise ValueError(f"Unknown mode: {mode}")
+
+
+def relevant_edges(edge_sources: np.ndarray, edge_targets: np.ndarray, change: np.ndarray,
+                   fixed: np.ndarray, target: int, mode: str = "second_order") -> np.ndarray:
+    """
+    Find the edges a change can travel along to reach the target
+    
+    Only these edges need to be sampled and propagated, so a what-if query
+    on a few factors of a large graph touches a small part of it.
+    
+    Args:
+        edge_sources: (n_edges,) source node of each edge
+        edge_targets: (n_edges,) target node of each edge
+        change: (n_factors,) change applied to each factor
+        fixed: (n_factors,) whether each factor is intervened on, even if its value does not change
+        target: Index of the target node
+        mode: "second_order" or "all_paths"
+        
+    Returns:
+        Sorted ids of the edges on a path from a changed factor to the target,
+        within the mode's hop limit
+    """
+    n_hops = len(_hop_discounts(mode)) - 1
+    onward = (edge_targets != target) & ~fixed[edge_targets]
+    
+    # Hops needed to reach each factor from a changed one
+    distance = np.where(change != 0, 0, n_hops + 1)
+    for hop in range(1, n_hops + 1):
+        step = onward & (distance[edge_sources] == hop - 1)
+        newly = edge_targets[step][distance[edge_targets[step]] > hop]
+        if not len(newly):
+            break
+        distance[newly] = hop
+    
+    # Factors from which the target can be reached without passing a fixed factor
+    reaches = np.zeros(len(change), dtype=bool)
+    reaches[target] = True
+    while True:
+        grown = reaches.copy()
+        grown[edge_sources[reaches[edge_targets] & (onward | (edge_targets == target))]] = True
+        if (grown == reaches).all():
+            break
+        reaches = grown
+    
+    into_target = (edge_targets == target) & (distance[edge_sources] <= n_hops)
+    carrying = onward & (distance[edge_sources] < n_hops) & reaches[edge_targets]
+    return np.flatnonzero(into_target | carrying)
+
+
+def propagate(samples: np.ndarray, edge_sources: np.ndarray, edge_targets: np.ndarray,
+              change: np.ndarray, fixed: np.ndarray, target: int, mode: str = "second_order") -> np.ndarray:
+    """
+    Push a change in factor values through sampled graphs to the target
+    
+    Intervened factors are held at their set values, even when that value is
+    their current one, so edges into them are cut and paths never run through
+    them; the target is never an intermediate either. Hops are discounted the same way as
+    intervention potentials, so a unit change to one factor moves the target by
+    that factor's potential before modifiability is applied.
+    
+    Args:
+        samples: (n_edges, draws) edge weights, one row per edge
+        edge_sources: (n_edges,) source node of each edge
+        edge_targets: (n_edges,) target node of each edge
+        change: (n_factors,) change applied to each factor, in its improving direction
+        fixed: (n_factors,) whether each factor is intervened on
+        target: Index of the target node
+        mode: "second_order" or "all_paths"
+        
+    Returns:
+        (draws,) change in the target, NaN for draws whose all-paths effects do not converge
+    """
+    discounts = _hop_discounts(mode)
+    draws = samples.shape[1]
+    
+    into = edge_targets == target
+    into_weights, into_sources = samples[into], edge_sources[into]
+    # Edges that carry a change onwards, grouped by the factor they end at
+    onward = np.flatnonzero(~into & ~fixed[edge_targets])
+    onward = onward[np.argsort(edge_targets[onward], kind="stable")]
+    onward_weights, onward_sources, onward_targets = samples[onward], edge_sources[onward], edge_targets[onward]
+    
+    # Only factors the change has reached are kept: values[row[i]] holds factor i's
+    # change in every draw (rows are factors and columns are draws)
+    nodes = np.flatnonzero(change != 0)
+    values = np.repeat(change[nodes, None], draws, axis=1).astype(samples.dtype)
+    row = np.full(len(change), -1)
+    
+    def reaching_target() -> np.ndarray:
+        row[nodes] = np.arange(len(nodes))
+        arriving = row[into_sources] >= 0
+        return np.einsum("ed,ed->d", into_weights[arriving], values[row[into_sources[arriving]]], dtype=np.float64)
+    
+    effect = discounts[0] * reaching_target()
+    with np.errstate(over="ignore", invalid="ignore"):
+        for discount in discounts[1:]:
+            active = row[onward_sources] >= 0
+            if not active.any():
+                break
+            carried = onward_weights[active] * values[row[onward_sources[active]]]
+            row[nodes] = -1
+            nodes, starts = np.unique(onward_targets[active], return_index=True)
+            values = np.add.reduceat(carried, starts, axis=0)
+            effect += discount * reaching_target()
+            if mode == "all_paths" and np.abs(values).max() * discount < PATH_TOLERANCE:
+                break
+        else:
+            if mode == "all_paths" and len(nodes):
+                # Effects still flowing after MAX_PATH_HOPS hops come from cycles too strong to converge
+                remaining = np.abs(values).max(axis=0) * discounts[-1]
+                effect[~(remaining < PATH_TOLERANCE)] = np.nan
+    return effect
+
+
+def _simulate_chunk(weights: np.ndarray, confidences: np.ndarray, edge_sources: np.ndarray,
+                    edge_targets: np.ndarray, change: np.ndarray, fixed: np.ndarray, target: int,
+                    mode: str, draws: int, seed: np.random.SeedSequence) -> np.ndarray:
+    """Sample and propagate one chunk of draws (module-level so worker processes can run it)"""
+    samples = sample_edge_weights(weights, confidences, draws, np.random.default_rng(seed))
+    return propagate(samples, edge_sources, edge_targets, change, fixed, target, mode)
+
+
+# Worker processes shared by every query in this process, started on first use
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # Forking a threaded server can deadlock, so workers start fresh
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown_pool() -> None:
+    """Stop the worker processes, if any were started"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = None
+        _pool_workers = 0
+
+
+def simulate_changes(weights: np.ndarray, confidences: np.ndarray, edge_sources: np.ndarray,
+                     edge_targets: np.ndarray, change: np.ndarray, fixed: np.ndarray, target: int,
+                     draws: int = DEFAULT_DRAWS, mode: str = "second_order",
+                     seed: Optional[int] = None, workers: int = 0) -> np.ndarray:
+    """
+    Sample the target's response to a change in factor values
+    
+    Only the edges the change can travel along are sampled (see
+    relevant_edges). Draws are split into chunks with independent seeds. With
+    workers > 1 and at least POOL_MIN_SAMPLES sampled weights, chunks run in a
+    process pool; the result for a given seed is the same either way.
+    
+    Args:
+        weights: (n_edges,) current edge weights
+        confidences: (n_edges,) edge confidences
+        edge_sources: (n_edges,) source node of each edge
+        edge_targets: (n_edges,) target node of each edge
+        change: (n_factors,) change applied to each factor, in its improving direction
+        fixed: (n_factors,) whether each factor is intervened on
+        target: Index of the target node
+        draws: Number of Monte Carlo draws
+        mode: "second_order" or "all_paths"
+        seed: Seed for reproducible draws (random if None)
+        workers: Worker processes for large graphs (0 or 1 runs in-process)
+        
+    Returns:
+        (draws,) change in the target per draw (NaN where all-paths effects do not converge)
+    """
+    used = relevant_edges(edge_sources, edge_targets, change, fixed, target, mode)
+    n_edges = max(len(used), 1)
+    # Each draw of each edge needs a float32 sample plus temporaries of the same size
+    chunk = max(1, min(CHUNK_DRAWS, CHUNK_BYTES // (3 * 4 * n_edges)))
+    sizes = [min(chunk, draws - start) for start in range(0, draws, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = (np.asarray(weights)[used], np.asarray(confidences)[used], edge_sources[used], edge_targets[used],
+            change, fixed, target, mode)
+    
+    if workers > 1 and len(sizes) > 1 and draws * n_edges >= POOL_MIN_SAMPLES:
+        pool = _get_pool(workers)
+        futures = [pool.submit(_simulate_chunk, *args, size, chunk_seed) for size, chunk_seed in zip(sizes, seeds)]
+        results = [future.result() for future in futures]
+    else:
+        results = [_simulate_chunk(*args, size, chunk_seed) for size, chunk_seed in zip(sizes, seeds)]
+    return np.concatenate(results) if results else np.zeros(0)
+
+
+def summarize(values: np.ndarray) -> Dict[str, float]:
+    """Mean, standard deviation and percentiles of a sample"""
+    summary = {"mean": float(np.mean(values)), "std": float(np.std(values))}
+    for p, value in zip(OUTCOME_PERCENTILES, np.percentile(values, OUTCOME_PERCENTILES).tolist()):
+        summary[f"p{p}"] = value
+    return summary
+
+
+def simulate_interventions(factor_names: Sequence[str], directions: Sequence[str], values: np.ndarray,
+                           weights: np.ndarray, confidences: np.ndarray, edge_sources: np.ndarray, edge_targets: np.ndarray,
+                           target: int, interventions: Dict[str, float], draws: int = DEFAULT_DRAWS,
+                           mode: str = "second_order", seed: Optional[int] = None,
+                           workers: int = 0) -> Dict[str, Any]:
+    """
+    Simulate setting factors to new values and report the target's outcome distribution
+    
+    Changes are measured in each factor's improving direction from the model
+    (lowering caloric_intake counts as an improvement), propagated through sampled edge
+    weights, and read off as a fall in the target: a negative change means
+    the target (weight) goes down.
+    
+    Args:
+        factor_names: Factor names in node order
+        directions: Improving direction of each factor ("increase" or "decrease")
+        values: (n_factors,) current factor values
+        weights: (n_edges,) current edge weights
+        confidences: (n_edges,) edge confidences
+        edge_sources: (n_edges,) source node of each edge
+        edge_targets: (n_edges,) target node of each edge
+        target: Index of the target node
+        interventions: Map of factor names to the values they are set to (0-1)
+        draws: Number of Monte Carlo draws (1 to MAX_DRAWS)
+        mode: "second_order" or "all_paths"
+        seed: Seed for reproducible draws (random if None)
+        workers: Worker processes for large graphs (0 or 1 runs in-process)
+        
+    Returns:
+        Dict with the interventions applied, the target's current value and the
+        distributions of its change and predicted value
+        
+    Raises:
+        ValueError: If an intervention, the draw count or the mode is invalid
+    """
+    if not interventions:
+        raise ValueError("No interventions given")
+    if not 1 <= draws <= MAX_DRAWS:
+        raise ValueError(f"draws must be between 1 and {MAX_DRAWS}")
+    if mode not in ("second_order", "all_paths"):
+        raise ValueError(f"Unknown mode: {mode}")
+    
+    node_index = {factor: i for i, factor in enumerate(factor_names)}
+    change = np.zeros(len(factor_names))
+    fixed = np.zeros(len(factor_names), dtype=bool)
+    applied = {}
+    for factor, value in interventions.items():
+        i = node_index.get(factor)
+        if i is None:
+            raise ValueError(f"Invalid factor: {factor}")
+        if i == target:
+            raise ValueError(f"Cannot intervene on the target factor: {factor}")
+        if isinstance(value, bool) or not (isinstance(value, (int, float)) and 0 <= value <= 1):
+            raise ValueError(f"Intervention value for {factor} must be between 0 and 1")
+        current = float(values[i])
+        sign = 1.0 if directions[i] == "increase" else -1.0
+        change[i] = (value - current) * sign
+        fixed[i] = True
+        applied[factor] = {"from": current, "to": float(value)}
+    
+    improvement = simulate_changes(weights, confidences, edge_sources, edge_targets, change, fixed,
+                                   target, draws, mode, seed, workers)
+    converged = improvement[np.isfinite(improvement)]
+    current = float(values[target])
+    result = {
+        "target": factor_names[target],
+        "mode": mode,
+        "draws": draws,
+        "interventions": applied,
+        "current": current,
+        "diverged": draws - len(converged)
+    }
+    if not len(converged):
+        raise ValueError("Path effects do not converge in any draw")
+    
+    outcome = -converged
+    result["change"] = summarize(outcome)
+    result["predicted"] = summarize(np.clip(current + outcome, 0.0, 1.0))
+    result["probability_of_decrease"] = float(np.mean(outcome < 0))
+    return result
+
+
+def simulate_network(network: SimpleObesityNetwork, interventions: Dict[str, float],
+                     draws: int = DEFAULT_DRAWS, mode: str = "second_order",
+                     seed: Optional[int] = None, workers: int = 0) -> Dict[str, Any]:
+    """
+    Run a what-if simulation on a SimpleObesityNetwork (see simulate_interventions)
+    
+    Args:
+        network: Network to simulate
+        interventions: Map of factor names to the values they are set to (0-1)
+        draws: Number of Monte Carlo draws
+        mode: "second_order" or "all_paths"
+        seed: Seed for reproducible draws (random if None)
+        workers: Worker processes for large graphs
+        
+    Returns:
+        Simulation result dict
+    """
+    graph = network.graph
+    return simulate_interventions(
+        [node.name for node in graph.nodes], [node.direction for node in graph.nodes],
+        graph.values, graph.weights, graph.confidences,
+        graph.edge_sources, graph.edge_targets, network.target, interventions,
+        draws, mode, seed, workers
+    )
@@ -0,0 +1,63 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls into one
+    
+    The first caller for a key starts the call; callers arriving with the same
+    key while it is in flight await the same result (or exception). Once it
+    finishes the key is forgotten, so later calls run again. If every waiter
+    is cancelled, the call is cancelled too.
+    """
+    
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[Hashable, int] = {}
+        self.calls = 0
+        self.coalesced = 0
+    
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run fn, or join the in-flight call with the same key
+        
+        Args:
+            key: Identifies identical calls
+            fn: Zero-argument coroutine function making the call
+            
+        Returns:
+            The call's result, shared by every caller with the key
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda _: self._forget(key, task))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+        
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._calls.get(key) is task:
+                self._waiters[key] -= 1
+                if self._waiters[key] == 0:
+                    task.cancel()
+            raise
+    
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        """Drop a finished call so the next one with its key runs afresh"""
+        if self._calls.get(key) is task:
+            del self._calls[key]
+            del self._waiters[key]
+    
+    def stats(self) -> Dict[str, int]:
+        """Get call counters for monitoring"""
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._calls)
+        }
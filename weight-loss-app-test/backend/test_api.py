@@ -63,6 +63,33 @@ def test_api():
     updated_recommendations = response.json()
     logger.info(f"Updated recommendations: {json.dumps(updated_recommendations, indent=2)}")
     
+    # Test batch recommendations
+    logger.info("Testing batch recommendations...")
+    response = requests.post(f"{BASE_URL}/recommendations/batch", json={"users": [{"user_id": "default"}], "n": 2})
+    assert response.status_code == 200
+    assert len(response.json()["results"][0]["recommendations"]) == 2
+    response = requests.post(
+        f"{BASE_URL}/recommendations/batch", json={"users": [{"user_id": "default"}, {"user_id": "default"}]}
+    )
+    assert response.status_code == 400
+    response = requests.post(f"{BASE_URL}/recommendations/batch", json={"users": [], "n": None})
+    assert response.status_code == 422
+    
+    # Test a what-if simulation
+    logger.info("Testing simulation...")
+    response = requests.post(
+        f"{BASE_URL}/simulate",
+        json={"interventions": {"sleep_quality": 0.8, "stress_level": 0.3}, "draws": 1000, "seed": 1}
+    )
+    assert response.status_code == 200
+    simulation = response.json()
+    assert simulation["draws"] == 1000 and simulation["change"]["mean"] < 0
+    logger.info(f"Simulated weight change: {json.dumps(simulation['change'], indent=2)}")
+    response = requests.post(f"{BASE_URL}/simulate", json={"interventions": {"weight": 0.2}})
+    assert response.status_code == 400
+    response = requests.post(f"{BASE_URL}/simulate", json={"interventions": {"caloric_intake": 0.3}, "draws": None})
+    assert response.status_code == 422
+    
     # Test chat endpoint
     logger.info("Testing chat endpoint...")
     message = "I've been having trouble sleeping lately, maybe 5 hours a night. I'm also feeling very stressed at work."
@@ -74,6 +101,24 @@ def test_api():
     chat_response = response.json()
     logger.info(f"Chat response: {json.dumps(chat_response, indent=2)}")
     
+    # Test streaming chat endpoint
+    logger.info("Testing streaming chat endpoint...")
+    response = requests.post(
+        f"{BASE_URL}/chat/stream",
+        json={"message": message, "conversation_history": []},
+        stream=True
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [
+        line[len("event: "):] for line in response.iter_lines(decode_unicode=True)
+        if line.startswith("event: ")
+    ]
+    assert events[0] == "recommendations"
+    assert "token" in events
+    assert events[-2:] == ["extracted_data", "done"]
+    logger.info(f"Streamed {events.count('token')} tokens")
+    
     logger.info("All tests passed successfully!")
 
 if __name__ == "__main__":
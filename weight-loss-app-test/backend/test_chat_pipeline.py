@@ -0,0 +1,98 @@
+import time
+import json
+import asyncio
+import httpx
+from anthropic import AsyncAnthropic
+from simplified_obesity_network import SimpleObesityNetwork
+from data_extraction import ConversationDataExtractor
+from chat_pipeline import ChatPipeline
+
+# Simulated latency of one model call
+LATENCY = 0.2
+
+HISTORY = [{"role": "user", "content": "I only sleep about 5 hours a night"}]
+
+def message_response(content):
+    return httpx.Response(200, json={
+        "id": "msg_test",
+        "type": "message",
+        "role": "assistant",
+        "model": "test",
+        "content": content,
+        "stop_reason": "end_turn",
+        "usage": {"input_tokens": 10, "output_tokens": 10}
+    })
+
+def make_client(prompts, factors):
+    """Client whose model answers after LATENCY, extracting the given factors and recording every reply prompt it is sent"""
+    async def handler(request):
+        body = json.loads(request.content)
+        if "tools" not in body:
+            prompts.append(body["messages"][0]["content"])
+            number = len(prompts)
+        await asyncio.sleep(LATENCY)
+        if "tools" in body:
+            return message_response([{
+                "type": "tool_use",
+                "id": "toolu_test",
+                "name": "extract_factors",
+                "input": {"factors": factors, "confidence": 0.9}
+            }])
+        return message_response([{"type": "text", "text": f"reply {number}"}])
+    
+    return AsyncAnthropic(
+        api_key="test", base_url="http://llm.test",
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+
+def run_turn(factors, mode):
+    async def turn():
+        prompts = []
+        client = make_client(prompts, factors)
+        pipeline = ChatPipeline(client, ConversationDataExtractor("test", client=client), mode=mode)
+        network = SimpleObesityNetwork()
+        start = time.perf_counter()
+        result = await pipeline.run("How can I lose weight?", HISTORY, network)
+        elapsed = time.perf_counter() - start
+        await client.close()
+        return result, elapsed, prompts, pipeline.stats()
+    
+    return asyncio.run(turn())
+
+def test_concurrent_turn():
+    """Test that extraction and the reply overlap instead of running in series"""
+    print("Testing concurrent chat turn...")
+    
+    for mode in ("pre_update", "speculative"):
+        result, elapsed, prompts, stats = run_turn({"sleep_quality": 0.2}, mode)
+        assert result["extracted_data"] == {"factors": {"sleep_quality": 0.2}, "confidence": 0.9}
+        assert result["response"] == "reply 1" and len(prompts) == 1
+        # About one model call, not two
+        assert elapsed < 1.5 * LATENCY, f"{mode} took {elapsed:.2f}s"
+    
+    # Sleep quality is not among the recommendations, so the speculative reply is kept
+    assert stats == {"speculative_kept": 1, "speculative_restarted": 0}
+    
+    print("Extraction and reply ran concurrently")
+
+def test_speculative_restart():
+    """Test that a speculative reply is restarted when extraction moves a recommended factor"""
+    print("Testing speculative restart...")
+    
+    result, elapsed, prompts, stats = run_turn({"physical_activity": 1.0}, "speculative")
+    assert stats == {"speculative_kept": 0, "speculative_restarted": 1}
+    assert len(prompts) == 2 and result["response"] == "reply 2"
+    # The restarted reply sees the extracted value
+    assert "- physical_activity: increase (current: 0.50" in prompts[0]
+    assert "- physical_activity: increase (current: 0.78" in prompts[1]
+    
+    # Pre-update mode keeps the first reply
+    result, elapsed, prompts, stats = run_turn({"physical_activity": 1.0}, "pre_update")
+    assert len(prompts) == 1 and result["response"] == "reply 1"
+    assert abs(result["recommendations"][1]["current_value"] - 0.78125) < 1e-9
+    
+    print("Stale speculative reply restarted")
+
+if __name__ == "__main__":
+    test_concurrent_turn()
+    test_speculative_restart()
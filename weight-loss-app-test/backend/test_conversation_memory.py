@@ -0,0 +1,166 @@
+import os
+import json
+import asyncio
+import sqlite3
+import tempfile
+import httpx
+from anthropic import AsyncAnthropic
+from simplified_obesity_network import SimpleObesityNetwork
+from data_extraction import ConversationDataExtractor
+from chat_pipeline import ChatPipeline
+from conversation_memory import ConversationMemory, estimate_tokens
+
+def turn(number):
+    return [
+        {"role": "user", "content": f"Message {number}: I had a long day at work and snacked a lot"},
+        {"role": "assistant", "content": f"Reply {number}: try keeping healthy snacks close at hand"}
+    ]
+
+def context_tokens(context):
+    return estimate_tokens(context["summary"]) + sum(estimate_tokens(msg["content"]) for msg in context["messages"])
+
+def test_context_and_summary():
+    """Test that context stays within budget and old messages are folded into the summary"""
+    print("Testing context budget and rolling summary...")
+    
+    memory = ConversationMemory(token_budget=100)
+    memory.append("a", turn(0))
+    context = memory.context("a")
+    assert context == {"summary": "", "messages": turn(0), "offset": 0}
+    assert memory.pending_summary("a") is None
+    
+    for number in range(1, 10):
+        memory.append("a", turn(number))
+    context = memory.context("a")
+    assert context_tokens(context) <= 100
+    assert context["messages"][-1] == turn(9)[1]
+    assert context["offset"] + len(context["messages"]) == 20
+    
+    # The oldest messages are claimed until the rest fit in half the budget
+    pending = memory.pending_summary("a")
+    assert pending["messages"][0] == turn(0)[0]
+    assert memory.pending_summary("a") is None
+    memory.set_summary("a", "User snacks after long work days.", pending["through"])
+    context = memory.context("a")
+    assert context["summary"] == "User snacks after long work days."
+    assert context["offset"] >= pending["through"]
+    assert context_tokens(context) <= 100
+    
+    # A failed summary releases the claim without changing anything
+    for number in range(10, 20):
+        memory.append("a", turn(number))
+    pending = memory.pending_summary("a")
+    memory.set_summary("a", None, pending["through"])
+    assert memory.context("a")["summary"] == "User snacks after long work days."
+    assert memory.pending_summary("a") is not None
+    
+    # Conversations beyond capacity are forgotten
+    memory = ConversationMemory(capacity=2)
+    for name in "abc":
+        memory.append(name, turn(0))
+    assert memory.context("a")["messages"] == []
+    
+    print("Context stays within budget")
+
+def test_shared_log():
+    """Test that the on-disk log is shared by workers and only its tail is loaded"""
+    print("Testing shared log...")
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "conversations.db")
+        first = ConversationMemory(token_budget=100, path=path)
+        second = ConversationMemory(token_budget=100, path=path)
+        for number in range(10):
+            (first if number % 2 else second).append("a", turn(number))
+        
+        context = first.context("a")
+        assert context == second.context("a")
+        assert context["messages"][-2:] == turn(9)
+        
+        pending = second.pending_summary("a")
+        second.set_summary("a", "Snacks at work.", pending["through"])
+        restarted = ConversationMemory(token_budget=100, path=path)
+        context = restarted.context("a")
+        assert context["summary"] == "Snacks at work." and context["offset"] >= pending["through"]
+        
+        # The log itself keeps every message
+        count = sqlite3.connect(path).execute("SELECT COUNT(*) FROM conversation_messages").fetchone()[0]
+        assert count == 20
+    
+    print("Log shared across workers")
+
+def test_pipeline_memory():
+    """Test that a long conversation sent one message at a time keeps a bounded prompt"""
+    print("Testing chat with server-side memory...")
+    
+    prompts = []
+    summaries = []
+    extractions = []
+    
+    async def handler(request):
+        body = json.loads(request.content)
+        prompt = body["messages"][0]["content"]
+        if "tools" in body:
+            extractions.append(prompt)
+            content = [{
+                "type": "tool_use",
+                "id": "toolu_test",
+                "name": "extract_factors",
+                "input": {"factors": {"caloric_intake": 0.3}, "confidence": 0.8}
+            }]
+        elif prompt.startswith("You keep a running summary"):
+            summaries.append(prompt)
+            content = [{"type": "text", "text": f"Summary {len(summaries)}: the user snacks after work."}]
+        else:
+            prompts.append(prompt)
+            content = [{"type": "text", "text": f"Reply {len(prompts)}: keep healthy snacks close at hand."}]
+        return httpx.Response(200, json={
+            "id": "msg_test",
+            "type": "message",
+            "role": "assistant",
+            "model": "test",
+            "content": content,
+            "stop_reason": "end_turn",
+            "usage": {"input_tokens": 10, "output_tokens": 10}
+        })
+    
+    async def run():
+        client = AsyncAnthropic(
+            api_key="test", base_url="http://llm.test",
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        )
+        memory = ConversationMemory(token_budget=200)
+        # One reply per turn (speculative replies restart while extraction moves caloric_intake)
+        pipeline = ChatPipeline(
+            client, ConversationDataExtractor("test", client=client), mode="pre_update", memory=memory
+        )
+        network = SimpleObesityNetwork()
+        for number in range(30):
+            result = await pipeline.run(
+                f"Message {number}: I had a long day at work and snacked a lot", None, network,
+                conversation_id="user:a"
+            )
+            assert result["response"].startswith(f"Reply {number + 1}")
+            # Let any summary started by the turn finish
+            await asyncio.sleep(0.01)
+        await client.close()
+        return memory
+    
+    memory = asyncio.run(run())
+    assert len(prompts) == 30 and len(extractions) == 29
+    assert "Message 0:" in prompts[1] and "Reply 1:" in prompts[1]
+    # Early messages survive only through the summary
+    assert "Message 0:" not in prompts[-1] and "Summary" in prompts[-1]
+    assert summaries and memory.stats()["summaries"] == len(summaries)
+    assert max(len(prompt) for prompt in prompts[10:]) < 2 * len(prompts[5])
+    # After the first turn's messages, each extraction sees only the last reply and the new message
+    assert extractions[0].count("Message ") == 2
+    assert all(extraction.count("Message ") == 1 for extraction in extractions[1:])
+    assert memory.stats()["messages_appended"] == 60
+    
+    print(f"30 turns, {len(summaries)} summaries, longest prompt {max(len(prompt) for prompt in prompts)} chars")
+
+if __name__ == "__main__":
+    test_context_and_summary()
+    test_shared_log()
+    test_pipeline_memory()
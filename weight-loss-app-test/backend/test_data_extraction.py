@@ -1,6 +1,13 @@
 import os
+import json
+import time
+import asyncio
 import logging
+import httpx
+from anthropic import AsyncAnthropic
 from data_extraction import ConversationDataExtractor
+from network_store import NetworkTopology, UserNetworkStore
+from simplified_obesity_network import SimpleObesityNetwork
 
 # Configure logging
 logging.basicConfig(
@@ -64,5 +71,140 @@ def test_data_extraction():
     logger.info("Data extraction test completed successfully!")
     return True
 
+def test_concurrent_extraction():
+    """Test that extractions share one async client and run concurrently"""
+    logger.info("Testing concurrent extraction...")
+    
+    latency = 0.2
+    
+    # Answer every request after a delay, like a slow model
+    async def handler(request):
+        await asyncio.sleep(latency)
+        return httpx.Response(200, json={
+            "id": "msg_test",
+            "type": "message",
+            "role": "assistant",
+            "model": "test",
+            "content": [{
+                "type": "tool_use",
+                "id": "toolu_test",
+                "name": "extract_factors",
+                "input": {"factors": {"sleep_quality": 0.3}, "confidence": 0.8}
+            }],
+            "stop_reason": "tool_use",
+            "usage": {"input_tokens": 10, "output_tokens": 10}
+        })
+    
+    async def run(count):
+        client = AsyncAnthropic(
+            api_key="test", base_url="http://llm.test",
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        )
+        extractor = ConversationDataExtractor("test", client=client)
+        start = time.perf_counter()
+        results = await asyncio.gather(*[
+            extractor.extract_data_async("I sleep 5 hours a night") for _ in range(count)
+        ])
+        elapsed = time.perf_counter() - start
+        await client.close()
+        return results, elapsed
+    
+    results, elapsed = asyncio.run(run(200))
+    assert all(r == {"factors": {"sleep_quality": 0.3}, "confidence": 0.8} for r in results)
+    # Serial calls would take 200 * latency
+    assert elapsed < 10 * latency
+    
+    logger.info(f"200 concurrent extractions took {elapsed:.2f}s")
+
+def test_incremental_extraction():
+    """Test that each turn only sends new messages plus a summary of earlier findings"""
+    logger.info("Testing incremental extraction...")
+    
+    prompts = []
+    
+    # Extract sleep_quality from the first turn, stress_level afterwards
+    async def handler(request):
+        prompt = json.loads(request.content)["messages"][0]["content"]
+        prompts.append(prompt)
+        factors = {"sleep_quality": 0.3} if len(prompts) == 1 else {"stress_level": 0.8}
+        return httpx.Response(200, json={
+            "id": "msg_test",
+            "type": "message",
+            "role": "assistant",
+            "model": "test",
+            "content": [{
+                "type": "tool_use",
+                "id": "toolu_test",
+                "name": "extract_factors",
+                "input": {"factors": factors, "confidence": 0.8}
+            }],
+            "stop_reason": "tool_use",
+            "usage": {"input_tokens": 10, "output_tokens": 10}
+        })
+    
+    async def run():
+        client = AsyncAnthropic(
+            api_key="test", base_url="http://llm.test",
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        )
+        extractor = ConversationDataExtractor("test", client=client)
+        history = []
+        results = []
+        for turn in range(6):
+            message = f"message {turn}: " + "details " * 50
+            results.append(await extractor.extract_new_data_async("conv", history, message))
+            history += [{"role": "user", "content": message}, {"role": "assistant", "content": f"reply {turn}"}]
+        
+        # A restarted conversation is extracted from scratch
+        await extractor.extract_new_data_async("conv", [], "starting over")
+        await client.close()
+        return extractor, results
+    
+    extractor, results = asyncio.run(run())
+    
+    # Each turn reports only what its new messages contained
+    assert results[0]["factors"] == {"sleep_quality": 0.3}
+    assert results[1]["factors"] == {"stress_level": 0.8}
+    
+    # Later turns carry the summary, not the earlier messages
+    assert "message 0" not in prompts[1] and "sleep_quality=0.30" in prompts[1]
+    assert "message 4" not in prompts[5] and "message 5" in prompts[5]
+    assert "sleep_quality=0.30, stress_level=0.80" in prompts[5]
+    
+    # Prompt size stays flat as the conversation grows
+    assert abs(len(prompts[5]) - len(prompts[1])) < 50
+    
+    assert "already extracted" not in prompts[6]
+    assert extractor.stats() == {"conversations": 1, "messages_extracted": 12, "messages_skipped": 25}
+    
+    logger.info("Incremental extraction sends only new messages")
+
+def test_update_network():
+    """Test that extracted factors reach a stored user in one batch"""
+    logger.info("Testing network update...")
+    
+    topology = NetworkTopology.from_network(SimpleObesityNetwork())
+    store = UserNetworkStore(topology)
+    batches = []
+    apply_updates = store.apply_updates
+    store.apply_updates = lambda user_id, batch: batches.append(batch) or apply_updates(user_id, batch)
+    
+    extractor = ConversationDataExtractor("test-key")
+    extracted = {"factors": {"sleep_quality": 0.3, "stress_level": 0.8, "mood": 0.1}, "confidence": 0.9}
+    assert extractor.update_network(extracted, store.view("alice"))
+    assert len(batches) == 1
+    assert [u["factor"] for u in batches[0]["factors"]] == ["sleep_quality", "stress_level"]
+    
+    reference = SimpleObesityNetwork()
+    reference.update_factor("sleep_quality", 0.3, 0.9)
+    reference.update_factor("stress_level", 0.8, 0.9)
+    for factor in ("sleep_quality", "stress_level"):
+        assert abs(store.get_factors("alice")[factor]["current"] - reference.factors[factor]["current"]) < 1e-6
+    
+    logger.info("Extracted factors are applied as one batch")
+
 if __name__ == "__main__":
+    test_concurrent_extraction()
+    test_incremental_extraction()
+    test_update_network()
     test_data_extraction() 
\ No newline at end of file
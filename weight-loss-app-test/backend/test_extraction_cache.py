@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import asyncio
+import tempfile
+import httpx
+from anthropic import AsyncAnthropic
+from data_extraction import ConversationDataExtractor
+from extraction_cache import ExtractionCache, cache_key, ENTRY_OVERHEAD
+
+SCHEMA = {"name": "extract_factors"}
+
+class Clock:
+    """Settable clock for TTL tests"""
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self):
+        return self.now
+
+def test_cache_key():
+    """Test that keys ignore formatting but not content, model or schema"""
+    print("Testing cache keys...")
+    
+    key = cache_key("user: I sleep 5 hours", "model-a", SCHEMA)
+    assert cache_key("  user:  I sleep 5 hours\n", "model-a", SCHEMA) == key
+    assert cache_key("user: I sleep 6 hours", "model-a", SCHEMA) != key
+    assert cache_key("user: I sleep 5 hours", "model-b", SCHEMA) != key
+    assert cache_key("user: I sleep 5 hours", "model-a", {"name": "other"}) != key
+    assert cache_key("user: I sleep 5 hours", "model-a", SCHEMA, "sleep_quality=0.30") != key
+    
+    print("Cache keys are content addressed")
+
+def test_ttl_and_eviction():
+    """Test TTL expiry and least recently used eviction under the byte budget"""
+    print("Testing TTL and eviction...")
+    
+    clock = Clock()
+    cache = ExtractionCache(max_bytes=1000, ttl=60, clock=clock)
+    value = {"factors": {"sleep_quality": 0.3}, "confidence": 0.8}
+    
+    cache.put("a", value)
+    result = cache.get("a")
+    assert result == value
+    # Callers get their own copy
+    result["factors"]["sleep_quality"] = 1.0
+    assert cache.get("a") == value
+    
+    clock.now += 61
+    assert cache.get("a") is None
+    assert cache.stats()["expired"] == 1 and cache.stats()["bytes"] == 0
+    
+    # Each entry costs a little over 250 bytes, so only three fit
+    for key in "bcde":
+        cache.put(key, value)
+        if key == "c":
+            cache.get("b")
+    stats = cache.stats()
+    assert stats["entries"] == 3 and stats["evictions"] == 1 and stats["bytes"] <= 1000
+    assert cache.get("c") is None and cache.get("b") == value
+    
+    # The budget counts encoded bytes, not characters
+    sized = ExtractionCache(ttl=60, clock=clock)
+    sized.put("schlüssel", value)
+    assert sized.stats()["bytes"] == len("schlüssel".encode()) + len(json.dumps(value)) + ENTRY_OVERHEAD
+    
+    # Hits are served from memory quickly
+    start = time.perf_counter()
+    for _ in range(10000):
+        cache.get("b")
+    per_hit = (time.perf_counter() - start) / 10000
+    assert per_hit < 1e-4, f"{per_hit * 1e6:.1f}us per hit"
+    
+    print(f"TTL and eviction work, {per_hit * 1e6:.1f}us per hit")
+
+def test_disk_tier():
+    """Test that results on disk survive a restart and still expire"""
+    print("Testing on-disk tier...")
+    
+    clock = Clock()
+    value = {"factors": {"stress_level": 0.8}, "confidence": 0.9}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cache.db")
+        ExtractionCache(ttl=60, path=path, clock=clock).put("a", value)
+        
+        restarted = ExtractionCache(ttl=60, path=path, clock=clock)
+        assert restarted.get("a") == value
+        assert restarted.get("a") == value
+        assert restarted.stats()["disk_hits"] == 1 and restarted.stats()["hits"] == 2
+        
+        clock.now += 61
+        assert ExtractionCache(ttl=60, path=path, clock=clock).get("a") is None
+    
+    print("On-disk tier survives restarts")
+
+def test_extractor_uses_cache():
+    """Test that repeated extractions of the same text skip the model"""
+    print("Testing cached extraction...")
+    
+    calls = []
+    
+    async def handler(request):
+        calls.append(request)
+        return httpx.Response(200, json={
+            "id": "msg_test",
+            "type": "message",
+            "role": "assistant",
+            "model": "test",
+            "content": [{
+                "type": "tool_use",
+                "id": "toolu_test",
+                "name": "extract_factors",
+                "input": {"factors": {"sleep_quality": 0.3}, "confidence": 0.8}
+            }],
+            "stop_reason": "tool_use",
+            "usage": {"input_tokens": 10, "output_tokens": 10}
+        })
+    
+    async def run():
+        client = AsyncAnthropic(
+            api_key="test", base_url="http://llm.test",
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        )
+        extractor = ConversationDataExtractor("test", client=client, cache=ExtractionCache())
+        results = [
+            await extractor.extract_data_async("user: I sleep 5 hours a night"),
+            await extractor.extract_data_async("user:  I sleep 5 hours a night\n"),
+            await extractor.extract_data_async("user: I sleep 7 hours a night")
+        ]
+        await client.close()
+        return extractor, results
+    
+    extractor, results = asyncio.run(run())
+    assert len(calls) == 2
+    assert results[0] == results[1]
+    assert extractor.cache.stats()["hits"] == 1 and extractor.cache.stats()["misses"] == 2
+    
+    print("Repeated extractions served from cache")
+
+def test_failed_extraction_not_cached():
+    """Test that a response without an extraction is retried rather than cached"""
+    print("Testing failed extraction...")
+    
+    calls = []
+    
+    async def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            content = [{"type": "text", "text": "I could not find any factors."}]
+        else:
+            content = [{
+                "type": "tool_use",
+                "id": "toolu_test",
+                "name": "extract_factors",
+                "input": {"factors": {"sleep_quality": 0.3}, "confidence": 0.8}
+            }]
+        return httpx.Response(200, json={
+            "id": "msg_test",
+            "type": "message",
+            "role": "assistant",
+            "model": "test",
+            "content": content,
+            "stop_reason": "end_turn",
+            "usage": {"input_tokens": 10, "output_tokens": 10}
+        })
+    
+    async def run():
+        client = AsyncAnthropic(
+            api_key="test", base_url="http://llm.test",
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        )
+        extractor = ConversationDataExtractor("test", client=client, cache=ExtractionCache())
+        results = [
+            await extractor.extract_data_async("user: I sleep 5 hours a night"),
+            await extractor.extract_data_async("user: I sleep 5 hours a night")
+        ]
+        await client.close()
+        return extractor, results
+    
+    extractor, results = asyncio.run(run())
+    assert len(calls) == 2
+    assert results == [{"factors": {}, "confidence": 0.5}, {"factors": {"sleep_quality": 0.3}, "confidence": 0.8}]
+    assert extractor.cache.stats()["entries"] == 1
+    
+    print("Failed extraction retried")
+
+if __name__ == "__main__":
+    test_cache_key()
+    test_ttl_and_eviction()
+    test_disk_tier()
+    test_extractor_uses_cache()
+    test_failed_extraction_not_cached()
@@ -0,0 +1,108 @@
+import asyncio
+import httpx
+from anthropic import AsyncAnthropic
+from data_extraction import ConversationDataExtractor
+from factor_classifier import FactorClassifier
+
+def test_classification():
+    """Test which messages skip the model and what values the rules read"""
+    print("Testing factor classification...")
+    
+    classifier = FactorClassifier()
+    
+    # Pleasantries and acknowledgements
+    for text in ["thanks!", "ok what next?", "Sounds good, thank you :)"]:
+        assert classifier.classify(text) == {"needs_extraction": False, "factors": {}}, text
+    
+    # Explicit statements become values directly
+    expected = {
+        "I slept 6 hours last night": {"sleep_quality": 0.75},
+        "I get about 8 hours of sleep": {"sleep_quality": 1.0},
+        "I go to the gym 3 times a week": {"physical_activity": 0.6},
+        "I run twice a week": {"physical_activity": 0.4},
+        "I exercise every day": {"physical_activity": 1.0},
+        "I walk 5,000 steps": {"physical_activity": 0.5},
+        "My stress is about 8/10": {"stress_level": 0.8},
+    }
+    for text, factors in expected.items():
+        assert classifier.classify(text) == {"needs_extraction": False, "factors": factors}, text
+    
+    # Anything vaguer, negated or only partly covered goes to the model
+    for text in [
+        "I've been feeling very stressed at work",
+        "I didn't sleep 8 hours",
+        "I sleep 5 hours and eat too much",
+        "My partner cooks healthy dinners",
+        # No keyword, but still worth extracting
+        "had pizza and chips again",
+        "Sounds good, I will try that tomorrow",
+    ]:
+        assert classifier.classify(text)["needs_extraction"], text
+    
+    assert classifier.stats() == {
+        "classified": 16, "small_talk": 3, "rule_extracted": 7, "model_extracted": 6, "fast_path": 10
+    }
+    
+    # Words that only look like a factor do not count as mentions
+    for text in ["the rest of the day was fine", "I'm full of energy", "I lost my keys",
+                 "on a scale of 1 to 10", "my study group meets on Friday"]:
+        assert classifier.mentioned_factors(text) == [], text
+    
+    print("Messages classified correctly")
+
+def test_extractor_fast_path():
+    """Test that incremental extraction skips the model for messages the rules handle"""
+    print("Testing extraction fast path...")
+    
+    calls = []
+    
+    async def handler(request):
+        calls.append(request)
+        return httpx.Response(200, json={
+            "id": "msg_test",
+            "type": "message",
+            "role": "assistant",
+            "model": "test",
+            "content": [{
+                "type": "tool_use",
+                "id": "toolu_test",
+                "name": "extract_factors",
+                "input": {"factors": {"stress_level": 0.9}, "confidence": 0.7}
+            }],
+            "stop_reason": "tool_use",
+            "usage": {"input_tokens": 10, "output_tokens": 10}
+        })
+    
+    async def run():
+        client = AsyncAnthropic(
+            api_key="test", base_url="http://llm.test",
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        )
+        extractor = ConversationDataExtractor("test", client=client, classifier=FactorClassifier())
+        history = []
+        results = []
+        # The assistant's replies mention factors too, but only user messages are classified
+        for message in ["hi!", "I slept 5 hours", "work has me really stressed", "thanks!"]:
+            results.append(await extractor.extract_new_data_async("conv", history, message))
+            history += [
+                {"role": "user", "content": message},
+                {"role": "assistant", "content": "Try to sleep more and exercise."}
+            ]
+        await client.close()
+        return extractor, results
+    
+    extractor, results = asyncio.run(run())
+    assert len(calls) == 1
+    assert results[0]["factors"] == {}
+    assert results[1]["factors"] == {"sleep_quality": 0.625}
+    assert results[2]["factors"] == {"stress_level": 0.9}
+    assert results[3]["factors"] == {}
+    # Rule-extracted values still feed the summary of earlier findings
+    assert extractor.states["conv"].factors == {"sleep_quality": 0.625, "stress_level": 0.9}
+    assert extractor.classifier.stats()["fast_path"] == 3
+    
+    print("Model skipped for messages without signal")
+
+if __name__ == "__main__":
+    test_classification()
+    test_extractor_fast_path()
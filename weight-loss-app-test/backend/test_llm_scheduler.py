@@ -0,0 +1,244 @@
+import time
+import asyncio
+import httpx
+import anthropic
+from anthropic import AsyncAnthropic
+from data_extraction import ConversationDataExtractor
+from llm_scheduler import LLMScheduler, INTERACTIVE, BACKGROUND
+
+def api_error(error_class, status_code):
+    """Build an SDK error as raised for an HTTP response with the given status"""
+    response = httpx.Response(status_code, request=httpx.Request("POST", "http://llm.test/v1/messages"))
+    return error_class(f"HTTP {status_code}", response=response, body=None)
+
+def test_priority_and_concurrency():
+    """Test that calls over the cap queue and interactive calls run first"""
+    print("Testing priority queue...")
+    
+    async def run():
+        scheduler = LLMScheduler(max_concurrency=2, rate=0)
+        order = []
+        running = []
+        peak = []
+        release = asyncio.Event()
+        
+        async def call(name):
+            running.append(name)
+            peak.append(len(running))
+            if name.startswith("hold"):
+                await release.wait()
+            else:
+                await asyncio.sleep(0.01)
+            order.append(name)
+            running.remove(name)
+            return name
+        
+        held = [asyncio.ensure_future(scheduler.run(lambda n=n: call(n), BACKGROUND)) for n in ("hold1", "hold2")]
+        await asyncio.sleep(0.01)
+        queued = [
+            asyncio.ensure_future(scheduler.run(lambda: call("extract1"), BACKGROUND)),
+            asyncio.ensure_future(scheduler.run(lambda: call("extract2"), BACKGROUND)),
+            asyncio.ensure_future(scheduler.run(lambda: call("reply"), INTERACTIVE)),
+        ]
+        await asyncio.sleep(0.01)
+        stats = scheduler.stats()
+        assert stats["in_flight"] == 2
+        assert stats["queue_depth"] == 3 and stats["queued"] == {"interactive": 1, "background": 2}
+        
+        release.set()
+        await asyncio.gather(*held, *queued)
+        assert order[2] == "reply" and order[3:] == ["extract1", "extract2"], order
+        assert max(peak) == 2
+        stats = scheduler.stats()
+        assert stats["in_flight"] == 0 and stats["queue_depth"] == 0 and stats["calls"] == 5
+        assert stats["wait_max_ms"] > 0
+    
+    asyncio.run(run())
+    print("Interactive calls jump the queue")
+
+def test_rate_limit_and_cancellation():
+    """Test the token bucket, and that cancelled waiters do not leak slots"""
+    print("Testing rate limit and cancellation...")
+    
+    async def run():
+        scheduler = LLMScheduler(max_concurrency=10, rate=100, burst=2)
+        
+        async def call():
+            return True
+        
+        # Two calls start at once, the other four at 100 per second
+        start = time.perf_counter()
+        await asyncio.gather(*[scheduler.run(call) for _ in range(6)])
+        elapsed = time.perf_counter() - start
+        assert elapsed >= 0.035, f"{elapsed:.3f}s"
+        
+        scheduler = LLMScheduler(max_concurrency=1, rate=0)
+        release = asyncio.Event()
+        
+        async def hold():
+            await release.wait()
+        
+        holder = asyncio.ensure_future(scheduler.run(hold))
+        waiter = asyncio.ensure_future(scheduler.run(call))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.sleep(0.01)
+        release.set()
+        await holder
+        assert scheduler.stats()["in_flight"] == 0 and scheduler.stats()["queue_depth"] == 0
+        assert await scheduler.run(call)
+        return elapsed
+    
+    elapsed = asyncio.run(run())
+    print(f"Six calls took {elapsed * 1000:.0f}ms at 100/s with a burst of 2")
+
+def test_retries():
+    """Test that retryable errors are retried with backoff and others are raised at once"""
+    print("Testing retries...")
+    
+    async def run():
+        scheduler = LLMScheduler(max_concurrency=1, rate=0, max_retries=3, base_delay=0.001, max_delay=0.01)
+        attempts = []
+        
+        async def flaky():
+            attempts.append(True)
+            if len(attempts) == 1:
+                raise api_error(anthropic.RateLimitError, 429)
+            if len(attempts) == 2:
+                raise api_error(anthropic.InternalServerError, 529)
+            return "ok"
+        
+        assert await scheduler.run(flaky) == "ok"
+        assert len(attempts) == 3 and scheduler.stats()["retries"] == 2
+        
+        async def bad_request():
+            attempts.append(True)
+            raise api_error(anthropic.BadRequestError, 400)
+        
+        attempts.clear()
+        try:
+            await scheduler.run(bad_request)
+            assert False, "expected BadRequestError"
+        except anthropic.BadRequestError:
+            pass
+        assert len(attempts) == 1
+        
+        async def overloaded():
+            attempts.append(True)
+            raise api_error(anthropic.InternalServerError, 529)
+        
+        attempts.clear()
+        try:
+            await scheduler.run(overloaded)
+            assert False, "expected InternalServerError"
+        except anthropic.InternalServerError:
+            pass
+        assert len(attempts) == 4
+        assert scheduler.stats()["failures"] == 2 and scheduler.stats()["in_flight"] == 0
+        
+        # Backoff grows with the attempt, is capped, and honors retry-after
+        backoff = LLMScheduler(base_delay=1, max_delay=8)
+        assert all(0 <= backoff.backoff(0) <= 1 for _ in range(100))
+        assert all(0 <= backoff.backoff(10) <= 8 for _ in range(100))
+        error = anthropic.RateLimitError("HTTP 429", body=None, response=httpx.Response(
+            429, headers={"retry-after": "5"}, request=httpx.Request("POST", "http://llm.test")
+        ))
+        assert backoff.backoff(0, error) == 5
+    
+    asyncio.run(run())
+    print("Retryable errors retried")
+
+def test_stream_retry():
+    """Test that a stream is retried only until it has produced text"""
+    print("Testing streamed replies...")
+    
+    class Stream:
+        def __init__(self, pieces, fail_after=None):
+            self.pieces = pieces
+            self.fail_after = fail_after
+        
+        async def __aenter__(self):
+            if self.fail_after == 0:
+                raise api_error(anthropic.RateLimitError, 429)
+            return self
+        
+        async def __aexit__(self, *args):
+            return False
+        
+        @property
+        async def text_stream(self):
+            for i, piece in enumerate(self.pieces):
+                if i == self.fail_after:
+                    raise api_error(anthropic.InternalServerError, 500)
+                yield piece
+    
+    async def collect(scheduler, streams):
+        texts = []
+        async for text in scheduler.stream_text(lambda: streams.pop(0)):
+            texts.append(text)
+        return texts
+    
+    async def run():
+        scheduler = LLMScheduler(max_concurrency=1, rate=0, base_delay=0.001)
+        texts = await collect(scheduler, [Stream([], fail_after=0), Stream(["Hel", "lo"])])
+        assert texts == ["Hel", "lo"] and scheduler.stats()["retries"] == 1
+        
+        try:
+            await collect(scheduler, [Stream(["Hel", "lo"], fail_after=1), Stream(["Hel", "lo"])])
+            assert False, "expected InternalServerError"
+        except anthropic.InternalServerError:
+            pass
+        assert scheduler.stats()["retries"] == 1 and scheduler.stats()["in_flight"] == 0
+    
+    asyncio.run(run())
+    print("Streams retried before their first token only")
+
+def test_extractor_uses_scheduler():
+    """Test that extraction calls go through the scheduler and are retried"""
+    print("Testing scheduled extraction...")
+    
+    calls = []
+    
+    async def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(429, json={"type": "error", "error": {"type": "rate_limit_error", "message": "slow down"}})
+        return httpx.Response(200, json={
+            "id": "msg_test",
+            "type": "message",
+            "role": "assistant",
+            "model": "test",
+            "content": [{
+                "type": "tool_use",
+                "id": "toolu_test",
+                "name": "extract_factors",
+                "input": {"factors": {"sleep_quality": 0.3}, "confidence": 0.8}
+            }],
+            "stop_reason": "tool_use",
+            "usage": {"input_tokens": 10, "output_tokens": 10}
+        })
+    
+    async def run():
+        client = AsyncAnthropic(
+            api_key="test", base_url="http://llm.test", max_retries=0,
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        )
+        scheduler = LLMScheduler(base_delay=0.001)
+        extractor = ConversationDataExtractor("test", client=client, scheduler=scheduler)
+        result = await extractor.extract_data_async("user: I sleep 5 hours a night")
+        await client.close()
+        return scheduler, result
+    
+    scheduler, result = asyncio.run(run())
+    assert len(calls) == 2
+    assert result == {"factors": {"sleep_quality": 0.3}, "confidence": 0.8}
+    assert scheduler.stats()["calls"] == 2 and scheduler.stats()["retries"] == 1
+    
+    print("Extraction retried through the scheduler")
+
+if __name__ == "__main__":
+    test_priority_and_concurrency()
+    test_rate_limit_and_cancellation()
+    test_retries()
+    test_stream_retry()
+    test_extractor_uses_scheduler()
@@ -0,0 +1,126 @@
+import asyncio
+import httpx
+from fastapi import FastAPI
+from anthropic import AsyncAnthropic
+import fake_llm_server
+from data_extraction import ConversationDataExtractor
+from llm_scheduler import LLMScheduler
+from load_test import run_load, percentile, format_report
+
+def fake_client(**kwargs):
+    """SDK client talking to the fake LLM server in-process"""
+    return AsyncAnthropic(
+        api_key="fake", base_url="http://fake-llm", max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_llm_server.app)), **kwargs
+    )
+
+def test_fake_llm_server():
+    """Test that the SDK and the extractor work against the fake messages API"""
+    print("Testing fake LLM server...")
+    
+    latency, interval = fake_llm_server.LATENCY_MEDIAN_MS, fake_llm_server.TOKEN_INTERVAL_MS
+    fake_llm_server.LATENCY_MEDIAN_MS = 5
+    fake_llm_server.TOKEN_INTERVAL_MS = 0
+    try:
+        async def run():
+            client = fake_client()
+            extractor = ConversationDataExtractor("fake", client=client)
+            extracted = await extractor.extract_data_async("user: I sleep badly and work is stressful")
+            again = await extractor.extract_data_async("user: I sleep badly and work is stressful")
+            
+            reply = await client.messages.create(
+                model="fake", max_tokens=100, messages=[{"role": "user", "content": "Hello"}]
+            )
+            async with client.messages.stream(
+                model="fake", max_tokens=100, messages=[{"role": "user", "content": "Hello"}]
+            ) as stream:
+                pieces = [text async for text in stream.text_stream]
+            await client.close()
+            return extracted, again, reply, pieces
+        
+        extracted, again, reply, pieces = asyncio.run(run())
+    finally:
+        fake_llm_server.LATENCY_MEDIAN_MS, fake_llm_server.TOKEN_INTERVAL_MS = latency, interval
+    assert set(extracted["factors"]) == {"sleep_quality", "stress_level"}
+    assert all(0 <= value <= 1 for value in extracted["factors"].values())
+    # The same prompt gets the same answer
+    assert extracted == again
+    assert len(pieces) > 1 and "".join(pieces) == reply.content[0].text
+    
+    print("Fake server answers extraction, replies and streams")
+
+def test_fake_llm_errors():
+    """Test that simulated rate limits are retried by the scheduler"""
+    print("Testing simulated errors...")
+    
+    latency = fake_llm_server.LATENCY_MEDIAN_MS
+    fake_llm_server.LATENCY_MEDIAN_MS = 1
+    fake_llm_server.ERROR_RATE = 0.3
+    try:
+        async def run():
+            client = fake_client()
+            scheduler = LLMScheduler(rate=0, max_retries=10, base_delay=0.001)
+            extractor = ConversationDataExtractor("fake", client=client, scheduler=scheduler)
+            results = await asyncio.gather(*[
+                extractor.extract_data_async(f"user: I walked {n} miles") for n in range(20)
+            ])
+            await client.close()
+            return results, scheduler.stats()
+        
+        results, stats = asyncio.run(run())
+    finally:
+        fake_llm_server.LATENCY_MEDIAN_MS = latency
+        fake_llm_server.ERROR_RATE = 0
+    assert all("physical_activity" in result["factors"] for result in results)
+    assert stats["retries"] > 0 and stats["failures"] == 0
+    
+    print(f"{stats['retries']} simulated errors retried")
+
+def test_load_generator():
+    """Test that the load generator holds its rate and reports latency percentiles"""
+    print("Testing load generator...")
+    
+    assert percentile(list(range(1, 101)), 0.95) == 95
+    assert percentile([], 0.5) == 0.0
+    
+    app = FastAPI()
+    
+    @app.get("/recommendations")
+    async def recommendations():
+        await asyncio.sleep(0.01)
+        return {"recommendations": []}
+    
+    @app.get("/factors")
+    async def factors():
+        return {}
+    
+    @app.post("/factors/{factor}")
+    async def update_factor(factor: str):
+        return {"message": "ok"}
+    
+    @app.post("/chat")
+    async def chat():
+        await asyncio.sleep(0.05)
+        return {"response": "ok"}
+    
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend") as client:
+            return await run_load(client, rps=200, duration=1)
+    
+    report = asyncio.run(run())
+    print(format_report(report))
+    scenarios = report["scenarios"]
+    assert scenarios["all"]["count"] == 200 and scenarios["all"]["errors"] == 0
+    # Paced requests never exceed the target rate; a loaded machine may fall behind it
+    assert 0 < report["throughput_rps"] <= 210
+    assert scenarios["chat"]["p50_ms"] >= 50
+    assert scenarios["factors"]["p50_ms"] < scenarios["chat"]["p50_ms"]
+    assert scenarios["all"]["p50_ms"] <= scenarios["all"]["p95_ms"] <= scenarios["all"]["p99_ms"] <= scenarios["all"]["max_ms"]
+    
+    print("Load generator holds its rate")
+
+if __name__ == "__main__":
+    test_fake_llm_server()
+    test_fake_llm_errors()
+    test_load_generator()
@@ -1,5 +1,6 @@
 import matplotlib.pyplot as plt
-from simplified_obesity_network import SimpleObesityNetwork
+import numpy as np
+from simplified_obesity_network import SimpleObesityNetwork, bayesian_factor_update
 
 def test_network():
     """Test the obesity network model"""
@@ -14,6 +15,11 @@ def test_network():
     for i, rec in enumerate(recommendations, 1):
         print(f"{i}. {rec['factor']} - {rec['description']} - {rec['direction']} (impact: {rec['potential']:.2f})")
     
+    # Directions come from the model file
+    directions = {rec["factor"]: rec["direction"] for rec in network.get_top_recommendations(9)}
+    assert directions["caloric_intake"] == "decrease" and directions["hunger_hormones"] == "decrease"
+    assert directions["stress_level"] == "decrease" and directions["physical_activity"] == "increase"
+    
     # Visualize the network
     print("\nGenerating network visualization...")
     fig = network.visualize_network()
@@ -49,5 +55,197 @@ def test_network():
     
     print("\nTest completed successfully!")
 
+def test_matrix_engine():
+    """Test that the matrix engine matches the path-walking loop"""
+    print("Testing matrix engine against loop engine...")
+    
+    network = SimpleObesityNetwork()
+    network.update_relationship("stress_level", "sleep_quality", 0.9, 0.8)
+    network.update_relationship("hunger_hormones", "caloric_intake", 0.2, 0.5)
+    
+    loop_potentials = network.calculate_intervention_potential(engine="loop")
+    matrix_potentials = network.calculate_intervention_potential(engine="matrix")
+    
+    assert loop_potentials.keys() == matrix_potentials.keys()
+    for factor, potential in loop_potentials.items():
+        assert abs(potential - matrix_potentials[factor]) < 1e-12, factor
+    
+    print("Matrix engine matches loop engine")
+
+def test_all_paths_mode():
+    """Test the all-paths mode against an explicit truncated path sum"""
+    print("Testing all-paths mode...")
+    
+    network = SimpleObesityNetwork()
+    target = network.node_index["weight"]
+    
+    # Sum discounted paths explicitly until the series has converged
+    through = network.weight_matrix.copy()
+    through[:, target] = 0.0
+    term = network.weight_matrix[:, target].copy()
+    total = term.copy()
+    for _ in range(200):
+        term = 0.5 * through @ term
+        total += term
+    
+    all_paths = network.calculate_intervention_potential(mode="all_paths")
+    for factor, potential in all_paths.items():
+        expected = total[network.node_index[factor]] * network.modifiability[network.node_index[factor]]
+        assert abs(potential - expected) < 1e-9, factor
+    
+    # A strong cycle should trip the convergence guard
+    network.set_network_state({
+        "factors": {},
+        "relationships": [
+            {"from": "stress_level", "to": "sleep_quality", "strength": 4.0},
+            {"from": "sleep_quality", "to": "stress_level", "strength": 4.0},
+        ]
+    })
+    try:
+        network.calculate_intervention_potential(mode="all_paths")
+        assert False, "Expected the convergence guard to raise"
+    except ValueError as e:
+        print(f"Convergence guard raised: {e}")
+    
+    print("All-paths mode matches explicit path sum")
+
+def test_potential_cache():
+    """Test that potentials are memoized until an edge or modifiability changes"""
+    print("Testing potential cache...")
+    
+    network = SimpleObesityNetwork()
+    first = network.get_top_recommendations(3)
+    network.get_top_recommendations(3)
+    network.update_factor("sleep_quality", 0.3)  # Factor values do not affect potentials
+    network.calculate_intervention_potential()
+    assert network.cache_stats()["misses"] == 1
+    assert network.cache_stats()["hits"] == 2  # The second read and the potentials
+    
+    network.update_relationship("meal_timing", "metabolism", 0.9, 0.9)
+    updated = network.calculate_intervention_potential()
+    assert network.cache_stats()["misses"] == 2
+    for factor, potential in network.calculate_intervention_potential(engine="loop").items():
+        assert abs(updated[factor] - potential) < 1e-12, factor
+    
+    network.update_modifiability(first[0]["factor"], 0)
+    assert network.get_top_recommendations(1)[0]["factor"] != first[0]["factor"]
+    assert network.cache_stats()["misses"] == 3
+    assert network.cache_stats()["hits"] == 4
+    
+    print(f"Cache stats: {network.cache_stats()}")
+
+def test_materialized_recommendations():
+    """Test that the materialized recommendations track a full re-sort across writes"""
+    print("Testing materialized recommendations...")
+    
+    network = SimpleObesityNetwork()
+    network.get_top_recommendations(3)
+    
+    updates = [
+        ("caloric_intake", "weight", 0.1),
+        ("meal_timing", "metabolism", 1.0),
+        ("social_support", "stress_level", 1.0),
+        ("physical_activity", "weight", 0.2),
+    ]
+    for source, target, strength in updates:
+        network.update_relationship(source, target, strength, 1.0)
+        network.update_factor(source, 0.2)
+        
+        potentials = network.calculate_intervention_potential()
+        expected = sorted(potentials.items(), key=lambda x: x[1], reverse=True)[:5]
+        recommendations = network.get_top_recommendations(5)
+        assert [r["factor"] for r in recommendations] == [f for f, _ in expected]
+        for rec in recommendations:
+            assert rec["current_value"] == network.factors[rec["factor"]]["current"]
+    
+    print("Materialized recommendations match a full sort")
+
+def test_apply_updates():
+    """Test that a bulk update matches the equivalent single updates and is atomic"""
+    print("Testing bulk updates...")
+    
+    bulk = SimpleObesityNetwork()
+    single = SimpleObesityNetwork()
+    bulk.get_top_recommendations(3)
+    
+    counts = bulk.apply_updates({
+        "factors": [
+            {"factor": "sleep_quality", "value": 0.2, "confidence": 0.9},
+            {"factor": "stress_level", "value": 0.8}
+        ],
+        "relationships": [
+            {"source": "caloric_intake", "target": "weight", "strength": 0.1, "confidence": 1.0}
+        ]
+    })
+    assert counts == {"factors_updated": 2, "relationships_updated": 1}
+    
+    single.update_factor("sleep_quality", 0.2, 0.9)
+    single.update_factor("stress_level", 0.8)
+    single.update_relationship("caloric_intake", "weight", 0.1, 1.0)
+    assert bulk.get_network_state() == single.get_network_state()
+    assert bulk.get_top_recommendations(5) == single.get_top_recommendations(5)
+    
+    # One bad name rejects the whole batch
+    before = bulk.get_network_state()
+    try:
+        bulk.apply_updates({
+            "factors": [{"factor": "sleep_quality", "value": 1.0}, {"factor": "mood", "value": 0.5}]
+        })
+        assert False, "Expected the bulk update to be rejected"
+    except ValueError as e:
+        print(f"Rejected: {e}")
+    assert bulk.get_network_state() == before
+    
+    print("Bulk updates match single updates")
+
+def test_factor_precision():
+    """Test that factor precision accumulates with observations and decays with forgetting"""
+    print("Testing factor precision...")
+    
+    network = SimpleObesityNetwork()
+    
+    # The first observation matches the fixed-prior formula
+    network.update_factor("sleep_quality", 0.3, 0.7)
+    assert abs(network.factors["sleep_quality"]["current"] - 0.45) < 1e-12
+    
+    # Later observations move the estimate less and less
+    steps = []
+    for _ in range(5):
+        before = network.factors["sleep_quality"]["current"]
+        network.update_factor("sleep_quality", 0.0, 0.7)
+        steps.append(before - network.factors["sleep_quality"]["current"])
+    assert all(later < earlier for earlier, later in zip(steps, steps[1:]))
+    assert abs(network.factors["sleep_quality"]["precision"] - 0.7 * 7) < 1e-12
+    
+    # Pooled bulk observations match sequential ones without forgetting
+    bulk = SimpleObesityNetwork()
+    bulk.apply_updates({"factors": [{"factor": "sleep_quality", "value": v, "confidence": 0.7}
+                                    for v in (0.3, 0.0, 0.0, 0.0, 0.0, 0.0)]})
+    assert abs(bulk.factors["sleep_quality"]["current"] - network.factors["sleep_quality"]["current"]) < 1e-12
+    
+    # With forgetting, precision levels off at confidence / (1 - forgetting)
+    forgetful = SimpleObesityNetwork()
+    forgetful.forgetting = 0.5
+    for _ in range(50):
+        forgetful.update_factor("stress_level", 0.8, 0.7)
+    assert abs(forgetful.factors["stress_level"]["precision"] - 1.4) < 1e-9
+    
+    # An observation with no confidence on a factor with no precision keeps the prior
+    assert bayesian_factor_update(0.4, 0.0, 0.9, 0.0) == (0.4, 0.0)
+    posterior, _ = bayesian_factor_update(np.array([0.4, 0.4]), np.zeros(2), np.array([0.9, 0.9]), np.array([0.0, 0.5]))
+    assert posterior.tolist() == [0.4, 0.9]
+    
+    # Precision survives a JSON round trip
+    restored = SimpleObesityNetwork.from_json(network.to_json())
+    assert restored.factors["sleep_quality"]["precision"] == network.factors["sleep_quality"]["precision"]
+    
+    print("Factor precision behaves as expected")
+
 if __name__ == "__main__":
-    test_network() 
\ No newline at end of file
+    test_network()
+    test_matrix_engine()
+    test_all_paths_mode()
+    test_potential_cache()
+    test_materialized_recommendations()
+    test_apply_updates()
+    test_factor_precision() 
\ No newline at end of file
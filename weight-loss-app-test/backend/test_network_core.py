@@ -0,0 +1,45 @@
+from network_core import FactorGraph
+from simplified_obesity_network import SimpleObesityNetwork
+
+def test_factor_graph():
+    """Test the index-addressed graph behind the network model"""
+    print("Testing factor graph...")
+    
+    network = SimpleObesityNetwork()
+    graph = network.graph
+    
+    # Successor lists hold exactly the edges leaving each node, in relationship order
+    for node in graph.nodes:
+        expected = [k for k, (source, _) in enumerate(graph.edges) if source == node.name]
+        assert graph.successors(node.index).tolist() == expected, node.name
+    assert graph.edge("sleep_quality", "stress_level") == graph.edges.index(("sleep_quality", "stress_level"))
+    assert graph.edge("weight", "sleep_quality") is None
+    assert not hasattr(graph.nodes[0], "__dict__")
+    
+    # Updates land in the arrays that every view reads from
+    network.update_factor("sleep_quality", 0.2)
+    network.update_relationship("stress_level", "caloric_intake", 0.9)
+    i = graph.node_index["sleep_quality"]
+    k = graph.edge("stress_level", "caloric_intake")
+    assert network.factors["sleep_quality"]["current"] == graph.values[i]
+    assert network.weight_matrix[graph.node_index["stress_level"], graph.node_index["caloric_intake"]] == graph.weights[k]
+    
+    # The networkx export is a copy of the current state
+    exported = network.to_networkx()
+    assert exported.nodes["sleep_quality"]["current"] == graph.values[i]
+    assert exported["stress_level"]["caloric_intake"]["weight"] == graph.weights[k]
+    assert exported.number_of_edges() == graph.n_edges
+    exported["stress_level"]["caloric_intake"]["weight"] = 0.0
+    assert graph.weights[k] != 0.0
+    
+    for relationships in ([("sleep_quality", "unknown", 0.5)], [("sleep_quality", "weight", 0.5)] * 2):
+        try:
+            FactorGraph(network.factors, relationships, 0.7, 0.7)
+            assert False, "Invalid relationships should raise"
+        except ValueError:
+            pass
+    
+    print("Factor graph arrays back every view")
+
+if __name__ == "__main__":
+    test_factor_graph()
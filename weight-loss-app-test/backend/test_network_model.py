@@ -0,0 +1,122 @@
+import os
+import json
+import tempfile
+from network_model import load_model, parse_model, cache_path, clear_loaded_models, DEFAULT_MODEL_PATH
+from simplified_obesity_network import SimpleObesityNetwork
+from network_store import NetworkTopology, UserNetworkStore, batch_top_recommendations
+from network_benchmark import random_model, random_model_data, benchmark_size, format_report
+
+def test_model_file():
+    """Test loading, validating and caching model files"""
+    print("Testing model files...")
+    
+    # The bundled model is the default network
+    network = SimpleObesityNetwork()
+    assert network.model.name == "obesity" and len(network.factors) == 10 and len(network.relationships) == 14
+    assert network.factors["caloric_intake"]["modifiable"] == 10
+    assert ("stress_level", "sleep_quality", 0.6) in network.relationships
+    assert network.factors["caloric_intake"]["direction"] == "decrease"
+    # Factors without a direction improve by going up
+    assert all(attrs["direction"] == "increase" for attrs in random_model(20).factors.values())
+    
+    with open(DEFAULT_MODEL_PATH) as f:
+        data = json.load(f)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "model.json")
+        cache_dir = os.path.join(directory, "cache")
+        data["relationships"][0]["weight"] = 0.95
+        with open(path, "w") as f:
+            json.dump(data, f)
+        
+        model = load_model(path, cache_dir=cache_dir)
+        assert model.relationships[0] == ("caloric_intake", "weight", 0.95)
+        assert load_model(path, cache_dir=cache_dir) is model
+        assert os.path.exists(cache_path(path, cache_dir))
+        
+        # A fresh process reads the compiled copy, which matches the file
+        clear_loaded_models()
+        cached = load_model(path, cache_dir=cache_dir)
+        assert cached is not model and cached.digest == model.digest
+        assert cached.factors == model.factors and cached.relationships == model.relationships
+        
+        # The compiled copy is plain JSON, and one that is not is ignored rather than run
+        with open(cache_path(path, cache_dir)) as f:
+            assert json.load(f)["digest"] == model.digest
+        with open(cache_path(path, cache_dir), "wb") as f:
+            f.write(b"\x80\x04K\x01.")
+        clear_loaded_models()
+        assert load_model(path, cache_dir=cache_dir).relationships == model.relationships
+        
+        # A cache that cannot be written leaves no temporary file behind
+        blocked_dir = os.path.join(directory, "blocked")
+        os.makedirs(cache_path(path, blocked_dir))
+        clear_loaded_models()
+        assert load_model(path, cache_dir=blocked_dir).relationships == model.relationships
+        assert os.listdir(blocked_dir) == [os.path.basename(cache_path(path, blocked_dir))]
+        
+        # Editing the file invalidates the compiled copy
+        data["version"] = "1.2.0"
+        data["relationships"][0]["weight"] = 0.5
+        with open(path, "w") as f:
+            json.dump(data, f, indent=2)
+        clear_loaded_models()
+        edited = load_model(path, cache_dir=cache_dir)
+        assert edited.version == "1.2.0" and edited.relationships[0][2] == 0.5
+        
+        try:
+            import yaml
+        except ImportError:
+            yaml = None
+        if yaml is not None:
+            yaml_path = os.path.join(directory, "model.yaml")
+            with open(yaml_path, "w") as f:
+                yaml.safe_dump(data, f)
+            assert load_model(yaml_path, cache_dir=cache_dir).relationships == edited.relationships
+    
+    broken = [
+        {**data, "schema_version": 99},
+        {**data, "target": "missing"},
+        {**data, "relationships": data["relationships"] + [{"from": "weight", "to": "nowhere", "weight": 0.5}]},
+        {**data, "relationships": data["relationships"] + data["relationships"][:1]},
+        {**data, "factors": {**data["factors"], "sleep_quality": {"modifiable": 11, "baseline": 0.5}}},
+        {**data, "factors": {**data["factors"], "sleep_quality": {"modifiable": 7, "baseline": 0.5, "direction": "up"}}},
+    ]
+    for definition in broken:
+        try:
+            parse_model(definition)
+            assert False, "Invalid model should raise"
+        except ValueError as e:
+            print(f"Rejected: {e}")
+    
+    print("Model files load, cache and validate")
+
+def test_large_model():
+    """Test that networks and the store work on a model with hundreds of factors"""
+    print("Testing a large model...")
+    
+    model = random_model(300, degree=3)
+    network = SimpleObesityNetwork(model)
+    assert network.target == network.node_index["target"]
+    
+    recommendations = network.get_top_recommendations(5)
+    assert len(recommendations) == 5 and all(r["factor"] != "target" for r in recommendations)
+    loop = network.calculate_intervention_potential(engine="loop")
+    matrix = network.calculate_intervention_potential()
+    assert max(abs(loop[f] - matrix[f]) for f in matrix) < 1e-9
+    
+    topology = NetworkTopology.from_network(network)
+    store = UserNetworkStore(topology, spill_dir=None)
+    assert store.get_top_recommendations("user", 5) == recommendations
+    assert store.to_network("user").model is model
+    batch = batch_top_recommendations(topology, [topology.default_weights] * 3, 5)
+    assert [r["factor"] for r in batch[0]] == [r["factor"] for r in recommendations]
+    
+    assert random_model_data(50, seed=1) == random_model_data(50, seed=1)
+    print(format_report([benchmark_size(size, repeat=1, users=4) for size in (10, 50)]))
+    
+    print("Large model scores like the bundled one")
+
+if __name__ == "__main__":
+    test_model_file()
+    test_large_model()
@@ -0,0 +1,90 @@
+import gc
+import time
+import tracemalloc
+import matplotlib.pyplot as plt
+from simplified_obesity_network import SimpleObesityNetwork
+from network_store import NetworkTopology, UserNetworkStore
+from network_render import NetworkRenderer, etag_matches, topology_layout
+
+def render_inputs(network):
+    state = network.get_network_state()
+    potentials = network.calculate_intervention_potential()
+    highlighted = [r["factor"] for r in network.get_top_recommendations(3)]
+    return state, potentials, highlighted
+
+def test_render_cache():
+    """Test that images are cached by content and unchanged networks are not redrawn"""
+    print("Testing render cache...")
+    
+    renderer = NetworkRenderer()
+    network = SimpleObesityNetwork()
+    inputs = render_inputs(network)
+    
+    png, etag = renderer.render(*inputs, "png")
+    assert png.startswith(b"\x89PNG")
+    svg, svg_etag = renderer.render(*inputs, "svg")
+    assert b"<svg" in svg and svg_etag != etag
+    
+    start = time.perf_counter()
+    again, again_etag = renderer.render(*inputs, "png")
+    elapsed = time.perf_counter() - start
+    assert again is png and again_etag == etag
+    assert elapsed < 0.05
+    assert renderer.stats()["hits"] == 1 and renderer.stats()["misses"] == 2
+    
+    # A weight change gives a new image but reuses the layout
+    layout_misses = topology_layout.cache_info().misses
+    network.update_relationship("sleep_quality", "stress_level", 0.9)
+    changed, changed_etag = renderer.render(*render_inputs(network), "png")
+    assert changed_etag != etag and changed != png
+    assert topology_layout.cache_info().misses == layout_misses
+    
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag) and not etag_matches('"other"', etag)
+    
+    try:
+        renderer.render(*inputs, "gif")
+        assert False, "Unsupported format should raise"
+    except ValueError:
+        pass
+    
+    print(f"Cached render served in {elapsed * 1000:.2f}ms")
+
+def test_render_memory():
+    """Test that rendering many networks keeps memory bounded and leaves no figures open"""
+    print("Testing render memory...")
+    
+    store = UserNetworkStore(NetworkTopology.from_network(SimpleObesityNetwork()), spill_dir=None)
+    renderer = NetworkRenderer(max_bytes=100 * 1024)
+    figures = plt.get_fignums()
+    
+    def render_user(number):
+        store.update_factor(f"user-{number}", "sleep_quality", (number % 10) / 10)
+        store.update_relationship(f"user-{number}", "stress_level", "caloric_intake", 0.2 + number / 100)
+        network = store.view(f"user-{number}")
+        renderer.render(*render_inputs(network), "png")
+    
+    tracemalloc.start()
+    # Fill the image cache and warm up matplotlib's font and text caches
+    for number in range(10):
+        render_user(number)
+    gc.collect()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for number in range(10, 20):
+        render_user(number)
+    gc.collect()
+    growth = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    
+    stats = renderer.stats()
+    assert stats["bytes"] <= 100 * 1024 and stats["evictions"] > 0
+    assert growth < 256 * 1024, f"Memory grew by {growth} bytes"
+    assert plt.get_fignums() == figures
+    
+    print(f"{stats['misses']} renders, {stats['entries']} cached, memory grew {growth / 1024:.0f}KiB")
+
+if __name__ == "__main__":
+    test_render_cache()
+    test_render_memory()
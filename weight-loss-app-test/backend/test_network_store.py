@@ -0,0 +1,239 @@
+import os
+import json
+import tempfile
+import threading
+import multiprocessing
+from simplified_obesity_network import SimpleObesityNetwork
+import numpy as np
+from network_store import NetworkTopology, UserNetworkStore, SharedStateDB, widen, SPILL_MAGIC
+from network_benchmark import random_model
+from network_model import parse_model, DEFAULT_MODEL_PATH
+
+def test_network_store():
+    """Test per-user network state, LRU eviction and spill to disk"""
+    print("Testing per-user network store...")
+    
+    topology = NetworkTopology.from_network(SimpleObesityNetwork())
+    
+    with tempfile.TemporaryDirectory() as spill_dir:
+        store = UserNetworkStore(topology, capacity=2, spill_dir=spill_dir)
+        
+        # Users do not see each other's updates
+        store.update_factor("alice", "sleep_quality", 0.1, 0.9)
+        store.update_relationship("alice", "caloric_intake", "weight", 0.1, 1.0)
+        assert store.get_factors("bob")["sleep_quality"]["current"] == topology.baselines[2]
+        assert store.get_factors("alice")["sleep_quality"]["current"] < 0.4
+        
+        # The store matches a full network given the same updates
+        reference = SimpleObesityNetwork()
+        reference.update_factor("sleep_quality", 0.1, 0.9)
+        assert abs(store.get_factors("alice")["sleep_quality"]["precision"]
+                   - reference.factors["sleep_quality"]["precision"]) < 1e-6
+        reference.update_relationship("caloric_intake", "weight", 0.1, 1.0)
+        expected = reference.get_top_recommendations(3)
+        recommendations = store.get_top_recommendations("alice", 3)
+        assert [r["factor"] for r in recommendations] == [r["factor"] for r in expected]
+        for rec, ref in zip(recommendations, expected):
+            assert abs(rec["potential"] - ref["potential"]) < 1e-6
+        
+        # Touching more users than the capacity spills alice to disk and reloads her
+        alice_state = store.get_network_state("alice")
+        store.get_factors("bob")
+        store.get_factors("carol")
+        assert store.stats()["users_in_memory"] == 2
+        assert store.stats()["spills"] == 1
+        assert store.get_network_state("alice") == alice_state
+        assert store.stats()["loads"] == 1
+        
+        print(f"Store stats: {store.stats()}")
+    
+    # Forgetting must keep some of the prior precision
+    for forgetting in (0.0, 1.5):
+        try:
+            UserNetworkStore(topology, forgetting=forgetting)
+            assert False, "Invalid forgetting should raise"
+        except ValueError as e:
+            print(f"Rejected: {e}")
+    
+    print("Network store test completed successfully!")
+
+def test_batch_recommendations():
+    """Test that batch scoring matches scoring each user on its own"""
+    print("Testing batch recommendations...")
+    
+    topology = NetworkTopology.from_network(SimpleObesityNetwork())
+    store = UserNetworkStore(topology)
+    
+    user_ids = [f"user-{i}" for i in range(20)]
+    for i, user_id in enumerate(user_ids):
+        source, target = topology.edges[i % topology.n_edges]
+        store.update_relationship(user_id, source, target, (i % 5) / 4, 1.0)
+        store.update_factor(user_id, source, 0.1, 0.9)
+    
+    for mode in ("second_order", "all_paths"):
+        batch = store.batch_top_recommendations(user_ids, 4, mode)
+        for user_id, recommendations in zip(user_ids, batch):
+            assert recommendations == store.get_top_recommendations(user_id, 4, mode), user_id
+    
+    print("Batch recommendations match per-user recommendations")
+
+def _update_shared_edge(db_path, updates):
+    """Worker process body: apply edge updates through its own store"""
+    topology = NetworkTopology.from_network(SimpleObesityNetwork())
+    store = UserNetworkStore(topology, shared_db=SharedStateDB(db_path))
+    for _ in range(updates):
+        store.update_relationship("alice", "sleep_quality", "stress_level", 0.5, 0.001)
+
+def test_shared_network_store():
+    """Test that stores sharing a database (one per worker) stay consistent"""
+    print("Testing shared network store...")
+    
+    topology = NetworkTopology.from_network(SimpleObesityNetwork())
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "network_store.db")
+        worker_a = UserNetworkStore(topology, shared_db=SharedStateDB(db_path))
+        worker_b = UserNetworkStore(topology, shared_db=SharedStateDB(db_path))
+        
+        # A write in one worker is visible to the other, including cached rankings
+        before = worker_b.get_top_recommendations("alice", 1)
+        worker_a.update_factor("alice", "sleep_quality", 0.1, 0.9)
+        worker_a.update_relationship("alice", "caloric_intake", "weight", 0.0, 5.0)
+        assert worker_b.get_factors("alice") == worker_a.get_factors("alice")
+        assert worker_b.get_top_recommendations("alice", 1) != before
+        
+        # Concurrent read-modify-writes from several processes are not lost
+        processes = [
+            multiprocessing.Process(target=_update_shared_edge, args=(db_path, 50))
+            for _ in range(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        
+        confidence = next(
+            rel["confidence"] for rel in worker_b.get_network_state("alice")["relationships"]
+            if (rel["from"], rel["to"]) == ("sleep_quality", "stress_level")
+        )
+        assert abs(confidence - (0.7 + 200 * 0.001 * 0.3)) < 1e-4, confidence
+        
+        # States loaded from the database count against the reader's capacity
+        reader = UserNetworkStore(topology, capacity=2, shared_db=SharedStateDB(db_path))
+        for i in range(20):
+            worker_a.update_factor(f"user-{i}", "sleep_quality", 0.2)
+            assert reader.get_factors(f"user-{i}") == worker_a.get_factors(f"user-{i}")
+        assert reader.stats()["users_in_memory"] <= 2
+        
+        print(f"Store stats: {worker_b.stats()}")
+    
+    print("Shared network store test completed successfully!")
+
+def test_store_ranking():
+    """Test that the store's partial selection matches the network at any depth"""
+    print("Testing store ranking...")
+    
+    network = SimpleObesityNetwork(random_model(60, seed=3))
+    store = UserNetworkStore(NetworkTopology.from_network(network), spill_dir=None)
+    for n in (3, 10, 25):
+        assert store.get_top_recommendations("user", n) == network.get_top_recommendations(n)
+    assert store.calculate_intervention_potential("user") == network.calculate_intervention_potential()
+    assert store.stats()["ranking_misses"] == 1
+    
+    stored = np.array([0.6, 0.85, 12.3, 0.0, -0.4, 1e-5], dtype=np.float32)
+    assert widen(stored).tolist() == [0.6, 0.85, 12.3, 0.0, -0.4, 1e-5]
+    
+    print("Store ranking matches the network")
+
+def test_concurrent_store():
+    """Test that concurrent updates survive eviction and spilling"""
+    print("Testing concurrent store updates...")
+    
+    topology = NetworkTopology.from_network(SimpleObesityNetwork())
+    users = [f"user{i}" for i in range(24)]
+    
+    def updates(user_id):
+        for step in range(5):
+            yield "sleep_quality", (step + len(user_id)) % 10 / 10
+    
+    with tempfile.TemporaryDirectory() as spill_dir:
+        # A capacity far below the user count keeps states moving to and from disk
+        store = UserNetworkStore(topology, capacity=3, spill_dir=spill_dir)
+        
+        def worker(offset):
+            for user_id in users[offset::4]:
+                for factor, value in updates(user_id):
+                    store.update_factor(user_id, factor, value, 0.8)
+                    store.get_top_recommendations(users[(offset + 1) % len(users)])
+        
+        threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        reference = UserNetworkStore(topology, capacity=len(users))
+        for user_id in users:
+            for factor, value in updates(user_id):
+                reference.update_factor(user_id, factor, value, 0.8)
+            assert store.get_network_state(user_id) == reference.get_network_state(user_id)
+        assert store.stats()["spills"] > 0
+    
+    print("Concurrent updates survive eviction")
+
+def test_state_model_check():
+    """Test that stored states are only applied under the model that saved them"""
+    print("Testing stored state model check...")
+    
+    topology = NetworkTopology.from_network(SimpleObesityNetwork())
+    with open(DEFAULT_MODEL_PATH) as f:
+        data = json.load(f)
+    # Same size, different factor order
+    data["factors"] = dict(reversed(list(data["factors"].items())))
+    reordered = NetworkTopology.from_network(SimpleObesityNetwork(parse_model(data)))
+    assert reordered.state_size == topology.state_size and reordered.fingerprint != topology.fingerprint
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Spilled states
+        spill_dir = os.path.join(tmp_dir, "spill")
+        store = UserNetworkStore(topology, capacity=1, spill_dir=spill_dir)
+        store.update_factor("alice", "sleep_quality", 0.1, 0.9)
+        store.get_factors("bob")
+        assert store.stats()["spills"] == 1
+        other = UserNetworkStore(reordered, spill_dir=spill_dir)
+        assert other.get_factors("alice")["sleep_quality"]["current"] == reordered.baselines[reordered.node_index["sleep_quality"]]
+        assert other.stats()["loads"] == 0
+        
+        # Spill files without the model header are ignored
+        path = store._spill_path("alice")
+        with open(path, "rb") as f:
+            raw = f.read()
+        with open(path, "wb") as f:
+            f.write(raw[len(SPILL_MAGIC) + len(topology.fingerprint):])
+        fresh = UserNetworkStore(topology, spill_dir=spill_dir)
+        assert fresh.get_factors("alice") == UserNetworkStore(topology).get_factors("alice")
+        assert fresh.stats()["loads"] == 0
+        
+        # Shared database rows
+        db_path = os.path.join(tmp_dir, "network_store.db")
+        shared = UserNetworkStore(topology, shared_db=SharedStateDB(db_path))
+        shared.update_factor("carol", "sleep_quality", 0.25, 0.9)
+        shared.update_factor("dave", "stress_level", 0.9, 0.9)
+        
+        other = UserNetworkStore(reordered, shared_db=SharedStateDB(db_path))
+        for user_id in ("carol", "dave"):
+            assert other.get_network_state(user_id)["factors"] == SimpleObesityNetwork(parse_model(data)).get_network_state()["factors"]
+        # Writing under the new model replaces the old row
+        other.update_factor("dave", "sleep_quality", 0.2)
+        assert UserNetworkStore(reordered, shared_db=SharedStateDB(db_path)).get_factors("dave") == other.get_factors("dave")
+        assert shared.get_factors("dave")["stress_level"]["current"] == topology.baselines[topology.node_index["stress_level"]]
+    
+    print("States saved under another model are ignored")
+
+if __name__ == "__main__":
+    test_network_store()
+    test_batch_recommendations()
+    test_shared_network_store()
+    test_store_ranking()
+    test_concurrent_store()
+    test_state_model_check()
@@ -0,0 +1,143 @@
+import asyncio
+import json
+from simplified_obesity_network import SimpleObesityNetwork
+from observation_ingest import ingest_stream, iter_lines, MAX_LINE_BYTES
+
+DAY = 86400
+
+async def chunked(data, size):
+    """Yield data in fixed-size chunks, splitting lines across chunk boundaries"""
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+def to_ndjson(observations):
+    return "".join(json.dumps(o) + "\n" for o in observations).encode()
+
+def test_windowed_aggregation():
+    """Test that observations are reduced per window and applied to the network"""
+    print("Testing windowed observation aggregation...")
+    
+    observations = [
+        # Day 0: 6h + 1h nap, 4000 + 4000 steps, meals at 8:00 and 19:00
+        {"type": "sleep", "timestamp": 0 * DAY + 3600, "value": 6},
+        {"type": "sleep", "timestamp": 0 * DAY + 14 * 3600, "value": 1},
+        {"type": "steps", "timestamp": 0 * DAY + 9 * 3600, "value": 4000},
+        {"type": "steps", "timestamp": 0 * DAY + 18 * 3600, "value": 4000},
+        {"type": "meal", "timestamp": 0 * DAY + 8 * 3600},
+        {"type": "meal", "timestamp": 0 * DAY + 19 * 3600},
+        # Day 1: 8h sleep, 12000 steps, meals an hour later than usual
+        {"type": "sleep", "timestamp": "1970-01-02T02:00:00", "value": 8},
+        {"type": "steps", "timestamp": 1 * DAY + 12 * 3600, "value": 12000},
+        {"type": "meal", "timestamp": 1 * DAY + 9 * 3600},
+        {"type": "meal", "timestamp": 1 * DAY + 20 * 3600},
+        # Late and malformed lines are skipped
+        {"type": "steps", "timestamp": 0 * DAY + 20 * 3600, "value": 500},
+        {"type": "heart_rate", "timestamp": 1 * DAY, "value": 70},
+        {"type": "sleep", "timestamp": 1 * DAY, "value": -1},
+    ]
+    data = to_ndjson(observations) + b"not json\n"
+    
+    batches = []
+    network = SimpleObesityNetwork()
+    
+    async def apply_batch(batch):
+        batches.append(batch)
+        network.apply_updates(batch)
+    
+    summary = asyncio.run(ingest_stream(chunked(data, 7), apply_batch, batch_size=2, final=True))
+    
+    assert summary["observations"] == 11
+    assert summary["late"] == 1
+    assert summary["rejected"] == 3 and len(summary["errors"]) == 3
+    assert summary["updates"] == 5 and summary["batches"] == 2
+    assert summary["open_windows"] == 0
+    
+    updates = [update for batch in batches for update in batch["factors"]]
+    values = {}
+    for update in updates:
+        values.setdefault(update["factor"], []).append(update["value"])
+    assert values["sleep_quality"] == [7 / 8, 1.0]
+    assert values["physical_activity"] == [0.8, 1.0]
+    assert values["meal_timing"] == [1 - 3600 / (3 * 3600)]
+    
+    # The network sees the same result as updating it directly
+    expected = SimpleObesityNetwork()
+    for update in updates:
+        expected.update_factor(update["factor"], update["value"], update["confidence"])
+    for factor in values:
+        assert abs(network.factors[factor]["current"] - expected.factors[factor]["current"]) < 1e-12
+    
+    # Without final, the still-open day is left for a later stream
+    summary = asyncio.run(ingest_stream(chunked(data, 7), lambda batch: asyncio.sleep(0), batch_size=2))
+    assert summary["updates"] == 2 and summary["open_windows"] == 3
+    
+    print("Observations aggregated correctly")
+
+def test_backpressure():
+    """Test that the reader stops pulling from the stream while the applier is behind"""
+    print("Testing ingestion backpressure...")
+    
+    days = 200
+    data = to_ndjson({"type": "steps", "timestamp": day * DAY, "value": 5000} for day in range(days))
+    progress = {"read": 0, "applied": 0, "ahead": 0}
+    
+    async def stream():
+        for line in data.splitlines(keepends=True):
+            progress["read"] += 1
+            progress["ahead"] = max(progress["ahead"], progress["read"] - progress["applied"])
+            yield line
+    
+    async def apply_batch(batch):
+        await asyncio.sleep(0.001)
+        progress["applied"] += len(batch["factors"])
+    
+    summary = asyncio.run(ingest_stream(stream(), apply_batch, batch_size=4, queue_size=2))
+    # The last day is still open
+    assert summary["updates"] == days - 1 and summary["open_windows"] == 1
+    # At most the queued batches, the batch being applied and the one being filled
+    assert progress["ahead"] <= 4 * (2 + 2) + 1
+    
+    print("Backpressure bounds the data read ahead")
+
+def test_apply_failure():
+    """Test that a failing applier stops the reader instead of leaving it blocked on a full queue"""
+    print("Testing ingestion apply failure...")
+    
+    data = to_ndjson({"type": "steps", "timestamp": day * DAY, "value": 5000} for day in range(200))
+    
+    async def apply_batch(batch):
+        # Let the reader fill the queue before failing
+        await asyncio.sleep(0.01)
+        raise RuntimeError("network unavailable")
+    
+    async def run():
+        try:
+            await ingest_stream(chunked(data, 64), apply_batch, batch_size=4, queue_size=2)
+            assert False, "Apply failure should propagate"
+        except RuntimeError as e:
+            print(f"Propagated: {e}")
+        # No reader task is left behind
+        assert asyncio.all_tasks() == {asyncio.current_task()}
+    
+    asyncio.run(run())
+    
+    print("Reader stopped after the apply failure")
+
+def test_line_limit():
+    """Test that over-long lines are rejected without being buffered"""
+    print("Testing line length limit...")
+    
+    data = b"x" * (MAX_LINE_BYTES + 10) + b"\n{\"a\": 1}\n"
+    
+    async def collect():
+        return [line async for line in iter_lines(chunked(data, 1000))]
+    
+    assert asyncio.run(collect()) == [None, b"{\"a\": 1}"]
+    
+    print("Over-long lines rejected")
+
+if __name__ == "__main__":
+    test_windowed_aggregation()
+    test_backpressure()
+    test_apply_failure()
+    test_line_limit()
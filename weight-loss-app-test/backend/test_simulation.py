@@ -0,0 +1,120 @@
+import time
+import numpy as np
+from simplified_obesity_network import SimpleObesityNetwork
+from network_store import NetworkTopology, UserNetworkStore
+from network_benchmark import random_model
+from simulation import simulate_network, propagate, relevant_edges
+
+def test_simulation():
+    """Test what-if simulations on the obesity network"""
+    print("Testing simulation...")
+    
+    network = SimpleObesityNetwork()
+    graph = network.graph
+    
+    # With fixed weights, a unit change to one factor moves the target by its potential before modifiability
+    for mode in ("second_order", "all_paths"):
+        potentials = network.calculate_intervention_potential(mode=mode)
+        for factor in ("caloric_intake", "physical_activity", "meal_timing", "social_support"):
+            i = network.node_index[factor]
+            change = np.zeros(graph.n_nodes)
+            change[i] = 1.0
+            effect = propagate(graph.weights[:, None], graph.edge_sources, graph.edge_targets,
+                               change, change != 0, network.target, mode)[0]
+            assert abs(effect - potentials[factor] / graph.modifiability[i]) < 1e-9, (mode, factor)
+    
+    # Improving sleep and stress together lowers weight, by more than either alone
+    both = simulate_network(network, {"sleep_quality": 0.9, "stress_level": 0.3}, seed=1)
+    sleep = simulate_network(network, {"sleep_quality": 0.9}, seed=1)
+    assert both["target"] == "weight" and both["draws"] == 2000 and both["diverged"] == 0
+    assert both["interventions"]["stress_level"] == {"from": 0.6, "to": 0.3}
+    assert both["change"]["mean"] < sleep["change"]["mean"] < 0
+    assert both["change"]["p5"] <= both["change"]["p50"] <= both["change"]["p95"]
+    assert abs(both["predicted"]["mean"] - (both["current"] + both["change"]["mean"])) < 1e-9
+    assert both["probability_of_decrease"] > 0.9
+    print(f"Sleep and stress together: weight change {both['change']['mean']:.3f} "
+          f"(90% interval {both['change']['p5']:.3f} to {both['change']['p95']:.3f})")
+    
+    # The same seed gives the same draws; more confident edges give a narrower outcome
+    assert simulate_network(network, {"sleep_quality": 0.9, "stress_level": 0.3}, seed=1) == both
+    network.update_relationship("sleep_quality", "hunger_hormones", 0.6, confidence=1.0)
+    network.update_relationship("hunger_hormones", "caloric_intake", 0.7, confidence=1.0)
+    assert simulate_network(network, {"sleep_quality": 0.9}, seed=1)["change"]["std"] < sleep["change"]["std"]
+    
+    # An intervention holds its factor at the set value even when that is its current value,
+    # so it blocks the paths an upstream intervention would take through it
+    fresh = SimpleObesityNetwork()
+    hunger = fresh.factors["hunger_hormones"]["current"]
+    held = simulate_network(fresh, {"sleep_quality": 0.9, "hunger_hormones": hunger}, seed=1)
+    free = simulate_network(fresh, {"sleep_quality": 0.9}, seed=1)
+    assert held["interventions"]["hunger_hormones"] == {"from": hunger, "to": hunger}
+    assert free["change"]["mean"] < held["change"]["mean"] < 0
+    change = np.zeros(fresh.graph.n_nodes)
+    change[fresh.node_index["sleep_quality"]] = 1.0
+    fixed = change != 0
+    fixed[fresh.node_index["hunger_hormones"]] = True
+    cut = fresh.graph.edge_targets != fresh.node_index["hunger_hormones"]
+    assert abs(propagate(fresh.graph.weights[:, None], fresh.graph.edge_sources, fresh.graph.edge_targets,
+                         change, fixed, fresh.target)[0]
+               - propagate(fresh.graph.weights[cut, None], fresh.graph.edge_sources[cut], fresh.graph.edge_targets[cut],
+                           change, change != 0, fresh.target)[0]) < 1e-12
+    
+    # Factors that improve by going down lower weight when they are cut, and raise it when they grow
+    for factor in ("caloric_intake", "hunger_hormones"):
+        lowered = simulate_network(network, {factor: 0.2}, seed=1)
+        raised = simulate_network(network, {factor: 1.0}, seed=1)
+        assert lowered["change"]["mean"] < 0 < raised["change"]["mean"], factor
+        assert lowered["probability_of_decrease"] > 0.9 and raised["probability_of_decrease"] < 0.1, factor
+    
+    for interventions, kwargs in (({}, {}), ({"unknown": 0.5}, {}), ({"weight": 0.2}, {}),
+                                  ({"sleep_quality": 1.5}, {}), ({"sleep_quality": True}, {}),
+                                  ({"sleep_quality": 0.9}, {"draws": 0}),
+                                  ({"sleep_quality": 0.9}, {"mode": "third_order"})):
+        try:
+            simulate_network(network, interventions, **kwargs)
+            assert False, "Invalid simulation should raise"
+        except ValueError as e:
+            print(f"Rejected: {e}")
+    
+    # The store simulates on the user's own state
+    store = UserNetworkStore(NetworkTopology.from_network(SimpleObesityNetwork()), spill_dir=None)
+    stored = store.view("user").simulate({"sleep_quality": 0.9, "stress_level": 0.3}, seed=1)
+    assert stored["change"] == both["change"]
+    store.update_factor("user", "sleep_quality", 0.2)
+    assert store.simulate("user", {"sleep_quality": 0.9}, seed=1)["interventions"]["sleep_quality"]["from"] < 0.6
+    
+    print("Simulations match the network's potentials")
+
+def test_large_simulation():
+    """Test that simulations on large graphs stay fast and only touch the edges they need"""
+    print("Testing simulation on a large model...")
+    
+    network = SimpleObesityNetwork(random_model(500))
+    graph = network.graph
+    interventions = {"factor_0000": 0.9, "factor_0001": 0.9, "factor_0002": 0.1}
+    
+    change = np.zeros(graph.n_nodes)
+    change[[0, 1, 2]] = 1.0
+    used = relevant_edges(graph.edge_sources, graph.edge_targets, change, change != 0, network.target)
+    assert 0 < len(used) < graph.n_edges
+    
+    # Pruned edges never change the result
+    full = propagate(graph.weights[:, None], graph.edge_sources, graph.edge_targets, change, change != 0, network.target)
+    pruned = propagate(graph.weights[used, None], graph.edge_sources[used], graph.edge_targets[used],
+                       change, change != 0, network.target)
+    assert abs(full[0] - pruned[0]) < 1e-9
+    
+    for mode in ("second_order", "all_paths"):
+        simulate_network(network, interventions, mode=mode, seed=0)
+        start = time.perf_counter()
+        result = simulate_network(network, interventions, mode=mode, seed=0)
+        elapsed = time.perf_counter() - start
+        print(f"{mode}: {elapsed * 1000:.1f} ms for {result['draws']} draws")
+        assert result["diverged"] == 0
+        assert elapsed < 0.5
+    
+    print("Large simulations stay fast")
+
+if __name__ == "__main__":
+    test_simulation()
+    test_large_simulation()
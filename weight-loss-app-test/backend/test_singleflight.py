@@ -0,0 +1,122 @@
+import asyncio
+import httpx
+from anthropic import AsyncAnthropic
+from data_extraction import ConversationDataExtractor
+from singleflight import SingleFlight
+
+def test_coalescing():
+    """Test that concurrent identical calls share one execution"""
+    print("Testing call coalescing...")
+    
+    async def run():
+        flight = SingleFlight()
+        executions = []
+        
+        async def call(value):
+            executions.append(value)
+            await asyncio.sleep(0.05)
+            return {"value": value}
+        
+        results = await asyncio.gather(
+            *[flight.do("a", lambda: call(1)) for _ in range(50)],
+            flight.do("b", lambda: call(2))
+        )
+        assert executions == [1, 2]
+        assert all(result is results[0] for result in results[:50])
+        assert results[50] == {"value": 2}
+        assert flight.stats() == {"calls": 2, "coalesced": 49, "in_flight": 0}
+        
+        # Once finished, the next call with the same key runs again
+        await flight.do("a", lambda: call(3))
+        assert executions == [1, 2, 3]
+    
+    asyncio.run(run())
+    print("Identical calls coalesced")
+
+def test_errors_and_cancellation():
+    """Test that errors reach every caller and that the call outlives some but not all waiters"""
+    print("Testing errors and cancellation...")
+    
+    async def run():
+        flight = SingleFlight()
+        
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("model unavailable")
+        
+        results = await asyncio.gather(*[flight.do("a", fail) for _ in range(3)], return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        
+        finished = []
+        
+        async def slow():
+            await asyncio.sleep(0.05)
+            finished.append(True)
+            return "done"
+        
+        # Cancelling one of two waiters leaves the call running for the other
+        first = asyncio.ensure_future(flight.do("b", slow))
+        second = asyncio.ensure_future(flight.do("b", slow))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == "done" and finished == [True]
+        
+        # Cancelling every waiter cancels the call
+        only = asyncio.ensure_future(flight.do("c", slow))
+        await asyncio.sleep(0.01)
+        only.cancel()
+        await asyncio.sleep(0.1)
+        assert finished == [True]
+        assert flight.stats()["in_flight"] == 0
+    
+    asyncio.run(run())
+    print("Errors shared and cancellation handled")
+
+def test_extraction_coalescing():
+    """Test that concurrent identical extractions make one model call"""
+    print("Testing extraction coalescing...")
+    
+    calls = []
+    
+    async def handler(request):
+        calls.append(request)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={
+            "id": "msg_test",
+            "type": "message",
+            "role": "assistant",
+            "model": "test",
+            "content": [{
+                "type": "tool_use",
+                "id": "toolu_test",
+                "name": "extract_factors",
+                "input": {"factors": {"sleep_quality": 0.3}, "confidence": 0.8}
+            }],
+            "stop_reason": "tool_use",
+            "usage": {"input_tokens": 10, "output_tokens": 10}
+        })
+    
+    async def run():
+        client = AsyncAnthropic(
+            api_key="test", base_url="http://llm.test",
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        )
+        extractor = ConversationDataExtractor("test", client=client)
+        results = await asyncio.gather(*[
+            extractor.extract_data_async("user: I sleep 5 hours a night") for _ in range(20)
+        ])
+        await client.close()
+        return results
+    
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(result == {"factors": {"sleep_quality": 0.3}, "confidence": 0.8} for result in results)
+    # Each caller gets its own copy
+    assert results[0] is not results[1]
+    
+    print("Identical extractions share one model call")
+
+if __name__ == "__main__":
+    test_coalescing()
+    test_errors_and_cancellation()
+    test_extraction_coalescing()
@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import tempfile
+import subprocess
+
+# Budgets for importing the API in a fresh worker process
+MAX_IMPORT_SECONDS = float(os.environ.get("STARTUP_MAX_SECONDS", 1.5))
+MAX_RSS_MIB = float(os.environ.get("STARTUP_MAX_RSS_MIB", 100))
+
+# Modules that should only load when a network is first drawn or exported
+LAZY_MODULES = ["matplotlib", "PIL", "networkx"]
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Run in the child: import the app the way a uvicorn worker does and report the cost
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+
+def resident_mib():
+    # Current RSS where /proc exists; the peak from getrusage can include the parent's before exec
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024)
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in KiB elsewhere
+    return round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024)
+
+print(json.dumps({
+    "seconds": elapsed,
+    "rss_mib": resident_mib(),
+    "loaded": [name for name in %r if name in sys.modules]
+}))
+""" % (LAZY_MODULES,)
+
+def measure_startup(runs: int = 3):
+    """Import the app in fresh processes and return the fastest run"""
+    env = dict(os.environ, ANTHROPIC_API_KEY="startup-check", PYTHONPATH=BACKEND_DIR)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for _ in range(runs):
+            output = subprocess.run(
+                [sys.executable, "-c", PROBE], cwd=directory, env=env,
+                capture_output=True, text=True, check=True
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+    return min(results, key=lambda result: result["seconds"])
+
+def test_startup():
+    """Test that a worker imports the API within its time and memory budget"""
+    print("Testing startup cost...")
+    
+    result = measure_startup()
+    print(f"Imported in {result['seconds'] * 1000:.0f}ms, RSS {result['rss_mib']}MiB")
+    
+    assert result["loaded"] == [], f"Loaded at startup: {', '.join(result['loaded'])}"
+    assert result["seconds"] < MAX_IMPORT_SECONDS, f"Import took {result['seconds']:.2f}s"
+    if result["rss_mib"] is not None:
+        assert result["rss_mib"] < MAX_RSS_MIB, f"RSS was {result['rss_mib']:.0f}MiB"
+    
+    print("Startup within budget")
+
+if __name__ == "__main__":
+    test_startup()
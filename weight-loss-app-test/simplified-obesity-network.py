@@ -2,6 +2,10 @@ import networkx as nx
 import numpy as np
 import matplotlib.pyplot as plt
 from typing import Dict, List, Tuple
+import json
+import os
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend", "models", "obesity.json")
 
 class SimpleObesityNetwork:
     """
@@ -12,18 +16,14 @@ class SimpleObesityNetwork:
         # Initialize the directed graph
         self.G = nx.DiGraph()
         
-        # Define the 10 key factors (nodes)
+        # Factors and relationships come from the backend's model file
+        with open(MODEL_PATH) as f:
+            model = json.load(f)
+        
+        # Define the key factors (nodes)
         self.factors = {
-            "caloric_intake": {"modifiable": 10, "baseline": 0.7, "current": 0.7},
-            "physical_activity": {"modifiable": 9, "baseline": 0.5, "current": 0.5},
-            "sleep_quality": {"modifiable": 7, "baseline": 0.6, "current": 0.6},
-            "stress_level": {"modifiable": 6, "baseline": 0.6, "current": 0.6},
-            "meal_timing": {"modifiable": 8, "baseline": 0.5, "current": 0.5},
-            "metabolism": {"modifiable": 2, "baseline": 0.5, "current": 0.5},
-            "hunger_hormones": {"modifiable": 3, "baseline": 0.5, "current": 0.5},
-            "weight": {"modifiable": 0, "baseline": 0.5, "current": 0.5},  # Target node
-            "food_environment": {"modifiable": 5, "baseline": 0.6, "current": 0.6},
-            "social_support": {"modifiable": 4, "baseline": 0.4, "current": 0.4}
+            factor: {"modifiable": attrs["modifiable"], "baseline": attrs["baseline"], "current": attrs["baseline"]}
+            for factor, attrs in model["factors"].items()
         }
         
         # Add nodes to the graph
@@ -31,22 +31,7 @@ class SimpleObesityNetwork:
             self.G.add_node(factor, **attrs)
         
         # Define the relationships (edges) with weights representing strength of influence
-        self.relationships = [
-            ("caloric_intake", "weight", 0.8),
-            ("physical_activity", "weight", 0.7),
-            ("physical_activity", "metabolism", 0.5),
-            ("sleep_quality", "hunger_hormones", 0.6),
-            ("sleep_quality", "stress_level", 0.5),
-            ("stress_level", "caloric_intake", 0.4),
-            ("stress_level", "sleep_quality", 0.6),
-            ("meal_timing", "hunger_hormones", 0.5),
-            ("meal_timing", "metabolism", 0.3),
-            ("metabolism", "weight", 0.6),
-            ("hunger_hormones", "caloric_intake", 0.7),
-            ("food_environment", "caloric_intake", 0.6),
-            ("social_support", "stress_level", 0.5),
-            ("social_support", "physical_activity", 0.4)
-        ]
+        self.relationships = [(rel["from"], rel["to"], rel["weight"]) for rel in model["relationships"]]
         
         # Add edges to the graph
         for source, target, weight in self.relationships:
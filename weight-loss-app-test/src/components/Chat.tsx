@@ -10,6 +10,8 @@ export default function Chat() {
   const [messages, setMessages] = useState<Message[]>([])
   const [input, setInput] = useState('')
   const [isLoading, setIsLoading] = useState(false)
+  // The backend keeps the conversation's history under this id, so each request carries only the new message
+  const [conversationId] = useState(() => crypto.randomUUID())
 
   const handleSubmit = async (e: React.FormEvent) => {
     e.preventDefault()
@@ -19,22 +21,57 @@ export default function Chat() {
     const userMessage = input.trim()
     setInput('')
 
+    // Show the message right away and fill in the reply as it streams
+    setMessages(prev => [...prev, {
+      timestamp: new Date(),
+      message: userMessage,
+      response: ''
+    }])
+    const appendToReply = (text: string) => {
+      setMessages(prev => {
+        const last = prev[prev.length - 1]
+        return [...prev.slice(0, -1), { ...last, response: last.response + text }]
+      })
+    }
+
     try {
       const response = await fetch('/api/chat', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json'
         },
-        body: JSON.stringify({ message: userMessage })
+        body: JSON.stringify({
+          message: userMessage,
+          conversation_id: conversationId
+        })
       })
+      if (!response.ok || !response.body) {
+        throw new Error(`Chat request failed with status ${response.status}`)
+      }
 
-      const data = await response.json()
-      
-      setMessages(prev => [...prev, {
-        timestamp: new Date(),
-        message: userMessage,
-        response: data.response
-      }])
+      // Read Server-Sent Events; events are separated by a blank line
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ''
+      while (true) {
+        const { done, value } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+
+        let boundary
+        while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+          const block = buffer.slice(0, boundary)
+          buffer = buffer.slice(boundary + 2)
+          const event = block.match(/^event: (.*)$/m)?.[1]
+          const data = block.match(/^data: (.*)$/m)?.[1]
+          if (event === 'token' && data) {
+            setIsLoading(false)
+            appendToReply(JSON.parse(data).text)
+          } else if (event === 'error') {
+            throw new Error('Chat stream failed')
+          }
+        }
+      }
     } catch (error) {
       console.error('Error sending message:', error)
     } finally {